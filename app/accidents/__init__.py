@@ -0,0 +1,6 @@
+"""Briques réutilisables du projet Accidents routiers (chargement, modèles, prédiction).
+
+Le dossier ``app/`` est ajouté au ``sys.path`` par Streamlit : les pages importent
+donc directement ``accidents.<module>``. Pour les scripts en ligne de commande,
+lancer depuis la racine du dépôt avec ``PYTHONPATH=app python -m accidents.<module>``.
+"""
@@ -0,0 +1,195 @@
+"""Agrégation par accident en une passe, à partir d'une spécification déclarative.
+
+Les notebooks construisaient les variables par accident par une suite de
+``groupby('Num_Acc')`` (chocs, sexe, piéton, place, trajet, âge, gravité) dont chaque
+résultat était fusionné (``merge``) au précédent. Ici la clé est regroupée une seule
+fois (tri stable, ou rien si la table est déjà triée par ``Num_Acc`` comme les
+partitions de ``accidents.store``), puis chaque colonne est réduite par
+``ufunc.reduceat`` sur les bornes des groupes.
+
+Spécification : ``{nom_sortie: (colonne, operation)}``, comme les agrégations nommées
+de pandas. Opérations : ``sum``, ``max``, ``min``, ``any``, ``first`` (première ligne
+du groupe, manquants compris), ``count`` (lignes) et ``nunique`` (manquants exclus).
+
+Comparaison avec la chaîne groupby + merge : ``PYTHONPATH=app python -m accidents.aggregate [--scale N]``
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+OPERATIONS = ("sum", "max", "min", "any", "first", "count", "nunique")
+
+
+class Groups:
+    """Regroupement d'une clé : ordre de tri, début de chaque groupe, clés uniques triées."""
+
+    def __init__(self, keys):
+        keys = np.asarray(keys)
+        self.n_rows = len(keys)
+        if self.n_rows and np.all(keys[1:] >= keys[:-1]):
+            self.order = None   # déjà triée : aucun tri ni copie
+            sk = keys
+        else:
+            self.order = np.argsort(keys, kind="stable")
+            sk = keys[self.order]
+        if self.n_rows:
+            self.starts = np.flatnonzero(np.r_[True, sk[1:] != sk[:-1]])
+        else:
+            self.starts = np.empty(0, dtype=np.intp)
+        self.keys = sk[self.starts]
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def sizes(self):
+        return np.diff(np.r_[self.starts, self.n_rows])
+
+    def sorted_values(self, col):
+        """Valeurs de la colonne dans l'ordre des groupes (float64 + NaN si manquants)."""
+        if isinstance(col, pd.Series):
+            col = col.to_numpy(dtype=np.float64, na_value=np.nan) if col.hasnans else col.to_numpy()
+        col = np.asarray(col)
+        return col if self.order is None else col[self.order]
+
+    def take_first(self, col):
+        """Première ligne de chaque groupe, type d'origine conservé (Int8, category, ...)."""
+        idx = self.starts if self.order is None else self.order[self.starts]
+        if isinstance(col, pd.Series):
+            return col.array.take(idx)
+        return np.asarray(col)[idx]
+
+    def reduce(self, col, how):
+        if how not in OPERATIONS:
+            raise ValueError(f"Opération inconnue : {how} (attendu : {', '.join(OPERATIONS)})")
+        if how == "first":
+            return self.take_first(col)
+        if how == "count":
+            return self.sizes
+        if len(self) == 0:
+            return np.empty(0)
+        if how == "nunique":
+            return self._nunique(col)
+        v = self.sorted_values(col)
+        if how == "any":
+            return np.logical_or.reduceat(np.nan_to_num(v).astype(bool), self.starts)
+        if how == "sum":
+            if v.dtype.kind == "f":
+                return np.add.reduceat(np.nan_to_num(v), self.starts)
+            return np.add.reduceat(v, self.starts, dtype=np.int64)
+        ufunc = np.fmax if how == "max" else np.fmin   # fmax / fmin ignorent les NaN
+        return ufunc.reduceat(v, self.starts)
+
+    def _nunique(self, col):
+        codes, uniques = pd.factorize(col)
+        if self.order is not None:
+            codes = codes[self.order]
+        gid = np.repeat(np.arange(len(self)), self.sizes)
+        ok = codes >= 0
+        pairs = pd.unique(gid[ok] * (len(uniques) + 1) + codes[ok])   # hachage int64, sans tri
+        return np.bincount(pairs // (len(uniques) + 1), minlength=len(self))
+
+
+def aggregate(df, key, spec, groups=None):
+    """Une ligne par valeur de ``key`` avec les colonnes décrites par ``spec``.
+
+    ``groups`` : regroupement déjà calculé sur ``df[key]`` (réutilisé entre deux specs
+    portant sur la même table). Le résultat est trié par ``key``. Seul ``count`` accepte
+    une colonne absente de ``df`` ; sinon ``KeyError``.
+    """
+    groups = Groups(df[key].to_numpy()) if groups is None else groups
+    out = {key: groups.keys}
+    for name, (col, how) in spec.items():
+        if col not in df and how != "count":
+            raise KeyError(col)
+        out[name] = groups.reduce(df[col] if col in df else None, how)
+    return pd.DataFrame(out)
+
+
+# -- Comparaison avec la chaîne des notebooks --------------------------------------
+def _flags_frame(usagers):
+    from .encoding import (AGE_LABELS, PLACE_LABELS, TRAJET_LABELS, age_codes, correct_year,
+                           indicators, place_codes, trajet_codes)
+    from .pipeline import GRAV_SIMPL
+
+    age = usagers["annee"].to_numpy() - correct_year(usagers["an_nais"]).to_numpy(dtype=np.float64, na_value=np.nan)
+    flags = {
+        "Homme": (usagers["sexe"] == 1).astype(np.int8),
+        "Femme": (usagers["sexe"] == 2).astype(np.int8),
+        "pieton": (usagers["catu"] == 3).astype(np.int8),
+        **indicators(place_codes(usagers["place"]), PLACE_LABELS),
+        **indicators(trajet_codes(usagers["trajet"]), TRAJET_LABELS),
+        **indicators(age_codes(age), AGE_LABELS),
+    }
+    work = pd.DataFrame({k: np.asarray(v) for k, v in flags.items()})
+    work["Num_Acc"] = usagers["Num_Acc"].to_numpy()
+    work["grav_order"] = usagers["grav"].map(GRAV_SIMPL).to_numpy()
+    work["num_veh"] = usagers["num_veh"].to_numpy()
+    return work
+
+
+BENCH_SPEC = {
+    "grav_order_max": ("grav_order", "max"),
+    "nb_veh": ("num_veh", "nunique"),
+    "pieton": ("pieton", "max"),
+    **{c: (c, "sum") for c in ("Homme", "Femme", "Conducteur", "Avant", "Arrière", "Autre",
+                              "Inconnu", "Travail", "Professionnel", "Loisirs",
+                              "Enfant", "Jeune", "Adulte", "Senior")},
+}
+
+
+def chain_reference(work):
+    """Un groupby par famille de variables, fusionnés un à un (comme dans les notebooks)."""
+    acc = work.groupby("Num_Acc").agg(grav_order_max=("grav_order", "max")).reset_index()
+    nb_veh = work.groupby("Num_Acc")["num_veh"].nunique().reset_index(name="nb_veh")
+    acc = acc.merge(nb_veh, on="Num_Acc", how="left")
+    pieton = work.groupby("Num_Acc", as_index=False)["pieton"].max()
+    acc = acc.merge(pieton, on="Num_Acc", how="left")
+    for family in (["Homme", "Femme"], ["Conducteur", "Avant", "Arrière", "Autre"],
+                   ["Inconnu", "Travail", "Professionnel", "Loisirs"], ["Enfant", "Jeune", "Adulte", "Senior"]):
+        part = work.groupby("Num_Acc", as_index=False)[family].sum()
+        acc = acc.merge(part, on="Num_Acc", how="left")
+    return acc
+
+
+def bench(work, repeat=3):
+    """Durées (s) de la chaîne groupby + merge et de l'agrégation en une passe."""
+    def best(f):
+        t = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            res = f()
+            t = min(t, time.perf_counter() - t0)
+        return t, res
+
+    t_ref, ref = best(lambda: chain_reference(work))
+    t_new, new = best(lambda: aggregate(work, "Num_Acc", BENCH_SPEC))
+    cols = list(ref.columns)
+    same = ref[cols].astype("float64").equals(new[cols].astype("float64"))
+    return {"lignes": len(work), "accidents": len(new), "identique": same,
+            "chaine_s": round(t_ref, 4), "une_passe_s": round(t_new, 4),
+            "acceleration": round(t_ref / t_new, 1)}
+
+
+def main(argv=None):
+    from .store import read_table
+
+    parser = argparse.ArgumentParser(description="Agrégation en une passe vs chaîne groupby + merge.")
+    parser.add_argument("--scale", type=int, default=1, help="répète la table usagers N fois (Num_Acc décalés)")
+    args = parser.parse_args(argv)
+    usagers = read_table("usagers", columns=["Num_Acc", "num_veh", "place", "catu", "grav", "sexe", "trajet", "an_nais"])
+    work = _flags_frame(usagers)
+    if args.scale > 1:
+        step = int(work["Num_Acc"].max()) + 1
+        work = pd.concat([work.assign(Num_Acc=work["Num_Acc"] + i * step) for i in range(args.scale)],
+                         ignore_index=True)
+    res = bench(work)
+    print(pd.Series(res).to_string())
+    if not res["identique"]:
+        raise SystemExit("Écart entre la chaîne groupby + merge et l'agrégation en une passe")
+
+
+if __name__ == "__main__":
+    main()
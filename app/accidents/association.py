@@ -0,0 +1,193 @@
+"""Matrice d'association chi² / V de Cramér entre variables catégorielles.
+
+Les notebooks bouclaient sur ``vars_to_test`` avec ``pd.crosstab`` puis
+``chi2_contingency`` pour chaque couple. Ici chaque colonne est factorisée une seule
+fois en codes entiers ; la table de contingence d'un couple est un ``np.bincount``
+sur ``code_a * n_b + code_b``. Les couples sont répartis entre processus par lots
+(``joblib``), les codes étant partagés par memmap.
+
+Comme ``pd.crosstab``, les lignes où l'une des deux variables manque sont ignorées ;
+comme ``chi2_contingency``, la correction de Yates s'applique aux tables 2x2
+(``yates=False`` pour la désactiver). ``bias_correction=True`` donne le V de Cramér
+corrigé du biais (Bergsma, 2013), la troisième variante des notebooks.
+
+``N_JOBS`` (variable ``ACCIDENTS_N_JOBS``, ``-1`` par défaut = tous les cœurs) est le
+nombre de processus utilisé par la vue en direct de l'onglet Dataviz.
+
+Ligne de commande : ``PYTHONPATH=app python -m accidents.association [--target grav_order_max]``
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy.stats import chi2 as chi2_dist
+
+MAX_LEVELS = 50
+N_JOBS = int(os.environ.get("ACCIDENTS_N_JOBS", -1))
+EXCLUDED = ("Num_Acc", "com")
+
+
+def categorical_columns(df, max_levels=MAX_LEVELS, exclude=EXCLUDED):
+    """Colonnes traitées comme catégorielles : au plus ``max_levels`` modalités."""
+    return [c for c in df.columns if c not in exclude and df[c].nunique(dropna=True) <= max_levels]
+
+
+def factorize_columns(df, columns):
+    """Codes int32 (N x p, -1 = manquant) et nombre de modalités de chaque colonne."""
+    codes = np.empty((len(df), len(columns)), dtype=np.int32, order="F")
+    levels = np.empty(len(columns), dtype=np.int64)
+    for j, c in enumerate(columns):
+        codes[:, j], uniques = pd.factorize(df[c], sort=True)
+        levels[j] = len(uniques)
+    return codes, levels
+
+
+def contingency(a, b, na, nb):
+    """Table de contingence observée (modalités absentes retirées)."""
+    ok = (a >= 0) & (b >= 0)
+    table = np.bincount(a[ok].astype(np.int64) * nb + b[ok], minlength=na * nb).reshape(na, nb)
+    return table[table.any(axis=1)][:, table.any(axis=0)]
+
+
+def chi2_test(table, yates=True):
+    """(chi², ddl, p-value) comme ``scipy.stats.chi2_contingency``."""
+    n = table.sum()
+    r, k = table.shape
+    dof = (r - 1) * (k - 1)
+    if n == 0 or dof == 0:
+        return 0.0, dof, 1.0
+    observed = table.astype(np.float64)
+    expected = np.outer(observed.sum(axis=1), observed.sum(axis=0)) / n
+    if dof == 1 and yates:
+        diff = expected - observed
+        observed = observed + np.minimum(0.5, np.abs(diff)) * np.sign(diff)
+    stat = float(((observed - expected) ** 2 / expected).sum())
+    return stat, dof, float(chi2_dist.sf(stat, dof))
+
+
+def cramers_v(stat, n, r, k, bias_correction=False):
+    if n <= 1 or min(r, k) < 2:
+        return 0.0
+    phi2 = stat / n
+    if not bias_correction:
+        return float(np.sqrt(phi2 / (min(r, k) - 1)))
+    phi2 = max(0.0, phi2 - (k - 1) * (r - 1) / (n - 1))
+    rc = r - (r - 1) ** 2 / (n - 1)
+    kc = k - (k - 1) ** 2 / (n - 1)
+    denom = min(kc - 1, rc - 1)
+    return float(np.sqrt(phi2 / denom)) if denom > 0 else 0.0
+
+
+def _pair_stats(codes, levels, pairs, yates, bias_correction):
+    rows = []
+    for i, j in pairs:
+        table = contingency(codes[:, i], codes[:, j], levels[i], levels[j])
+        stat, dof, p = chi2_test(table, yates)
+        n = int(table.sum())
+        rows.append((i, j, stat, dof, p, n, cramers_v(stat, n, *table.shape, bias_correction)))
+    return rows
+
+
+def association(df, columns=None, target=None, bias_correction=False, yates=True, n_jobs=1):
+    """Chi², ddl, p-value et V de Cramér pour chaque couple de colonnes.
+
+    ``target`` : ne calcule que les couples (target, colonne). ``n_jobs`` : processus
+    (``-1`` = tous les cœurs) ; les couples sont répartis en un lot par processus.
+    Renvoie un DataFrame long (``var1``, ``var2``, ``chi2``, ``ddl``, ``p_value``, ``n``,
+    ``cramers_v``).
+    """
+    columns = list(categorical_columns(df) if columns is None else columns)
+    if target is not None and target not in columns:
+        columns.append(target)
+    codes, levels = factorize_columns(df, columns)
+    if target is None:
+        pairs = [(i, j) for i in range(len(columns)) for j in range(i + 1, len(columns))]
+    else:
+        t = columns.index(target)
+        pairs = [(t, j) for j in range(len(columns)) if j != t]
+
+    if n_jobs == 1 or len(pairs) < 2:
+        rows = _pair_stats(codes, levels, pairs, yates, bias_correction)
+    else:
+        n_workers = Parallel(n_jobs=n_jobs)._effective_n_jobs()
+        batches = [pairs[w::n_workers] for w in range(n_workers) if pairs[w::n_workers]]
+        parts = Parallel(n_jobs=n_jobs, max_nbytes="1M")(
+            delayed(_pair_stats)(codes, levels, b, yates, bias_correction) for b in batches)
+        rows = [r for part in parts for r in part]
+
+    out = pd.DataFrame(rows, columns=["i", "j", "chi2", "ddl", "p_value", "n", "cramers_v"])
+    out.insert(0, "var1", [columns[i] for i in out["i"]])
+    out.insert(1, "var2", [columns[j] for j in out["j"]])
+    return out.drop(columns=["i", "j"]).sort_values(["var1", "var2"], ignore_index=True)
+
+
+def to_matrix(result, value="cramers_v"):
+    """Matrice symétrique (diagonale à 1 pour le V de Cramér) à partir du résultat long."""
+    names = sorted(set(result["var1"]) | set(result["var2"]))
+    pos = {n: i for i, n in enumerate(names)}
+    i = result["var1"].map(pos).to_numpy()
+    j = result["var2"].map(pos).to_numpy()
+    m = np.full((len(names), len(names)), np.nan)
+    m[i, j] = m[j, i] = result[value].to_numpy()
+    if value == "cramers_v":
+        np.fill_diagonal(m, 1.0)
+    return pd.DataFrame(m, index=names, columns=names)
+
+
+def with_target(result, target, value="cramers_v"):
+    """Association de chaque variable avec ``target``, triée par valeur décroissante."""
+    r = result[(result["var1"] == target) | (result["var2"] == target)].copy()
+    r["variable"] = np.where(r["var1"] == target, r["var2"], r["var1"])
+    return r.drop(columns=["var1", "var2"]).sort_values(value, ascending=False, ignore_index=True)
+
+
+# -- Référence : boucle crosstab + chi2_contingency (notebooks) ---------------------
+def reference_loop(df, columns, target, bias_correction=False):
+    from scipy.stats import chi2_contingency
+
+    rows = []
+    for c in columns:
+        if c == target:
+            continue
+        table = pd.crosstab(df[target], df[c])
+        stat, p, dof, _ = chi2_contingency(table)
+        n = table.to_numpy().sum()
+        rows.append({"variable": c, "chi2": stat, "p_value": p,
+                     "cramers_v": cramers_v(stat, n, *table.shape, bias_correction)})
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    from .cube import read_source
+
+    parser = argparse.ArgumentParser(description="Matrice chi² / V de Cramér de la table par accident.")
+    parser.add_argument("--source", choices=("auto", "features", "mini"), default="auto")
+    parser.add_argument("--target", help="ne calcule que les couples avec cette variable")
+    parser.add_argument("--bias-correction", action="store_true")
+    parser.add_argument("--n-jobs", type=int, default=N_JOBS)
+    parser.add_argument("--output", help="CSV où écrire le résultat long")
+    args = parser.parse_args(argv)
+
+    df = read_source(args.source)
+    columns = categorical_columns(df)
+    t0 = time.perf_counter()
+    res = association(df, columns, target=args.target, bias_correction=args.bias_correction, n_jobs=args.n_jobs)
+    elapsed = time.perf_counter() - t0
+    print(f"{len(res)} couples sur {len(df)} lignes en {elapsed:.2f} s")
+    if args.target:
+        top = with_target(res, args.target)
+        t0 = time.perf_counter()
+        ref = reference_loop(df, columns, args.target, args.bias_correction).set_index("variable")
+        t_ref = time.perf_counter() - t0
+        ecart = (top.set_index("variable")["cramers_v"] - ref["cramers_v"]).abs().max()
+        print(top.head(15).to_string(index=False))
+        print(f"Boucle crosstab + chi2_contingency : {t_ref:.2f} s ; écart max du V de Cramér : {ecart:.2e}")
+    if args.output:
+        res.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""Banc d'essai de bout en bout : chargement -> fusion -> encodage -> entraînement -> prédiction.
+
+Chaque étape est exécutée dans un processus neuf (comme les candidats de
+``accidents.train``). Sa préparation (lecture des entrées, mise à l'échelle) n'est pas
+comptée. L'étape est lancée deux fois : une première fois pour le pic d'allocation
+(ce passage sert aussi d'échauffement : imports paresseux, cache disque), une seconde
+fois sans traçage pour la durée, ``tracemalloc`` ralentissant fortement le code qui
+alloue beaucoup. Le pic d'allocation ``pic_mo`` additionne ``pic_python_mo``
+(``tracemalloc`` : objets Python et tableaux numpy) et ``pic_arrow_mo`` (pool mémoire
+de pyarrow, que ``tracemalloc`` ne voit pas : lectures et écritures Parquet, colonnes
+texte de pandas 3). Le pic RSS du processus couvre les deux passages :
+
+- ``chargement_<table>`` : CSV annuels -> Parquet typé (``store.ingest``) puis
+  ``read_table``, pour chacune des quatre tables ;
+- ``agregations`` : usagers et véhicules réduits à une ligne par accident ;
+- ``fusion`` : table par accident complète (``pipeline.build_features`` : lecture,
+  agrégations, jointures, encodage, écriture) ;
+- ``ohe_standardisation`` : ``OneHotEncoder`` + ``StandardScaler`` (mode ``dense``
+  de ``accidents.preprocessing``) ;
+- ``smote`` : SMOTE partitionné puis RUS, cibles du notebook (``accidents.rebalance``) ;
+- ``fit`` : ajustement du modèle (``--model``, candidats de ``accidents.train``) ;
+- ``prediction_1_ligne`` (médiane de ``SINGLE_CALLS`` appels) et ``prediction_lot``
+  (jeu de test entier).
+
+Mise à l'échelle (``--scales 1 10 100``) : les CSV sources sont des tables générées
+par ``accidents.synth`` dans un dossier temporaire, ``k`` fois plus d'accidents que
+l'échantillon de chaque année, avec les cardinalités réelles et des clés cohérentes :
+la fusion porte sur tous les accidents. Les étapes de modélisation utilisent le jeu
+matérialisé par ``accidents.train``, répété ``k`` fois avec un léger bruit
+(``rebalance.scaled``).
+
+``--sources copies`` recopie plutôt ``k`` fois les CSV ``sample_*_<annee>.csv`` (avec
+des ``Num_Acc`` décalés). Les échantillons des quatre tables étant tirés
+indépendamment, seuls quelques accidents survivent alors à la jointure (7 à l'échelle
+1) : la fusion ne mesure presque rien, seules les étapes de chargement et
+d'agrégation portent sur toutes les lignes.
+
+Chaque exécution ajoute une ligne par échelle à ``reports/bench_history.jsonl``
+(commit, date, machine, mesures par étape). ``--check`` compare aux mesures du dernier
+commit précédent de même échelle et échoue (code 1) au-delà de ``--tolerance``.
+
+Ligne de commande : ``PYTHONPATH=app python -m accidents.bench [--scales 1 10 100] [--check]``
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .config import DATA_DIR, REPORTS_DIR, ROOT_DIR
+from .store import TABLES
+
+HISTORY_FILE = REPORTS_DIR / "bench_history.jsonl"
+STAGES = (*(f"chargement_{t}" for t in TABLES), "agregations", "fusion", "ohe_standardisation", "smote", "fit",
+          "prediction_1_ligne", "prediction_lot")
+SCALES = (1, 10, 100)
+SINGLE_CALLS = 200
+NUM_ACC_STEP = 10 ** 12   # Num_Acc sur 12 chiffres : chaque copie reçoit sa propre plage
+TOLERANCE = 0.30
+SLACK_S = 0.05
+ARROW_SAMPLE_S = 0.005   # période de relevé du pool Arrow pendant le passage tracé
+SOURCES = ("synthetiques", "copies")
+
+
+# -- Données mises à l'échelle -----------------------------------------------------
+def upscale_sources(scale, out_dir, data_dir=DATA_DIR, sources="synthetiques"):
+    """Écrit les CSV annuels mis à l'échelle dans ``out_dir`` ; renvoie le nombre de lignes.
+
+    ``sources="synthetiques"`` : tables générées par ``accidents.synth``, ``scale`` fois
+    le nombre d'accidents de l'échantillon de chaque année. ``"copies"`` : échantillons
+    répétés ``scale`` fois.
+    """
+    from .schema import ENCODING
+    from .store import discover_annees, read_source_csv, source_path
+
+    if sources == "synthetiques":
+        from . import synth
+
+        profile = synth.Profile.fit(data_dir)
+        per_year = {a: scale * len(read_source_csv("caracteristiques", a, data_dir)) for a in profile.annees}
+        return sum(synth.generate(profile, out_dir, per_year).values())
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rows = 0
+    for annee in discover_annees(data_dir=data_dir, store_dir=out_dir / "store"):
+        for table in TABLES:
+            if not source_path(table, annee, data_dir).exists():
+                continue
+            df = read_source_csv(table, annee, data_dir)
+            copies = [df.assign(Num_Acc=df["Num_Acc"] + i * NUM_ACC_STEP) for i in range(scale)]
+            out = pd.concat(copies, ignore_index=True)
+            out.to_csv(out_dir / f"sample_{table}_{annee}.csv", index=False, encoding=ENCODING)
+            rows += len(out)
+    return rows
+
+
+def scaled_split(scale, part, seed=42, noise=True):
+    """X / y du jeu matérialisé (``accidents.train``) répétés ``scale`` fois.
+
+    ``noise=False`` : copies exactes, pour l'OHE (un code bruité serait une nouvelle modalité).
+    """
+    from .rebalance import scaled
+    from .train import TRAIN_DIR, load_split
+
+    X, y = load_split(TRAIN_DIR, part)
+    if not noise:
+        return np.tile(np.asarray(X), (scale, 1)), np.tile(np.asarray(y), scale)
+    return scaled(X, y, scale, seed)
+
+
+# -- Étapes (exécutées dans un processus dédié) -------------------------------------
+def _setup(stage, scale, work, model):
+    """Prépare les entrées de l'étape et renvoie la fonction à chronométrer."""
+    data_dir, store_dir = work / "data", work / "data" / "store"
+    if stage.startswith("chargement_"):
+        from .store import ingest, read_table
+
+        table = stage.split("_", 1)[1]
+
+        def run():
+            ingest((table,), force=True, data_dir=data_dir, store_dir=store_dir)
+            return len(read_table(table, ensure=False, data_dir=data_dir, store_dir=store_dir))
+        return run
+    if stage == "agregations":
+        from .pipeline import USAGERS_COLS, VEHICULES_COLS, aggregate_usagers, aggregate_vehicules
+        from .store import discover_annees, read_table
+
+        annees = discover_annees(data_dir=data_dir, store_dir=store_dir)
+        u = read_table("usagers", USAGERS_COLS, annees, ensure=False, data_dir=data_dir, store_dir=store_dir)
+        v = read_table("vehicules", VEHICULES_COLS, annees, ensure=False, data_dir=data_dir, store_dir=store_dir)
+        by_year = [(a, u[u["annee"] == a], v[v["annee"] == a]) for a in annees]
+
+        def run():
+            return sum(len(aggregate_usagers(ua, a)) + len(aggregate_vehicules(va)) for a, ua, va in by_year)
+        return run
+    if stage == "fusion":
+        from .pipeline import build_features
+
+        def run():
+            summary = build_features(None, out_dir=work / "features", store_dir=store_dir, force=True,
+                                     data_dir=data_dir)
+            return sum(summary["rows"].values())
+        return run
+
+    from .train import TRAIN_DIR, make_candidate
+
+    columns = json.loads((TRAIN_DIR / "meta.json").read_text(encoding="utf-8"))["columns"]
+    model_path = work / f"{model}_x{scale}.joblib"
+    if stage == "ohe_standardisation":
+        from .preprocessing import make_encoder
+
+        X, _ = scaled_split(scale, "train", noise=False)
+
+        def run():
+            return make_encoder(columns, "dense").fit_transform(X).shape[0]
+        return run
+    if stage == "smote":
+        from .rebalance import make_resampler
+
+        X, y = scaled_split(scale, "train")
+
+        def run():
+            return len(make_resampler("partitioned", y).fit_resample(X, y)[1])
+        return run
+    if stage == "fit":
+        import joblib
+
+        X, y = scaled_split(scale, "train")
+
+        def run():
+            estimator = make_candidate(model, y).fit(X, y)
+            joblib.dump(estimator, model_path)   # repris par les étapes de prédiction
+            return len(y)
+        return run
+    if stage.startswith("prediction_"):
+        import joblib
+
+        if not model_path.exists():
+            raise FileNotFoundError(f"{model_path.name} absent : l'étape fit doit précéder la prédiction")
+        estimator = joblib.load(model_path)
+        Xt, _ = scaled_split(scale, "test")
+        if stage == "prediction_lot":
+            return lambda: len(estimator.predict(Xt))
+        rows = [Xt[i:i + 1] for i in range(min(SINGLE_CALLS, len(Xt)))]
+
+        def run():
+            times = []
+            for row in rows:
+                t0 = time.perf_counter()
+                estimator.predict(row)
+                times.append(time.perf_counter() - t0)
+            return {"lignes": len(rows), "secondes": float(np.median(times))}
+        return run
+    raise ValueError(f"Étape inconnue : {stage} (attendu : {', '.join(STAGES)})")
+
+
+def peak_allocations(run):
+    """Exécute ``run`` ; pics (octets) des allocations Python/numpy et Arrow au-delà de l'état initial.
+
+    Le maximum du pool Arrow ne se remet pas à zéro : s'il est dépassé pendant le
+    passage, il donne le pic exact, sinon on garde le plus haut relevé toutes les
+    ``ARROW_SAMPLE_S`` secondes.
+    """
+    import pyarrow as pa
+
+    pool = pa.default_memory_pool()
+    base, high = pool.bytes_allocated(), pool.max_memory()
+    sampled, done = [0], threading.Event()
+
+    def sample():
+        while not done.wait(ARROW_SAMPLE_S):
+            sampled[0] = max(sampled[0], pool.bytes_allocated() - base)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    tracemalloc.start()
+    sampler.start()
+    try:
+        run()
+        _, python_peak = tracemalloc.get_traced_memory()
+    finally:
+        done.set()
+        sampler.join()
+        tracemalloc.stop()
+    if pool.max_memory() > high:
+        arrow_peak = pool.max_memory() - base
+    else:
+        arrow_peak = max(sampled[0], pool.bytes_allocated() - base, 0)
+    return python_peak, arrow_peak
+
+
+def run_stage(stage, scale, work, model="hgb"):
+    """Prépare puis chronomètre une étape ; mesures de durée et de mémoire."""
+    work = Path(work)
+    run = _setup(stage, scale, work, model)
+    rss_base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    python_peak, arrow_peak = peak_allocations(run)
+    t0 = time.perf_counter()
+    out = run()
+    seconds = time.perf_counter() - t0
+    if isinstance(out, dict):   # prédiction ligne à ligne : durée médiane d'un appel
+        seconds, out = out["secondes"], out["lignes"]
+    return {
+        "etape": stage, "lignes": int(out), "secondes": round(seconds, 4),
+        "pic_mo": round((python_peak + arrow_peak) / 2 ** 20, 1),
+        "pic_python_mo": round(python_peak / 2 ** 20, 1),
+        "pic_arrow_mo": round(arrow_peak / 2 ** 20, 1),
+        "rss_base_mo": round(rss_base, 1),
+        "rss_pic_mo": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def bench(scale, stages=STAGES, model="hgb", workdir=None, keep=False, sources="synthetiques"):
+    """Toutes les étapes à une échelle ; chacune dans un processus neuf."""
+    from .train import TRAIN_DIR, materialize
+
+    if not (TRAIN_DIR / "meta.json").exists():
+        materialize()
+    work = Path(tempfile.mkdtemp(prefix=f"accidents-bench-x{scale}-", dir=workdir))
+    try:
+        t0 = time.perf_counter()
+        n = upscale_sources(scale, work / "data", sources=sources)
+        print(f"x{scale} : {n} lignes sources écrites dans {work} ({time.perf_counter() - t0:.1f} s, non compté)")
+        results = []
+        ctx = get_context("spawn")
+        for stage in stages:
+            row = {"etape": stage}
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                try:
+                    row.update(pool.submit(run_stage, stage, scale, work, model).result(), status="ok")
+                except MemoryError:
+                    row["status"] = "memoire"
+                except BrokenProcessPool:
+                    row["status"] = "interrompu"   # processus tué (OOM killer, signal)
+                except Exception as exc:   # une étape en échec n'arrête pas la série
+                    row["status"] = f"erreur : {type(exc).__name__}: {exc}"
+            results.append(row)
+            if row["status"] == "ok":
+                print(f"x{scale} {stage:>22} {row['secondes']:>9.4f} s  {row['lignes']:>9} lignes  "
+                      f"pic {row['pic_mo']} Mo (Arrow {row['pic_arrow_mo']})  RSS {row['rss_pic_mo']} Mo")
+            else:
+                print(f"x{scale} {stage:>22} {row['status']}")
+        return results
+    finally:
+        if not keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+# -- Historique --------------------------------------------------------------------
+def git_state(root=ROOT_DIR):
+    """``(commit, modifications non validées)`` ; ``(None, None)`` hors dépôt git."""
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True,
+                             check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                               capture_output=True, text=True, check=True).stdout.strip() != ""
+        return sha, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def load_history(path=HISTORY_FILE):
+    path = Path(path)
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+
+def append_history(entry, path=HISTORY_FILE):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def reference(history, entry):
+    """Dernière mesure d'un autre commit, à la même échelle, avec le même modèle et les mêmes sources."""
+    for old in reversed(history):
+        if (old["scale"] == entry["scale"] and old["model"] == entry["model"] and old["commit"] != entry["commit"]
+                and old.get("sources", "copies") == entry["sources"]):
+            return old
+    return None
+
+
+def regressions(entry, ref, tolerance=TOLERANCE, slack_s=SLACK_S):
+    """Étapes plus lentes que la référence au-delà de la tolérance."""
+    before = {r["etape"]: r for r in ref["stages"]}
+    out = []
+    for row in entry["stages"]:
+        old = before.get(row["etape"])
+        if old is None or old.get("status") != "ok":
+            continue
+        if row["status"] != "ok":
+            out.append(f"x{entry['scale']} {row['etape']} : {row['status']} (commit {ref['commit']} : ok)")
+            continue
+        limit = old["secondes"] * (1 + tolerance) + slack_s
+        if row["secondes"] > limit:
+            out.append(f"x{entry['scale']} {row['etape']} : {row['secondes']:.3f} s > {limit:.3f} s "
+                       f"(commit {ref['commit']} : {old['secondes']:.3f} s)")
+    return out
+
+
+def main(argv=None):
+    from .train import CANDIDATES
+
+    parser = argparse.ArgumentParser(description="Durée et mémoire de chaque étape, de la lecture à la prédiction.")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(SCALES), help="facteurs de mise à l'échelle")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--model", default="hgb", choices=CANDIDATES)
+    parser.add_argument("--workdir", help="dossier des données temporaires (défaut : dossier temporaire système)")
+    parser.add_argument("--keep", action="store_true", help="conserve les données mises à l'échelle")
+    parser.add_argument("--sources", default="synthetiques", choices=SOURCES,
+                        help="CSV mis à l'échelle : tables synthétiques ou copies des échantillons")
+    parser.add_argument("--history", type=Path, default=HISTORY_FILE)
+    parser.add_argument("--no-history", action="store_true", help="n'ajoute pas les mesures à l'historique")
+    parser.add_argument("--check", action="store_true", help="code 1 si une étape régresse par rapport au commit précédent")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    commit, dirty = git_state()
+    history = load_history(args.history)
+    found = []
+    for scale in args.scales:
+        entry = {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"), "commit": commit, "dirty": dirty,
+            "python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+            "scale": scale, "model": args.model, "sources": args.sources,
+            "stages": bench(scale, args.stages, args.model, args.workdir, args.keep, args.sources),
+        }
+        ref = reference(history, entry)
+        table = pd.DataFrame(entry["stages"]).set_index("etape")
+        if ref is not None:
+            before = {r["etape"]: r.get("secondes") for r in ref["stages"]}
+            table.insert(1, f"ref_{ref['commit']}", [before.get(s) for s in table.index])
+            found += regressions(entry, ref, args.tolerance)
+        print(table.to_string())
+        if not args.no_history:
+            append_history(entry, args.history)
+            history.append(entry)
+    if not args.no_history:
+        print(f"Historique -> {args.history}")
+    for line in found:
+        print(f"RÉGRESSION {line}")
+    if args.check and found:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
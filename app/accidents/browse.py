@@ -0,0 +1,222 @@
+"""Consultation des tables côté serveur : filtre, tri, projection et pagination en Arrow.
+
+Les tables complètes ne quittent pas le serveur : ``query`` travaille sur une vue
+``pyarrow.Table`` (``accidents.shared``) et ne convertit en DataFrame que la page
+demandée, restreinte aux colonnes affichées. Seules les colonnes filtrées ou triées
+sont parcourues en entier (masque booléen, puis indices de tri de la seule colonne de
+tri) ; les autres ne sont lues que pour les ``page_size`` lignes de la page.
+
+Les filtres suivent la convention de ``accidents.cube.filter_cube`` :
+``annee=(2010, 2018)`` (bornes incluses), ``lum=[1, 2]`` (valeurs), plus
+``adr="avenue"`` (sous-chaîne, sans tenir compte de la casse).
+
+``summary`` remplace ``DataFrame.info()`` sans conversion : les comptes de valeurs
+non nulles et les tailles viennent des métadonnées Arrow.
+
+Contrôle d'équivalence avec pandas et mesures :
+``PYTHONPATH=app python -m accidents.browse [--accidents 200000]``
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .tracing import traced
+
+PAGE_SIZES = (25, 50, 100)
+MAX_CHOICES = 200   # au-delà, filtre par intervalle ou sous-chaîne plutôt que par liste
+
+
+def _plain(col):
+    """Colonne décodée si elle est codée par dictionnaire (colonnes category)."""
+    if pa.types.is_dictionary(col.type):
+        return col.cast(col.type.value_type)
+    return col
+
+
+def _condition(col, val):
+    col = _plain(col)
+    if isinstance(val, tuple):
+        cond = pc.and_(pc.greater_equal(col, val[0]), pc.less_equal(col, val[1]))
+    elif isinstance(val, str):
+        cond = pc.match_substring(pc.cast(col, pa.string()), val, ignore_case=True)
+    else:
+        cond = pc.is_in(col, value_set=pa.array(list(val)).cast(col.type))
+    return pc.fill_null(cond, False)
+
+
+def mask(table, filters):
+    """Masque booléen des lignes retenues ; ``None`` sans filtre actif."""
+    out = None
+    for name, val in (filters or {}).items():
+        if val is None or (hasattr(val, "__len__") and len(val) == 0):
+            continue
+        cond = _condition(table[name], val)
+        out = cond if out is None else pc.and_(out, cond)
+    return out
+
+
+def n_pages(n_rows, page_size):
+    return max(1, math.ceil(n_rows / page_size))
+
+
+@traced("browse.query", rows=lambda res: len(res[0]))
+def query(table, columns=None, filters=None, sort=None, descending=False, page=0, page_size=50):
+    """Page ``page`` (à partir de 0) des lignes retenues : ``(DataFrame, n_retenues)``.
+
+    L'index du DataFrame est la position de la ligne dans la table. Une page au-delà
+    de la dernière renvoie la dernière ; les valeurs manquantes sont triées en fin.
+    """
+    columns = list(table.column_names if columns is None else columns)
+    m = mask(table, filters)
+    idx = None if m is None else pc.indices_nonzero(m)
+    n = table.num_rows if idx is None else len(idx)
+    start = min(page, n_pages(n, page_size) - 1) * page_size
+    if sort is not None:
+        key = _plain(table[sort]) if idx is None else _plain(table[sort]).take(idx)
+        # Manquants en fin de tri, précisé par clé (l'option globale de SortOptions est obsolète)
+        order = pc.sort_indices(pa.table({"k": key}),
+                                sort_keys=[("k", "descending" if descending else "ascending", "at_end")])
+        rows = order.slice(start, page_size)
+        if idx is not None:
+            rows = idx.take(rows)
+    elif idx is not None:
+        rows = idx.slice(start, page_size)
+    else:
+        rows = pa.array(np.arange(start, min(start + page_size, n), dtype=np.int64))
+    df = table.select(columns).take(rows).to_pandas()
+    df.index = pd.Index(rows.to_numpy(zero_copy_only=False), name="ligne")
+    return df, n
+
+
+def choices(table, name, limit=MAX_CHOICES):
+    """Valeurs distinctes triées de ``name`` s'il y en a au plus ``limit``, sinon ``None``."""
+    col = table[name]
+    if pa.types.is_dictionary(col.type) and len(col.chunks) == 1 and len(col.chunk(0).dictionary) > limit:
+        return None
+    values = pc.unique(_plain(col)).drop_null()
+    if len(values) > limit:
+        return None
+    return sorted(values.to_pylist())
+
+
+def value_range(table, name):
+    """``(min, max)`` d'une colonne numérique, ``None`` sinon."""
+    col = _plain(table[name])
+    if not (pa.types.is_integer(col.type) or pa.types.is_floating(col.type)):
+        return None
+    mm = pc.min_max(col)
+    lo, hi = mm["min"].as_py(), mm["max"].as_py()
+    return None if lo is None else (lo, hi)
+
+
+def summary(table):
+    """Équivalent de ``DataFrame.info()`` : dtype pandas, valeurs non nulles et taille par colonne."""
+    dtypes = table.slice(0, 0).to_pandas().dtypes   # conversion de zéro ligne : dtypes exacts
+    n = table.num_rows
+    return pd.DataFrame({
+        "colonne": table.column_names,
+        "non_nuls": [n - table[c].null_count for c in table.column_names],
+        "dtype": [str(dtypes[c]) for c in table.column_names],
+        "memoire_mo": [round(table[c].nbytes / 2 ** 20, 2) for c in table.column_names],
+    })
+
+
+def summary_caption(table, info=None):
+    """Pied de ``info()`` : lignes, colonnes, effectifs des dtypes et mémoire."""
+    info = summary(table) if info is None else info
+    counts = info["dtype"].value_counts().sort_index()
+    dtypes = ", ".join(f"{d}({k})" for d, k in counts.items())
+    rows = f"{table.num_rows:,}".replace(",", " ")
+    return f"{rows} lignes, {table.num_columns} colonnes — dtypes : {dtypes} — {table.nbytes / 2 ** 20:.1f} Mo (Arrow)"
+
+
+# -- Contrôle ----------------------------------------------------------------------
+def _reference(df, filters, sort, descending):
+    """Même requête en pandas sur la table complète convertie."""
+    keep = np.ones(len(df), dtype=bool)
+    for name, val in filters.items():
+        col = df[name]
+        if isinstance(val, tuple):
+            keep &= col.between(*val).fillna(False).to_numpy(dtype=bool)
+        elif isinstance(val, str):
+            keep &= col.astype("string").str.contains(val, case=False, regex=False).fillna(False).to_numpy(dtype=bool)
+        else:
+            keep &= col.isin(list(val)).to_numpy(dtype=bool)
+    out = df[keep]
+    if sort is not None:
+        out = out.sort_values(sort, ascending=not descending, kind="stable", na_position="last")
+    return out
+
+
+def check(table, cases, page_size=50):
+    """Compare ``query`` à pandas ; renvoie une ligne de mesures par cas."""
+    t0 = time.perf_counter()
+    df = table.to_pandas()
+    t_full = time.perf_counter() - t0
+    out = []
+    for filters, sort, descending, page in cases:
+        t0 = time.perf_counter()
+        got, n = query(table, filters=filters, sort=sort, descending=descending, page=page, page_size=page_size)
+        t_query = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        ref = _reference(df, filters, sort, descending)
+        start = min(page, n_pages(len(ref), page_size) - 1) * page_size
+        page_ref = ref.iloc[start:start + page_size]
+        t_ref = time.perf_counter() - t0
+        same = n == len(ref) and np.array_equal(got.index, page_ref.index)
+        try:
+            pd.testing.assert_frame_equal(got.reset_index(drop=True), page_ref.reset_index(drop=True),
+                                          check_dtype=False, check_categorical=False)
+        except AssertionError:
+            same = False
+        out.append({"filtres": str(filters), "tri": f"{sort} {'desc' if descending else 'asc'}" if sort else "",
+                    "page": page, "retenues": n, "identique": bool(same), "query_ms": round(1000 * t_query, 1),
+                    "pandas_ms": round(1000 * (t_full + t_ref), 1)})
+    return out
+
+
+def main(argv=None):
+    import shutil
+    import tempfile
+    from pathlib import Path
+
+    from .shared import NAMES, SharedData, get_shared, synthetic_store
+
+    parser = argparse.ArgumentParser(description="Vérifie la pagination côté serveur contre pandas et la chronomètre.")
+    parser.add_argument("--accidents", type=int, default=0,
+                        help="tables synthétiques de cette taille (défaut : échantillons de data/)")
+    parser.add_argument("--page-size", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    work = Path(tempfile.mkdtemp(prefix="accidents-browse-"))
+    try:
+        layer = SharedData(*synthetic_store(args.accidents, work)) if args.accidents else get_shared()
+        rows = []
+        for name in NAMES:
+            t = layer.table(name)
+            ident = "Num_Acc" if "Num_Acc" in t.column_names else t.column_names[0]
+            num = next(c for c in t.column_names if c != ident and value_range(t, c) is not None)
+            cat = next(c for c in t.column_names if len(choices(t, c) or []) >= 2)
+            lo, hi = value_range(t, num)
+            cases = [({}, None, False, 0), ({}, num, True, 3),
+                     ({num: (lo, (lo + hi) / 2)}, ident, False, 1),
+                     ({cat: choices(t, cat)[:2]}, num, False, 10 ** 6)]
+            if "adr" in t.column_names:
+                cases.append(({"adr": "rue"}, "adr", False, 2))
+            rows += [{"table": name, **r} for r in check(t, cases, args.page_size)]
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    res = pd.DataFrame(rows)
+    print(res.to_string(index=False))
+    if not res["identique"].all():
+        raise SystemExit(1)
+    print("Pages identiques à pandas.")
+
+
+if __name__ == "__main__":
+    main()
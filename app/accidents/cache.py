@@ -0,0 +1,204 @@
+"""Cache des prédictions, indexé par le vecteur de variables aligné et le modèle servi.
+
+Sur la page de prédiction, on modifie quelques listes déroulantes (``lum``, ``secu``,
+``col``, ...) autour d'une même ligne de référence, si bien que les mêmes vecteurs
+reviennent sans cesse. ``CachedScorer`` enveloppe un ``Scorer`` : chaque ligne est
+alignée sur les colonnes du modèle, hachée (BLAKE2b du vecteur float64 et de la clé du
+modèle), et seules les lignes absentes du cache sont scorées, en un seul appel.
+
+``PredictionCache`` :
+
+- en mémoire : LRU de ``max_entries`` entrées, chacune valable ``ttl`` secondes ;
+- sur disque (optionnel, ``path`` ou variable ``ACCIDENTS_PREDICTION_CACHE``) : base
+  SQLite en mode WAL, consultée en cas d'absence en mémoire et partagée entre processus
+  et redémarrages ;
+- compteurs ``hits`` / ``misses`` / ``disk_hits`` / ``evictions`` / ``expired``.
+
+La clé du modèle est faite de sa version et des empreintes SHA-256 des artefacts
+(``Scorer.sha256``). Dès qu'un artefact change, ``bind`` purge les entrées de l'ancien
+modèle, en mémoire comme sur disque.
+"""
+import ast
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .scoring import ScoreResult
+from .tracing import traced
+
+CACHE_PATH_ENV = "ACCIDENTS_PREDICTION_CACHE"
+MAX_ENTRIES = 50_000
+TTL_SECONDS = 24 * 3600
+PRUNE_EVERY = 1000
+
+
+def model_key(scorer):
+    """Identité du modèle servi : version + empreintes des artefacts."""
+    return f"{scorer.version}:{scorer.sha256 or type(scorer.model).__name__}"
+
+
+def row_keys(X, key):
+    """Une clé de 16 octets par ligne de la matrice alignée ``X``."""
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    prefix = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    return [hashlib.blake2b(row.tobytes(), digest_size=16, key=prefix).digest() for row in X]
+
+
+class PredictionCache:
+    """LRU + TTL en mémoire, doublé d'une base SQLite optionnelle."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.model = None
+        self.stats = {"hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0, "expired": 0}
+        self._entries = OrderedDict()   # clé -> (horodatage, classe prédite, probabilités)
+        self._lock = threading.RLock()
+        self._db = None
+        self._writes = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS predictions ("
+                             "key BLOB PRIMARY KEY, model TEXT, created REAL, pred TEXT, proba BLOB)")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def bind(self, key):
+        """Associe le cache au modèle ``key`` ; purge les entrées d'un autre modèle."""
+        with self._lock:
+            if key == self.model:
+                return
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM predictions WHERE model != ?", (key,))
+            self.model = key
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM predictions")
+
+    def get(self, key, now=None):
+        """``(classe, probabilités)`` ou ``None`` ; met à jour les compteurs."""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry[1:]
+                del self._entries[key]
+                self.stats["expired"] += 1
+            if self._db is not None:
+                row = self._db.execute("SELECT created, pred, proba FROM predictions WHERE key = ? AND model = ?",
+                                       (key, self.model)).fetchone()
+                if row is not None and now - row[0] <= self.ttl:
+                    value = (_decode_pred(row[1]), None if row[2] is None else np.frombuffer(row[2]))
+                    self._remember(key, (row[0], *value))
+                    self.stats["hits"] += 1
+                    self.stats["disk_hits"] += 1
+                    return value
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, pred, proba, now=None):
+        self.put_many([(key, pred, proba)], now)
+
+    def put_many(self, items, now=None):
+        """Enregistre des ``(clé, classe, probabilités)`` ; une seule transaction sur disque."""
+        now = time.time() if now is None else now
+        items = [(k, p, None if q is None else np.asarray(q, dtype=np.float64)) for k, p, q in items]
+        with self._lock:
+            for key, pred, proba in items:
+                self._remember(key, (now, pred, proba))
+            if self._db is not None:
+                with self._db:
+                    self._db.execute("BEGIN")
+                    self._db.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?)", [
+                        (key, self.model, now, repr(_plain(pred)), None if proba is None else proba.tobytes())
+                        for key, pred, proba in items])
+                previous, self._writes = self._writes, self._writes + len(items)
+                if self._writes // PRUNE_EVERY > previous // PRUNE_EVERY:
+                    self._prune_disk(now)
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _prune_disk(self, now):
+        """Retire les entrées expirées puis les plus anciennes au-delà de ``max_entries``."""
+        self._db.execute("DELETE FROM predictions WHERE created < ?", (now - self.ttl,))
+        self._db.execute("DELETE FROM predictions WHERE key IN (SELECT key FROM predictions "
+                         "ORDER BY created DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def info(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {**self.stats, "entries": len(self._entries), "model": self.model, "disk": self.path,
+                    "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else None}
+
+
+def _plain(value):
+    return value.item() if hasattr(value, "item") else value
+
+
+def _decode_pred(text):
+    return ast.literal_eval(text)
+
+
+class CachedScorer:
+    """``Scorer`` dont les lignes déjà vues sont servies par un ``PredictionCache``."""
+
+    def __init__(self, scorer, cache):
+        self.scorer = scorer
+        self.cache = cache
+        self.key = model_key(scorer)
+        cache.bind(self.key)
+
+    def __getattr__(self, name):   # version, classes, feature_names, ... du Scorer
+        return getattr(self.scorer, name)
+
+    @traced("cache.score")
+    def score(self, X):
+        self.cache.bind(self.key)
+        Xa = self.scorer.align(X)
+        keys = row_keys(Xa, self.key)
+        found = [self.cache.get(k) for k in keys]
+        missing = [i for i, v in enumerate(found) if v is None]
+        if missing:
+            res = self.scorer.score(Xa[missing])
+            for j, i in enumerate(missing):
+                found[i] = (_plain(res.pred[j]), None if res.proba is None else res.proba[j])
+            self.cache.put_many([(keys[i], *found[i]) for i in missing])
+        if not found:
+            return self.scorer.score(Xa)   # aucune ligne : résultat vide du Scorer
+        classes = self.scorer.classes
+        pred = np.asarray([v[0] for v in found], dtype=classes.dtype if len(classes) else None)
+        proba = np.vstack([v[1] for v in found]) if self.scorer.has_proba else None
+        return ScoreResult(classes, pred, proba)
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache():
+    """Cache partagé par tout le processus ; sur disque si ``ACCIDENTS_PREDICTION_CACHE`` est défini."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = PredictionCache(path=os.environ.get(CACHE_PATH_ENV) or None)
+        return _CACHE
@@ -0,0 +1,18 @@
+"""Chemins et constantes partagés par l'application et les scripts."""
+import os
+from pathlib import Path
+
+# Racine du dépôt (app/accidents/config.py -> ../../)
+ROOT_DIR = Path(__file__).resolve().parents[2]
+
+DATA_DIR = ROOT_DIR / "data"
+MODELS_DIR = ROOT_DIR / "models"
+REPORTS_DIR = ROOT_DIR / "reports"
+
+
+def env_flag(name, default=False):
+    """Lit une variable d'environnement booléenne ("1", "true", "yes", "on")."""
+    val = os.environ.get(name)
+    if val is None:
+        return default
+    return val.strip().lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,292 @@
+"""Cube de comptages précalculé pour l'onglet Dataviz.
+
+Les graphiques de l'onglet Dataviz étaient des PNG exportés une fois depuis le
+notebook. Le cube agrège la table par accident selon les dimensions
+(annee, mois, moment, lum, agg, int, secu, grav_order_max, dep) : nombre d'accidents
+et sommes des comptages d'usagers (sexe, classes d'âge, trajets, places). Il est
+écrit dans ``data/store/cube/cube.parquet`` et ne compte que quelques milliers de
+lignes, si bien que chaque graphique filtré se recalcule en quelques millisecondes.
+
+Source : la table par accident de ``accidents.pipeline`` ou l'échantillon déjà fusionné
+``data/sample_merged_accident_mini.csv`` (``source="auto"`` : la plus grande des deux).
+
+L'année étant une dimension, chaque ligne du cube ne dépend que d'une année de la
+table par accident. ``update_cube`` remplace donc seulement les lignes des années dont
+la partition a changé, d'après les empreintes gardées dans ``cube/_manifest.json``.
+Le manifeste garde aussi la source et ``CUBE_VERSION`` : un cube construit depuis une
+autre source ou par une version antérieure est reconstruit entièrement.
+
+Ligne de commande : ``PYTHONPATH=app python -m accidents.cube [--source auto|features|mini] [--update]``
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .aggregate import Groups
+from .config import DATA_DIR
+from .store import STORE_DIR
+from .tracing import traced
+
+CUBE_FILE = STORE_DIR / "cube" / "cube.parquet"
+CUBE_MANIFEST = "_manifest.json"
+# À incrémenter quand le contenu du cube change à source égale (2 : gravité de l'échantillon mini)
+CUBE_VERSION = 2
+MINI_FILE = DATA_DIR / "sample_merged_accident_mini.csv"
+
+DIMENSIONS = ("annee", "mois", "moment", "lum", "agg", "int", "secu", "grav_order_max", "dep")
+MEASURES = ("Homme", "Femme", "Enfant", "Jeune", "Adulte", "Senior",
+            "Travail", "Professionnel", "Loisirs", "Inconnu", "Autre_y",
+            "Conducteur", "Avant", "Arrière", "Autre_x")
+
+DIM_DTYPES = {d: "int8" for d in DIMENSIONS}
+DIM_DTYPES.update({"annee": "int16", "dep": "category"})
+
+# Colonnes de sample_merged_accident_mini.csv -> noms de la table par accident
+MINI_RENAME = {
+    "grav_order": "grav_order_max",
+    "pres_Homme": "Homme", "pres_Femme": "Femme",
+    "age_grp_Enfant": "Enfant", "age_grp_Jeune": "Jeune",
+    "age_grp_Adulte": "Adulte", "age_grp_Senior": "Senior",
+    "trajet_grp_Travail": "Travail", "trajet_grp_Professionnel": "Professionnel",
+    "trajet_grp_Loisirs": "Loisirs", "trajet_grp_Inconnu": "Inconnu", "trajet_grp_Autre": "Autre_y",
+    "Autre": "Autre_x",
+}
+
+# grav_order de l'échantillon : échelle du notebook {1: 0, 4: 1, 3: 2, 2: 3} (0 = indemne) ;
+# +1 donne celle de pipeline.GRAV_SIMPL (1 = Indemne ... 4 = Tué)
+MINI_GRAV_SHIFT = 1
+
+MOMENT_LABELS = {1: "Matin", 2: "Après-midi", 3: "Soir", 4: "Nuit (0h-6h)"}
+
+
+# -- Sources -----------------------------------------------------------------------
+def _from_mini(df):
+    """Colonnes et codes de la table par accident pour un bloc de l'échantillon."""
+    df = df.rename(columns=MINI_RENAME)
+    if "grav_order_max" in df:
+        df["grav_order_max"] = df["grav_order_max"] + MINI_GRAV_SHIFT
+    if "dep" not in df:
+        df["dep"] = "NA"   # le département n'a pas été conservé dans cet échantillon
+    return df
+
+
+def read_mini(path=MINI_FILE):
+    """Échantillon fusionné du notebook, renommé vers les colonnes de la table par accident."""
+    return _from_mini(pd.read_csv(path, index_col=0))
+
+
+def resolve_source(source="auto", features_dir=None):
+    """``features`` ou ``mini`` ; ``auto`` choisit la table par accident la plus grande."""
+    if source != "auto":
+        return source
+    from .pipeline import FEATURES_DIR
+
+    features_dir = Path(FEATURES_DIR if features_dir is None else features_dir)
+    n_features = sum(pq.ParquetFile(p).metadata.num_rows for p in features_dir.glob("annee=*/part-0.parquet"))
+    n_mini = _count_lines(MINI_FILE) if MINI_FILE.exists() else 0
+    return "features" if n_features and n_features >= n_mini else "mini"
+
+
+@traced("cube.read_source")
+def read_source(source="auto", columns=None):
+    """Table par accident : ``features``, ``mini`` ou ``auto`` (la plus grande des deux)."""
+    if resolve_source(source) == "features":
+        from .pipeline import read_features
+
+        return read_features(columns=columns)
+    mini = read_mini()
+    return mini if columns is None else mini[[c for c in columns if c in mini]]
+
+
+def iter_source(source="auto", columns=None, chunk_size=100_000):
+    """Même table, lue par blocs d'au plus ``chunk_size`` lignes (``Num_Acc`` toujours présent)."""
+    if resolve_source(source) == "features":
+        from .pipeline import FEATURES_DIR
+
+        cols = None if columns is None else list(dict.fromkeys(["Num_Acc", *columns]))
+        for path in sorted(FEATURES_DIR.glob("annee=*/part-0.parquet")):
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=cols):
+                yield batch.to_pandas()
+        return
+    for chunk in pd.read_csv(MINI_FILE, index_col=0, chunksize=chunk_size):
+        chunk = _from_mini(chunk)
+        chunk["Num_Acc"] = chunk.index.to_numpy(dtype=np.int64)   # identifiant de ligne de l'échantillon
+        yield chunk if columns is None else chunk[[c for c in ["Num_Acc", *columns] if c in chunk]]
+
+
+def _count_lines(path):
+    with open(path, "rb") as f:
+        return sum(1 for _ in f) - 1
+
+
+# -- Construction ------------------------------------------------------------------
+def build_cube(df):
+    """Nombre d'accidents et sommes des mesures par combinaison de dimensions présente."""
+    dims = df[list(DIMENSIONS)].copy()
+    dims["dep"] = dims["dep"].astype(str)
+    for d in DIMENSIONS[:-1]:
+        dims[d] = pd.to_numeric(dims[d], errors="coerce").fillna(-1).astype(DIM_DTYPES[d])
+    # Une clé entière par combinaison (codes de facteur), puis agrégation en une passe
+    codes = [pd.factorize(dims[d], sort=True) for d in DIMENSIONS]
+    key = np.zeros(len(df), dtype=np.int64)
+    for c, uniques in codes:
+        key = key * (len(uniques) + 1) + c
+    groups = Groups(key)
+    first = groups.order[groups.starts] if groups.order is not None else groups.starts
+    cube = dims.iloc[first].reset_index(drop=True)
+    cube["n_accidents"] = groups.sizes.astype(np.int32)
+    for m in MEASURES:
+        vals = df[m].to_numpy(dtype=np.float64, na_value=0) if m in df else np.zeros(len(df))
+        cube[m] = groups.reduce(vals, "sum").astype(np.int32)
+    cube["dep"] = cube["dep"].astype("category")
+    return cube
+
+
+def save_cube(cube, path=CUBE_FILE):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+    pq.write_table(pa.Table.from_pandas(cube, preserve_index=False), tmp, compression="zstd")
+    os.replace(tmp, path)
+
+
+def _manifest_path(path):
+    return Path(path).with_name(CUBE_MANIFEST)
+
+
+def _features_state(features_dir=None):
+    """Empreinte de chaque partition de la table par accident (manifeste du pipeline)."""
+    from .pipeline import FEATURES_DIR, load_features_manifest
+
+    manifest = load_features_manifest(FEATURES_DIR if features_dir is None else features_dir)
+    return {a: e["sha256"] for a, e in manifest.get("annees", {}).items()}
+
+
+def load_state(path=CUBE_FILE):
+    """Manifeste du cube (version, source, empreintes par année) ; ``{}`` sans cube."""
+    p = _manifest_path(path)
+    if not Path(path).exists() or not p.exists():
+        return {}
+    return json.loads(p.read_text(encoding="utf-8"))
+
+
+def _save_state(path, source, annees):
+    p = _manifest_path(path)
+    tmp = p.with_name(p.name + f".tmp{os.getpid()}")
+    state = {"version": CUBE_VERSION, "source": source, "annees": annees}
+    tmp.write_text(json.dumps(state, indent=1, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, p)
+
+
+def update_cube(path=CUBE_FILE, features_dir=None, source="auto"):
+    """Met le cube à jour depuis la table par accident, année par année.
+
+    Les lignes des années nouvelles ou modifiées sont recalculées, celles des années
+    disparues retirées, les autres conservées telles quelles. Sans cube, ou avec un cube
+    construit depuis une autre source, il est reconstruit entièrement. Si ``source``
+    désigne l'échantillon ``mini`` (``auto`` : la plus grande des deux tables), le cube
+    n'est pas touché. Renvoie les années recalculées et retirées.
+    """
+    from .pipeline import FEATURES_DIR, read_features
+
+    features_dir = FEATURES_DIR if features_dir is None else features_dir
+    path = Path(path)
+    if resolve_source(source, features_dir) != "features":
+        return {"recalculees": [], "retirees": [], "source": "mini"}
+    state = _features_state(features_dir)
+    previous = load_state(path)
+    if previous.get("version") != CUBE_VERSION or previous.get("source") != "features":
+        previous = {"annees": {}}
+    old = previous["annees"]
+    changed = sorted(int(a) for a, sha in state.items() if old.get(a) != sha)
+    removed = sorted(int(a) for a in old if a not in state)
+    if not changed and not removed:
+        return {"recalculees": [], "retirees": [], "source": "features"}
+    parts = []
+    if old:
+        cube = pq.read_table(path).to_pandas()
+        parts.append(cube[~cube["annee"].isin(changed + removed)])
+    if changed:
+        parts.append(build_cube(read_features(columns=list(DIMENSIONS + MEASURES), annees=changed,
+                                              out_dir=features_dir)))
+    cube = pd.concat([p.astype({"dep": str}) for p in parts], ignore_index=True)
+    cube["dep"] = cube["dep"].astype("category")
+    save_cube(cube.sort_values("annee", kind="stable", ignore_index=True), path)
+    _save_state(path, "features", state)
+    return {"recalculees": changed, "retirees": removed, "source": "features"}
+
+
+def rebuild_cube(path=CUBE_FILE, source="auto"):
+    """Construit le cube entier depuis ``source`` et enregistre son manifeste."""
+    source = resolve_source(source)
+    cube = build_cube(read_source(source, columns=list(DIMENSIONS + MEASURES)))
+    save_cube(cube, path)
+    _save_state(path, source, _features_state() if source == "features" else {})
+    return cube
+
+
+def cube_fingerprint(path=CUBE_FILE, source="auto"):
+    """Clé de cache du cube chargé : change avec la source retenue et à chaque écriture du cube."""
+    path = Path(path)
+    stamps = [p.stat().st_mtime_ns if p.exists() else None for p in (path, _manifest_path(path))]
+    return json.dumps([resolve_source(source), *stamps])
+
+
+@traced("cube.load_cube")
+def load_cube(path=CUBE_FILE, source="auto"):
+    """Charge le cube ; le (re)construit s'il manque ou si sa version ou sa source a changé."""
+    path = Path(path)
+    state = load_state(path)
+    if state.get("version") != CUBE_VERSION or state.get("source") != resolve_source(source):
+        return rebuild_cube(path, source)
+    return pq.read_table(path).to_pandas()
+
+
+# -- Requêtes ----------------------------------------------------------------------
+def filter_cube(cube, **filters):
+    """Restreint le cube : ``annee=(2010, 2018)`` (bornes incluses) ou ``lum=[1, 2]``."""
+    mask = np.ones(len(cube), dtype=bool)
+    for dim, val in filters.items():
+        if val is None or (hasattr(val, "__len__") and len(val) == 0):
+            continue
+        if isinstance(val, tuple):
+            mask &= cube[dim].between(*val).to_numpy()
+        else:
+            mask &= cube[dim].isin(list(val)).to_numpy()
+    return cube[mask]
+
+
+def totals(cube, by, measures=("n_accidents",)):
+    """Sommes des mesures par valeur de ``by`` (dimension ou liste de dimensions)."""
+    by = [by] if isinstance(by, str) else list(by)
+    return cube.groupby(by, observed=True, as_index=False)[list(measures)].sum()
+
+
+def shares(cube, by, within):
+    """Part (%) de chaque valeur de ``by`` au sein de chaque valeur de ``within``."""
+    t = totals(cube, [within, by])
+    t["part"] = 100 * t["n_accidents"] / t.groupby(within)["n_accidents"].transform("sum")
+    return t
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Construit le cube de comptages de l'onglet Dataviz.")
+    parser.add_argument("--source", choices=("auto", "features", "mini"), default="auto")
+    parser.add_argument("--update", action="store_true",
+                        help="ne recalcule que les années modifiées de la table par accident")
+    args = parser.parse_args(argv)
+    if args.update:
+        print(f"Années recalculées / retirées : {update_cube()}")
+        return
+    cube = rebuild_cube(CUBE_FILE, args.source)
+    print(f"Cube : {len(cube)} lignes pour {int(cube['n_accidents'].sum())} accidents -> {CUBE_FILE} "
+          f"({CUBE_FILE.stat().st_size / 1024:.0f} Ko)")
+
+
+if __name__ == "__main__":
+    main()
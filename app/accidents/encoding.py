@@ -0,0 +1,233 @@
+"""Réencodages des variables usager, vectorisés.
+
+Les notebooks appliquaient ligne par ligne (``Series.apply``) des fonctions Python :
+``decode_secu``, ``regroupe_place``, ``regroupe_trajet``, ``age_group`` et
+``correct_year``. Les versions ci-dessous produisent les mêmes valeurs à partir
+d'opérations NumPy : arithmétique entière, tables de correspondance indexées par le
+code, ``np.digitize`` pour les classes d'âge. Les libellés sont rendus en
+``category`` (codes int8 + liste fixe de modalités).
+
+Les fonctions d'origine sont conservées (suffixe ``_ref``) pour le contrôle
+d'équivalence.
+
+Contrôle et mesure de débit : ``PYTHONPATH=app python -m accidents.encoding [--scale N]``
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+PLACE_LABELS = ("Conducteur", "Avant", "Arrière", "Autre")
+TRAJET_LABELS = ("Inconnu", "Travail", "Professionnel", "Loisirs", "Autre")
+AGE_LABELS = ("Enfant", "Jeune", "Adulte", "Senior")
+AGE_BINS = (18, 30, 60)
+
+# Tables de correspondance code -> indice du libellé (codes 0 à 9)
+_PLACE_LUT = np.array([3, 0, 1, 2, 2, 2, 2, 3, 3, 3], dtype=np.int8)
+_TRAJET_LUT = np.array([0, 1, 4, 4, 2, 3, 4, 4, 4, 4], dtype=np.int8)
+
+
+# -- Fonctions de référence (notebooks) --------------------------------------------
+def decode_secu_ref(val):
+    if pd.isna(val):
+        return -1
+    val = int(val)
+    equipement = val // 10
+    usage = val % 10
+    if usage == 1:
+        return equipement
+    elif usage == 2:
+        return 0
+    elif usage == 3:
+        return -1
+    else:
+        return -1  # cas imprévu
+
+
+def regroupe_place_ref(p):
+    if p == 1:
+        return "Conducteur"
+    elif p == 2:
+        return "Avant"
+    elif p in [3, 4, 5, 6]:
+        return "Arrière"
+    else:
+        return "Autre"
+
+
+def regroupe_trajet_ref(x):
+    if pd.isna(x) or x == 0:
+        return "Inconnu"
+    elif x == 1:
+        return "Travail"
+    elif x == 4:
+        return "Professionnel"
+    elif x == 5:
+        return "Loisirs"
+    else:
+        return "Autre"
+
+
+def age_group_ref(age):
+    if age < 18:
+        return "Enfant"
+    elif age < 30:
+        return "Jeune"
+    elif age < 60:
+        return "Adulte"
+    else:
+        return "Senior"
+
+
+def correct_year_ref(x):
+    if 1800 < x < 1900:
+        return x + 100
+    return x
+
+
+# -- Versions vectorisées ----------------------------------------------------------
+def _values(s):
+    """Valeurs en float64 avec NaN pour les manquants (Int8/Int16 nullables compris)."""
+    if isinstance(s, (pd.Series, pd.Index)):
+        return s.to_numpy(dtype=np.float64, na_value=np.nan)
+    return np.asarray(s, dtype=np.float64)
+
+
+def _lookup(v, lut, default):
+    """Indice de libellé pour chaque code ; ``default`` hors de la table (NaN compris)."""
+    ok = (v >= 0) & (v < len(lut)) & (v == np.floor(v))
+    return np.where(ok, lut[np.where(ok, v, 0).astype(np.intp)], default).astype(np.int8)
+
+
+def _like(s, values):
+    """Met le résultat sous la forme de l'entrée : Series (même index) ou tableau."""
+    return pd.Series(values, index=s.index, name=s.name) if isinstance(s, pd.Series) else values
+
+
+def _labels(s, codes, labels):
+    return _like(s, pd.Categorical.from_codes(codes, categories=list(labels)))
+
+
+def decode_secu_codes(secu):
+    """Équipement utilisé (dizaine) si usage == 1, 0 si non utilisé, -1 sinon (int16)."""
+    v = _values(secu)
+    ok = ~np.isnan(v)
+    vi = np.where(ok, v, 0).astype(np.int64)
+    equipement, usage = vi // 10, vi % 10
+    return np.where(ok & (usage == 1), equipement, np.where(ok & (usage == 2), 0, -1)).astype(np.int16)
+
+
+def decode_secu(secu):
+    return _like(secu, pd.array(decode_secu_codes(secu), dtype="Int64"))
+
+
+def place_codes(place):
+    """Indice dans ``PLACE_LABELS``."""
+    return _lookup(_values(place), _PLACE_LUT, 3)
+
+
+def regroupe_place(place):
+    return _labels(place, place_codes(place), PLACE_LABELS)
+
+
+def trajet_codes(trajet):
+    """Indice dans ``TRAJET_LABELS`` (manquant -> Inconnu)."""
+    v = _values(trajet)
+    return np.where(np.isnan(v), 0, _lookup(v, _TRAJET_LUT, 4)).astype(np.int8)
+
+
+def regroupe_trajet(trajet):
+    return _labels(trajet, trajet_codes(trajet), TRAJET_LABELS)
+
+
+def age_codes(age):
+    """Indice dans ``AGE_LABELS`` ; comme ``age_group`` un âge manquant tombe dans Senior."""
+    return np.digitize(_values(age), AGE_BINS).astype(np.int8)
+
+
+def age_group(age):
+    return _labels(age, age_codes(age), AGE_LABELS)
+
+
+def correct_year(an_nais):
+    """Années de naissance 18xx saisies à la place de 19xx : +100 (type d'entrée conservé)."""
+    v = _values(an_nais)
+    out = np.where((v > 1800) & (v < 1900), v + 100, v)
+    if isinstance(an_nais, pd.Series):
+        return pd.Series(out, index=an_nais.index, name=an_nais.name).astype(an_nais.dtype)
+    return out
+
+
+def indicators(codes, labels, names=None):
+    """Indicatrices int8 par libellé (``names`` pour renommer les colonnes)."""
+    names = labels if names is None else names
+    return {n: (codes == k).astype(np.int8) for k, n in enumerate(names)}
+
+
+# -- Contrôle d'équivalence et débit -----------------------------------------------
+CASES = {
+    "decode_secu": ("secu", decode_secu_ref, decode_secu),
+    "regroupe_place": ("place", regroupe_place_ref, regroupe_place),
+    "regroupe_trajet": ("trajet", regroupe_trajet_ref, regroupe_trajet),
+    "age_group": ("age", age_group_ref, age_group),
+    "correct_year": ("an_nais", correct_year_ref, correct_year),
+}
+
+
+# Valeurs limites : manquants, négatifs, hors table, non entiers, années 18xx
+EDGE_VALUES = [np.nan, -1, 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 21, 93, 99, 123, 2.5,
+               1800, 1801, 1850, 1899, 1900]
+
+
+def _same(ref, vec):
+    a = pd.Series(ref).astype(object).where(pd.Series(ref).notna(), None).tolist()
+    b = pd.Series(vec).astype(object).where(pd.Series(vec).notna(), None).tolist()
+    return a == b
+
+
+def check_and_bench(usagers, repeat=3):
+    """Compare chaque fonction vectorisée à sa référence et mesure les débits (lignes/s)."""
+    edge = pd.Series(EDGE_VALUES, dtype="float64")
+    usagers = usagers.copy()
+    usagers["age"] = usagers["annee"] - correct_year(usagers["an_nais"]).astype("float64")
+    rows = []
+    for name, (col, ref, vec) in CASES.items():
+        s = usagers[col]
+        t0 = time.perf_counter()
+        expected = s.astype("float64").apply(ref)
+        t_ref = time.perf_counter() - t0
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            got = vec(s)
+            best = min(best, time.perf_counter() - t0)
+        rows.append({
+            "fonction": name, "lignes": len(s),
+            "identique": _same(expected, got) and _same(edge.apply(ref), vec(edge)),
+            "apply_lignes_s": round(len(s) / t_ref), "vectorise_lignes_s": round(len(s) / best),
+            "acceleration": round(t_ref / best, 1),
+        })
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    from .store import read_table
+
+    parser = argparse.ArgumentParser(description="Équivalence et débit des réencodages vectorisés.")
+    parser.add_argument("--scale", type=int, default=1, help="répète la table usagers N fois")
+    parser.add_argument("--output", help="CSV où écrire le rapport")
+    args = parser.parse_args(argv)
+    usagers = read_table("usagers", columns=["secu", "place", "trajet", "an_nais"])
+    if args.scale > 1:
+        usagers = pd.concat([usagers] * args.scale, ignore_index=True)
+    report = check_and_bench(usagers)
+    print(report.to_string(index=False))
+    if args.output:
+        report.to_csv(args.output, index=False)
+    if not report["identique"].all():
+        raise SystemExit("Écart entre fonctions de référence et versions vectorisées")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""Explications SHAP des forêts et du boosting, avec un ``TreeExplainer`` par modèle.
+
+``get_explainer`` construit un ``shap.TreeExplainer`` une seule fois par modèle servi (clé
+``accidents.cache.model_key`` : version + empreintes des artefacts) et le garde pour tout
+le processus. Sans données de fond, l'explainer utilise les effectifs des nœuds
+(``tree_path_dependent``, le plus rapide). Avec ``background`` (au plus
+``BACKGROUND_ROWS`` lignes tirées une fois, gardées avec l'explainer) il passe en mode
+``interventional``. ``explainer_for`` et la ligne de commande tirent ces lignes du jeu
+d'entraînement matérialisé (``sample_background``) à la construction seulement.
+
+Un export compact ``.forest`` (``accidents.export``) ne garde pas les effectifs des
+nœuds : ``explainer_for`` charge alors le pickle complet, retiré du cache du registre
+une fois l'explainer construit. L'explainer garde toutefois une référence au modèle
+complet tant qu'il reste dans le cache (``MAX_EXPLAINERS``).
+
+``contributions`` découpe les lignes en lots répartis entre threads (le calcul de
+``shap`` se fait hors de l'interpréteur). ``approximate=True`` donne les contributions
+de Saabas : environ mille fois plus rapide sur une forêt profonde, avec un classement
+des variables très proche. C'est le mode par défaut pour l'importance globale.
+
+L'importance globale (moyenne des |SHAP| par variable et par classe sur l'échantillon
+de test) est précalculée dans ``reports/shap_<version>_<modèle>.csv``, que lit la page
+de prédiction.
+
+Ligne de commande : ``PYTHONPATH=app python -m accidents.explain --version <v> --model rf.joblib``
+"""
+import argparse
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from .config import REPORTS_DIR
+from .tracing import traced
+
+BACKGROUND_ROWS = 100
+BATCH_SIZE = 64
+MAX_EXPLAINERS = 2
+
+
+class ModelExplainer:
+    """``TreeExplainer`` d'un modèle et noms de ses variables."""
+
+    def __init__(self, model, feature_names=None, background=None, seed=42):
+        import shap
+
+        self.model = model
+        n = getattr(model, "n_features_in_", None)
+        self.feature_names = list(feature_names) if feature_names is not None else [f"x{i}" for i in range(n)]
+        self.classes = np.asarray(getattr(model, "classes_", []))
+        self.background = None
+        if background is not None:
+            background = np.asarray(background, dtype=np.float64)
+            if len(background) > BACKGROUND_ROWS:
+                rng = np.random.default_rng(seed)
+                background = background[rng.choice(len(background), BACKGROUND_ROWS, replace=False)]
+            self.background = background
+            self.explainer = shap.TreeExplainer(model, data=background, feature_perturbation="interventional")
+        else:
+            self.explainer = shap.TreeExplainer(model)
+        self.expected_value = np.atleast_1d(self.explainer.expected_value)
+
+    def _batch(self, X, approximate):
+        values = self.explainer.shap_values(X, approximate=approximate, check_additivity=False)
+        values = np.asarray(values)
+        # Une seule sortie (binaire en log-odds) : même forme N x p x K que le multiclasse
+        return values[..., None] if values.ndim == 2 else values
+
+    def contributions(self, X, approximate=False, n_jobs=1, batch_size=BATCH_SIZE):
+        """SHAP (N x p x K) pour des lignes déjà alignées et transformées."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        starts = range(0, len(X), batch_size)
+        if n_jobs == 1 or len(X) <= batch_size:
+            parts = [self._batch(X[s:s + batch_size], approximate) for s in starts]
+        else:
+            parts = Parallel(n_jobs=n_jobs, prefer="threads")(
+                delayed(self._batch)(X[s:s + batch_size], approximate) for s in starts)
+        return np.concatenate(parts) if parts else np.empty((0, X.shape[1], len(self.expected_value)))
+
+    @traced("explain.explain_row")
+    def explain_row(self, x, class_index, approximate=False):
+        """Contributions d'une ligne pour une classe, triées par valeur absolue décroissante."""
+        values = self.contributions(x, approximate)[0, :, min(class_index, len(self.expected_value) - 1)]
+        out = pd.DataFrame({"variable": self.feature_names, "valeur": np.asarray(x, dtype=np.float64).ravel(),
+                            "contribution": values})
+        return out.reindex(out["contribution"].abs().sort_values(ascending=False).index).reset_index(drop=True)
+
+    def global_importance(self, X, approximate=True, n_jobs=-1, batch_size=BATCH_SIZE):
+        """Moyenne des |SHAP| par variable (une colonne par classe + ``total``), triée."""
+        values = np.abs(self.contributions(X, approximate, n_jobs, batch_size)).mean(axis=0)
+        labels = self.classes if len(self.classes) == values.shape[1] else range(values.shape[1])
+        out = pd.DataFrame(values, columns=[f"classe_{c}" for c in labels])
+        out.insert(0, "variable", self.feature_names)
+        out["total"] = values.sum(axis=1)
+        return out.sort_values("total", ascending=False, ignore_index=True)
+
+
+_EXPLAINERS = OrderedDict()
+_EXPLAINERS_LOCK = threading.Lock()
+
+
+def get_explainer(key, model, feature_names=None, background=None):
+    """Explainer du modèle ``key``, construit une seule fois par processus."""
+    return _get_or_build(key, lambda: ModelExplainer(model, feature_names, background))
+
+
+def _get_or_build(key, build):
+    # ``build`` n'est appelé que si ``key`` n'est pas déjà en cache
+    with _EXPLAINERS_LOCK:
+        explainer = _EXPLAINERS.get(key)
+        if explainer is None:
+            explainer = build()
+            _EXPLAINERS[key] = explainer
+            while len(_EXPLAINERS) > MAX_EXPLAINERS:
+                _EXPLAINERS.popitem(last=False)
+        _EXPLAINERS.move_to_end(key)
+        return explainer
+
+
+def needs_pickle(scorer):
+    """Vrai si le modèle servi est un export compact : l'explainer charge alors le pickle."""
+    model = getattr(scorer, "scorer", scorer).model
+    return not (hasattr(model, "estimators_") or hasattr(model, "_predictors"))
+
+
+def sample_background(scorer, data_dir=None, n=BACKGROUND_ROWS, seed=42):
+    """``n`` lignes tirées du jeu d'entraînement matérialisé, alignées et transformées.
+
+    ``None`` si le jeu n'a pas été matérialisé (``accidents.train``) : l'explainer reste
+    alors en ``tree_path_dependent``.
+    """
+    from .train import TRAIN_DIR, load_split
+
+    data_dir = Path(data_dir or TRAIN_DIR)
+    meta = data_dir / "meta.json"
+    if n <= 0 or not meta.exists():
+        return None
+    columns = json.loads(meta.read_text(encoding="utf-8"))["columns"]
+    X = load_split(data_dir, "train")[0]
+    idx = np.sort(np.random.default_rng(seed).choice(len(X), min(n, len(X)), replace=False))
+    return scorer.transform(scorer.align(pd.DataFrame(np.asarray(X[idx]), columns=columns)))
+
+
+def explainer_for(scorer, registry, model_file, data_dir=None):
+    """Explainer du modèle d'un ``Scorer`` (ou ``CachedScorer``).
+
+    Construit au premier appel avec ``BACKGROUND_ROWS`` lignes de fond. Un export
+    ``.forest`` ne garde pas les effectifs des nœuds dont a besoin ``TreeExplainer`` :
+    le pickle est alors chargé depuis le registre, puis retiré de son cache.
+    """
+    from .cache import model_key
+
+    scorer = getattr(scorer, "scorer", scorer)
+
+    def build():
+        background = sample_background(scorer, data_dir)
+        if not needs_pickle(scorer):
+            return ModelExplainer(scorer.model, scorer.feature_names, background)
+        model = registry.load(model_file, version=scorer.version).obj
+        try:
+            return ModelExplainer(model, scorer.feature_names, background)
+        finally:
+            registry.evict(model_file, version=scorer.version)
+
+    return _get_or_build(model_key(scorer), build)
+
+
+def importance_path(version, model_file, reports_dir=REPORTS_DIR):
+    return Path(reports_dir) / f"shap_{version}_{Path(model_file).stem}.csv"
+
+
+def main(argv=None):
+    from .registry import ModelRegistry
+    from .scoring import Scorer
+    from .train import TRAIN_DIR, load_split
+
+    parser = argparse.ArgumentParser(description="Importance SHAP globale sur l'échantillon de test.")
+    parser.add_argument("--version", required=True)
+    parser.add_argument("--model", default="rf.joblib")
+    parser.add_argument("--scaler", default="", help="fichier du scaler ('' : aucun)")
+    parser.add_argument("--data", help="CSV des lignes (défaut : jeu de test matérialisé par accidents.train)")
+    parser.add_argument("--max-rows", type=int, default=2000)
+    parser.add_argument("--background-rows", type=int, default=BACKGROUND_ROWS,
+                        help="lignes de fond tirées du jeu d'entraînement (0 : tree_path_dependent)")
+    parser.add_argument("--exact", action="store_true", help="SHAP exact plutôt que l'approximation de Saabas")
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    args = parser.parse_args(argv)
+
+    registry = ModelRegistry()
+    scorer = Scorer.from_registry(registry, args.scaler or None, args.model, version=args.version, compact=False)
+    if args.data:
+        frame = pd.read_csv(args.data, nrows=args.max_rows, low_memory=False)
+    else:
+        columns = json.loads((TRAIN_DIR / "meta.json").read_text(encoding="utf-8"))["columns"]
+        frame = pd.DataFrame(np.asarray(load_split(TRAIN_DIR, "test")[0][:args.max_rows]), columns=columns)
+    X = scorer.transform(scorer.align(frame))
+    names = scorer.feature_names or list(frame.columns)
+
+    t0 = time.perf_counter()
+    background = sample_background(scorer, n=args.background_rows)
+    explainer = get_explainer(args.version, scorer.model, names, background)
+    build = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    explainer.explain_row(X[:1], 0)
+    one_row = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    importance = explainer.global_importance(X, approximate=not args.exact, n_jobs=args.n_jobs)
+    elapsed = time.perf_counter() - t0
+
+    out = importance_path(scorer.version, args.model)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    importance.to_csv(out, index=False)
+    print(importance.head(15).to_string(index=False))
+    print(f"Explainer ({'interventional' if explainer.background is not None else 'tree_path_dependent'}) : "
+          f"{1000 * build:.0f} ms ; une ligne (exact) : {1000 * one_row:.0f} ms ; "
+          f"{len(X)} lignes ({'exact' if args.exact else 'Saabas'}) : {elapsed:.2f} s -> {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""Export compact des forêts et du boosting pour l'inférence (tableaux NumPy en memmap).
+
+Un RandomForest picklé se désérialise arbre par arbre (un objet ``Tree`` et ses tableaux
+par estimateur) et chaque processus Streamlit en garde sa propre copie. L'export aplatit
+tous les arbres d'un ``RandomForestClassifier`` / ``ExtraTreesClassifier`` /
+``BalancedRandomForestClassifier`` ou d'un ``HistGradientBoostingClassifier`` en
+quelques tableaux contigus, un fichier ``.npy`` chacun, dans un dossier
+``<modèle>.forest/`` :
+
+- ``feature`` (int32), ``threshold`` (float32), ``left`` / ``right`` (int32) et
+  ``missing_left`` (bool) pour les seuls nœuds internes. Un enfant négatif ``-(i+1)``
+  désigne la feuille ``i`` ;
+- ``leaf_values`` (float32) : probabilités par classe (forêts) ou contribution brute
+  (boosting) de chaque feuille ; ``roots`` (int32) : la racine de chaque arbre ;
+- ``meta.json`` : type, classes, variables, profondeur maximale, constante initiale
+  du boosting.
+
+L'export élague : les statistiques d'entraînement (impureté, effectifs, valeurs des
+nœuds internes) ne sont pas conservées, et un nœud dont les deux enfants sont des
+feuilles de même valeur devient lui-même une feuille (``predict_proba`` inchangé).
+
+Les seuils sont arrondis vers le bas en float32. Les forêts de scikit-learn comparent des
+entrées converties en float32 à des seuils float64, si bien que ``x <= seuil`` donne le
+même résultat et la prédiction est identique. Le boosting compare en float64 : l'écart
+n'apparaît que pour une entrée non représentable en float32 tombant entre les deux seuils.
+
+``CompactForest.load`` ouvre les tableaux en memmap : chargement en quelques
+millisecondes, pages partagées entre processus par le cache du système. Le prédicteur
+avance tous les couples (ligne, arbre) d'un niveau par itération, en ne gardant que ceux
+qui n'ont pas atteint une feuille, par blocs de lignes. ``classes_``, ``predict_proba``
+et ``predict`` permettent de l'utiliser comme modèle d'un ``accidents.scoring.Scorer`` ;
+``Scorer.from_registry`` le préfère au pickle quand l'export correspond à son empreinte.
+
+Ligne de commande : ``PYTHONPATH=app python -m accidents.export models/<version>/rf.joblib``
+(écrit ``rf.forest/`` à côté, puis compare durées et probabilités à scikit-learn)
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+FORMAT_VERSION = 1
+SUFFIX = ".forest"
+ARRAYS = ("feature", "threshold", "left", "right", "missing_left", "leaf_values", "roots")
+PREDICT_CHUNK = 4096
+
+
+# -- Aplatissement -----------------------------------------------------------------
+def float32_floor(t):
+    """Plus grand float32 <= t : ``x32 <= floor(t)`` équivaut à ``x32 <= t``."""
+    t = np.asarray(t, dtype=np.float64)
+    t32 = t.astype(np.float32)
+    over = t32.astype(np.float64) > t
+    t32[over] = np.nextafter(t32[over], np.float32(-np.inf))
+    return t32
+
+
+def prune(left, right, values, is_leaf):
+    """Transforme en feuille tout nœud dont les deux enfants sont des feuilles identiques.
+
+    Les enfants ont des indices supérieurs à leur parent (construction en profondeur) :
+    un parcours à rebours suffit, répété en cascade.
+    """
+    is_leaf = is_leaf.copy()
+    values = values.copy()
+    for node in range(len(left) - 1, -1, -1):
+        if is_leaf[node]:
+            continue
+        a, b = left[node], right[node]
+        if is_leaf[a] and is_leaf[b] and np.array_equal(values[a], values[b]):
+            is_leaf[node] = True
+            values[node] = values[a]
+    return values, is_leaf
+
+
+def flatten_tree(feature, threshold, missing_left, left, right, values, is_leaf):
+    """Numérotation compacte d'un arbre : nœuds internes puis feuilles atteignables."""
+    values, is_leaf = prune(left, right, values, is_leaf)
+    internal, leaves, ids = [], [], {}
+    stack, depth = [(0, 0)], 0
+    while stack:
+        node, d = stack.pop()
+        depth = max(depth, d)
+        if is_leaf[node]:
+            ids[node] = -(len(leaves) + 1)
+            leaves.append(node)
+        else:
+            ids[node] = len(internal)
+            internal.append(node)
+            stack += [(right[node], d + 1), (left[node], d + 1)]
+    internal = np.array(internal, dtype=np.int64)
+    remap = np.vectorize(ids.get, otypes=[np.int64])
+    return {
+        "feature": feature[internal].astype(np.int32),
+        "threshold": float32_floor(threshold[internal]),
+        "missing_left": missing_left[internal].astype(bool),
+        "left": remap(left[internal]) if len(internal) else np.empty(0, np.int64),
+        "right": remap(right[internal]) if len(internal) else np.empty(0, np.int64),
+        "leaf_values": values[np.array(leaves)].astype(np.float32),
+        "root": ids[0],
+        "depth": depth,
+    }
+
+
+def concat_trees(trees):
+    """Concatène des arbres aplatis en décalant les indices de nœuds et de feuilles."""
+    out = {k: [] for k in ("feature", "threshold", "missing_left", "left", "right", "leaf_values")}
+    roots, n_internal, n_leaves = [], 0, 0
+    for t in trees:
+        for side in ("left", "right"):
+            child = t[side]
+            out[side].append(np.where(child >= 0, child + n_internal, child - n_leaves).astype(np.int32))
+        for k in ("feature", "threshold", "missing_left", "leaf_values"):
+            out[k].append(t[k])
+        root = t["root"]
+        roots.append(root + n_internal if root >= 0 else root - n_leaves)
+        n_internal += len(t["feature"])
+        n_leaves += len(t["leaf_values"])
+    arrays = {k: np.concatenate(v) for k, v in out.items()}
+    arrays["roots"] = np.array(roots, dtype=np.int32)
+    return arrays, max(t["depth"] for t in trees)
+
+
+def _sklearn_trees(model):
+    for est in model.estimators_:
+        tree = est.tree_
+        if tree.n_outputs != 1:
+            raise ValueError("Export limité aux forêts à une seule sortie")
+        value = tree.value[:, 0, :]
+        # Probabilités de feuille normalisées, comme DecisionTreeClassifier.predict_proba
+        proba = value / np.where(value.sum(axis=1, keepdims=True) == 0, 1, value.sum(axis=1, keepdims=True))
+        missing = getattr(tree, "missing_go_to_left", np.zeros(tree.node_count, dtype=np.uint8))
+        yield flatten_tree(tree.feature, tree.threshold, missing, tree.children_left, tree.children_right,
+                           proba, tree.children_left < 0)
+
+
+def _hgb_trees(model):
+    for iteration in model._predictors:
+        for predictor in iteration:
+            nodes = predictor.nodes
+            if nodes["is_categorical"].any():
+                raise ValueError("Export impossible : le boosting utilise des variables catégorielles natives")
+            yield flatten_tree(nodes["feature_idx"], nodes["num_threshold"], nodes["missing_go_to_left"],
+                               nodes["left"], nodes["right"], nodes["value"][:, None], nodes["is_leaf"].astype(bool))
+
+
+def flatten_model(model):
+    """Tableaux et métadonnées d'une forêt ou d'un ``HistGradientBoostingClassifier``."""
+    meta = {"format": FORMAT_VERSION, "estimator": type(model).__name__,
+            "classes": np.asarray(model.classes_).tolist(), "n_features": int(model.n_features_in_)}
+    if hasattr(model, "feature_names_in_"):
+        meta["feature_names"] = [str(c) for c in model.feature_names_in_]
+    if hasattr(model, "_predictors"):
+        arrays, depth = concat_trees(list(_hgb_trees(model)))
+        meta.update(kind="boosting", trees_per_iteration=len(model._predictors[0]),
+                    baseline=np.asarray(model._baseline_prediction, dtype=np.float64).ravel().tolist())
+    elif hasattr(model, "estimators_") and hasattr(model.estimators_[0], "tree_"):
+        arrays, depth = concat_trees(list(_sklearn_trees(model)))
+        meta["kind"] = "forest"
+    else:
+        raise ValueError(f"Modèle non pris en charge : {type(model).__name__}")
+    meta.update(max_depth=int(depth), n_trees=len(arrays["roots"]),
+                n_internal=len(arrays["feature"]), n_leaves=len(arrays["leaf_values"]))
+    return arrays, meta
+
+
+def export(model, out_dir, source_sha256=None):
+    """Écrit le dossier ``.forest`` ; renvoie les métadonnées.
+
+    ``source_sha256`` : empreinte du pickle d'origine, pour reconnaître un export périmé.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    arrays, meta = flatten_model(model)
+    meta["source_sha256"] = source_sha256
+    for name in ARRAYS:
+        np.save(out_dir / f"{name}.npy", np.ascontiguousarray(arrays[name]))
+    (out_dir / "meta.json").write_text(json.dumps(meta, indent=1), encoding="utf-8")
+    return meta
+
+
+# -- Prédiction --------------------------------------------------------------------
+class CompactForest:
+    """Prédicteur vectorisé sur les tableaux d'un dossier ``.forest``."""
+
+    def __init__(self, arrays, meta, chunk_size=PREDICT_CHUNK):
+        self.meta = meta
+        self.chunk_size = chunk_size
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.classes_ = np.asarray(meta["classes"])
+        self.n_features_in_ = meta["n_features"]
+        if "feature_names" in meta:
+            self.feature_names_in_ = np.asarray(meta["feature_names"], dtype=object)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r", **kwargs):
+        path = Path(path)
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        if meta.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Format d'export {meta.get('format')} non pris en charge (attendu {FORMAT_VERSION})")
+        arrays = {name: np.load(path / f"{name}.npy", mmap_mode=mmap_mode) for name in ARRAYS}
+        return cls(arrays, meta, **kwargs)
+
+    def apply(self, X):
+        """Indice de feuille atteint dans chaque arbre (N x n_arbres)."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n, n_trees = len(X), len(self.roots)
+        state = np.tile(np.asarray(self.roots, dtype=np.int32), n)
+        # Seuls les couples (ligne, arbre) pas encore arrivés à une feuille sont avancés
+        pending = np.flatnonzero(state >= 0)
+        offset = (pending // n_trees) * X.shape[1]
+        flat = X.ravel()
+        while len(pending):
+            node = state[pending]
+            x = flat[offset + self.feature[node]]
+            go_left = (x <= self.threshold[node]) | (np.isnan(x) & self.missing_left[node])
+            nxt = np.where(go_left, self.left[node], self.right[node])
+            state[pending] = nxt
+            keep = nxt >= 0
+            pending, offset = pending[keep], offset[keep]
+        return (-state - 1).reshape(n, n_trees)
+
+    def _proba_block(self, X):
+        leaves = self.apply(X)
+        values = self.leaf_values[leaves]   # N x n_arbres x (K ou 1)
+        if self.meta["kind"] == "forest":
+            return values.mean(axis=1, dtype=np.float64)
+        k = self.meta["trees_per_iteration"]
+        raw = values[..., 0].reshape(len(X), -1, k).sum(axis=1, dtype=np.float64) + self.meta["baseline"]
+        if k == 1:
+            p = 1 / (1 + np.exp(-raw[:, 0]))
+            return np.column_stack([1 - p, p])
+        raw -= raw.max(axis=1, keepdims=True)
+        e = np.exp(raw)
+        return e / e.sum(axis=1, keepdims=True)
+
+    def predict_proba(self, X):
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"{X.shape[1]} colonnes reçues, {self.n_features_in_} attendues par le modèle")
+        if len(X) == 0:
+            return np.empty((0, len(self.classes_)))
+        return np.vstack([self._proba_block(X[s:s + self.chunk_size]) for s in range(0, len(X), self.chunk_size)])
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def load_for(model_path, sha256):
+    """Export à côté de ``model_path`` s'il a été produit depuis ce pickle, sinon ``None``."""
+    path = forest_path(model_path)
+    meta_file = path / "meta.json"
+    if not meta_file.exists():
+        return None
+    meta = json.loads(meta_file.read_text(encoding="utf-8"))
+    if meta.get("format") != FORMAT_VERSION or meta.get("source_sha256") != sha256:
+        return None
+    return CompactForest.load(path)
+
+
+def forest_path(model_path):
+    """``models/v/rf.joblib`` -> ``models/v/rf.forest``."""
+    model_path = Path(model_path)
+    return model_path.with_name(model_path.stem + SUFFIX)
+
+
+def dir_size(path):
+    return sum(p.stat().st_size for p in Path(path).iterdir())
+
+
+# -- Vérification ------------------------------------------------------------------
+def _latency(fn, X, repeat=20):
+    """Durée médiane d'un appel (latence d'une requête isolée)."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(X)
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times))
+
+
+def compare(model_path, X, out_dir=None):
+    """Exporte ``model_path`` puis compare chargement, prédiction et probabilités."""
+    import joblib
+
+    from .registry import file_sha256
+
+    model_path = Path(model_path)
+    out_dir = Path(out_dir) if out_dir else forest_path(model_path)
+    t0 = time.perf_counter()
+    model = joblib.load(model_path)
+    load_pickle = time.perf_counter() - t0
+    meta = export(model, out_dir, source_sha256=file_sha256(model_path))
+
+    t0 = time.perf_counter()
+    compact = CompactForest.load(out_dir)
+    load_compact = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    ref = model.predict_proba(X)
+    pred_ref = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    got = compact.predict_proba(X)
+    pred_compact = time.perf_counter() - t0
+    one_ref = _latency(model.predict_proba, X[:1])
+    one_compact = _latency(compact.predict_proba, X[:1])
+    return {
+        "modele": model_path.name, "arbres": meta["n_trees"], "noeuds_internes": meta["n_internal"],
+        "feuilles": meta["n_leaves"], "profondeur": meta["max_depth"],
+        "pickle_ko": round(model_path.stat().st_size / 1024), "export_ko": round(dir_size(out_dir) / 1024),
+        "chargement_pickle_ms": round(1000 * load_pickle, 1), "chargement_export_ms": round(1000 * load_compact, 1),
+        "predict_sklearn_s": round(pred_ref, 3), "predict_export_s": round(pred_compact, 3),
+        "une_ligne_sklearn_ms": round(1000 * one_ref, 2), "une_ligne_export_ms": round(1000 * one_compact, 2),
+        "ecart_proba_max": float(np.abs(ref - got).max()),
+        "predictions_identiques": float((ref.argmax(axis=1) == got.argmax(axis=1)).mean()),
+    }
+
+
+def main(argv=None):
+    from .train import TRAIN_DIR, load_split
+
+    parser = argparse.ArgumentParser(description="Exporte des modèles en tableaux memmap et vérifie les probabilités.")
+    parser.add_argument("models", nargs="+", help="fichiers .joblib (RandomForest, ExtraTrees, BRF, HGB)")
+    parser.add_argument("--data-dir", default=str(TRAIN_DIR), help="jeu matérialisé par accidents.train")
+    parser.add_argument("--tolerance", type=float, default=1e-5)
+    args = parser.parse_args(argv)
+
+    X, _ = load_split(args.data_dir, "test")
+    failed = False
+    for path in args.models:
+        res = compare(path, X)
+        print(json.dumps(res, ensure_ascii=False))
+        failed |= res["ecart_proba_max"] > args.tolerance
+    if failed:
+        raise SystemExit(f"Écart de probabilité supérieur à {args.tolerance}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Test de charge du service de prédiction : latences p50 / p99 et débit.
+
+``concurrency`` threads envoient chacun ``requests`` requêtes de ``rows`` lignes tirées
+du jeu de test matérialisé par ``accidents.train`` (ou d'un CSV). Avec ``--spawn`` le
+service est lancé dans un sous-processus le temps du test, pour chaque valeur de
+``--max-wait-ms`` (``0`` : pas de regroupement, un appel au modèle par requête).
+
+Ligne de commande :
+``PYTHONPATH=app python -m accidents.loadtest --spawn --version local --model rf.joblib --scaler ''``
+ou ``--url http://127.0.0.1:8765`` pour un service déjà lancé.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from .service import DEFAULT_PORT, ServiceClient
+
+
+def sample_rows(columns=None, data=None, n=1000):
+    """Lignes à envoyer : CSV ``data`` ou jeu de test matérialisé (colonnes de ``meta.json``)."""
+    if data:
+        df = pd.read_csv(data, nrows=n, low_memory=False)
+    else:
+        from .train import TRAIN_DIR, load_split
+
+        meta = json.loads((TRAIN_DIR / "meta.json").read_text(encoding="utf-8"))
+        X, _ = load_split(TRAIN_DIR, "test")
+        df = pd.DataFrame(np.asarray(X[:n]), columns=meta["columns"])
+    return df if columns is None else df[[c for c in columns if c in df]]
+
+
+def run(url, frame, concurrency=16, requests=50, rows=1, seed=42):
+    """Envoie la charge et renvoie latences (ms) et débits."""
+    client = ServiceClient(url)
+    client.health()
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def worker(w):
+        rng = np.random.default_rng(seed + w)
+        local = []
+        for _ in range(requests):
+            start = int(rng.integers(0, max(1, len(frame) - rows)))
+            t0 = time.perf_counter()
+            try:
+                client.score(frame.iloc[start:start + rows])
+            except Exception as exc:
+                with lock:
+                    errors.append(str(exc))
+                continue
+            local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+
+    before = client.health()
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    after = client.health()
+    lat = np.array(latencies) * 1000
+    batches = after["batches"] - before["batches"]
+    return {
+        "concurrence": concurrency, "lignes_par_requete": rows, "requetes": len(lat), "erreurs": len(errors),
+        "p50_ms": round(float(np.percentile(lat, 50)), 2) if len(lat) else None,
+        "p99_ms": round(float(np.percentile(lat, 99)), 2) if len(lat) else None,
+        "requetes_par_s": round(len(lat) / elapsed, 1),
+        "lignes_par_s": round(len(lat) * rows / elapsed, 1),
+        "lignes_par_lot": round((after["rows"] - before["rows"]) / batches, 1) if batches else None,
+    }
+
+
+def spawn(port, service_args, timeout=120):
+    """Lance ``accidents.service`` et attend que ``/health`` réponde."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.path.dirname(os.path.dirname(__file__)),
+                                                                      os.environ.get("PYTHONPATH")])))
+    proc = subprocess.Popen([sys.executable, "-m", "accidents.service", "--port", str(port), *service_args], env=env)
+    client = ServiceClient(f"http://127.0.0.1:{port}", timeout=2)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Le service s'est arrêté (code {proc.returncode})")
+        try:
+            client.health()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise TimeoutError("Le service n'a pas démarré à temps")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latences p50/p99 et débit du service de prédiction.")
+    parser.add_argument("--url", help="service déjà lancé (sinon --spawn)")
+    parser.add_argument("--spawn", action="store_true", help="lance le service le temps du test")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--version", help="transmis au service lancé")
+    parser.add_argument("--model", help="transmis au service lancé")
+    parser.add_argument("--scaler", help="transmis au service lancé ('' : aucun)")
+    parser.add_argument("--max-wait-ms", type=float, nargs="+", default=[0.0, 5.0],
+                        help="une série de mesures par valeur (avec --spawn)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=50, help="requêtes par thread")
+    parser.add_argument("--rows", type=int, default=1, help="lignes par requête")
+    parser.add_argument("--data", help="CSV des lignes à envoyer (défaut : jeu de test matérialisé)")
+    parser.add_argument("--output", help="CSV où écrire les résultats")
+    args = parser.parse_args(argv)
+    if not args.url and not args.spawn:
+        parser.error("--url ou --spawn requis")
+
+    results = []
+    if args.url:
+        features = ServiceClient(args.url).health().get("features")
+        frame = sample_rows(features, args.data)
+        results.append(run(args.url, frame, args.concurrency, args.requests, args.rows))
+    else:
+        service_args = [f"--{k}={v}" for k, v in (("version", args.version), ("model", args.model),
+                                                   ("scaler", args.scaler)) if v is not None]
+        for wait in args.max_wait_ms:
+            proc = spawn(args.port, [*service_args, "--max-wait-ms", str(wait)])
+            try:
+                url = f"http://127.0.0.1:{args.port}"
+                frame = sample_rows(ServiceClient(url).health().get("features"), args.data)
+                results.append({"max_wait_ms": wait,
+                                **run(url, frame, args.concurrency, args.requests, args.rows)})
+            finally:
+                proc.terminate()
+                proc.wait()
+    out = pd.DataFrame(results)
+    print(out.to_string(index=False))
+    if args.output:
+        out.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""Construction par blocs de la table « une ligne par accident » (df_merge_accident).
+
+Le notebook fusionnait caracs -> vehicules -> usagers -> lieux sur ``Num_Acc`` puis
+réduisait le résultat par ``groupby('Num_Acc')`` : la jointure produit
+véhicules x usagers lignes par accident avant d'être agrégée. Ici usagers et véhicules
+sont d'abord réduits à une ligne par accident, puis joints 1:1 aux caractéristiques et
+aux lieux. Le traitement se fait par année puis par plages de ``Num_Acc`` (au plus
+``chunk_size`` accidents à la fois) et chaque bloc est écrit aussitôt dans
+``data/store/features/annee=<annee>/part-0.parquet``.
+
+Comme les usagers ne sont plus dupliqués par véhicule, les comptages (Homme, Femme,
+places, trajets, âges) sont des nombres réels d'usagers par accident.
+
+La construction est incrémentale. ``data/store/features/_manifest.json`` garde, pour
+chaque année, les empreintes SHA-256 des quatre CSV sources avec le schéma et le format
+de leurs partitions (manifeste de ``accidents.store``) et l'empreinte de la partition
+écrite. Seules les années nouvelles, ou dont une source ou une partition du store a
+changé, sont recalculées. La médiane de ``nbv`` (valeurs manquantes)
+est la seule grandeur calculée sur plusieurs années : elle est figée dans le manifeste
+lors de la première construction complète (ou avec ``--force``), comme un paramètre
+appris, pour qu'une nouvelle année ne modifie pas les précédentes.
+
+Ligne de commande : ``PYTHONPATH=app python -m accidents.pipeline [--chunk-size N | --max-memory-mb M]``
+"""
+import argparse
+import json
+import os
+import resource
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .aggregate import aggregate
+from .encoding import (AGE_LABELS, PLACE_LABELS, TRAJET_LABELS, age_codes, correct_year,
+                       decode_secu_codes, indicators, place_codes, trajet_codes)
+from .config import DATA_DIR
+from .registry import file_sha256
+from .store import STORE_DIR, TABLES, discover_annees, ingest, load_manifest, partition_path
+from .tracing import traced
+
+FEATURES_DIR = STORE_DIR / "features"
+FEATURES_MANIFEST = "_manifest.json"
+DEFAULT_CHUNK_SIZE = 50_000
+
+# À incrémenter quand l'encodage des variables change : toutes les années sont recalculées
+FEATURES_VERSION = 1
+
+# Ordre de grandeur mesuré sur les tables typées : ~1 ligne caracs + lieux, ~1,7
+# véhicule et ~2,2 usagers par accident, plus les colonnes intermédiaires
+BYTES_PER_ACCIDENT = 4_000
+
+# Départements hors France métropolitaine / Corse, écartés comme dans le notebook
+DEP_HORS_METROPOLE = ['971', '972', '973', '974', '976', '975', '977', '978', '984', '986', '987', '988']
+
+CARACS_COLS = ["Num_Acc", "an", "mois", "jour", "hrmn", "lum", "agg", "int", "atm", "col", "com", "dep"]
+LIEUX_COLS = ["Num_Acc", "catr", "circ", "nbv", "prof", "lartpc", "larrout", "surf", "infra", "situ"]
+VEHICULES_COLS = ["Num_Acc", "num_veh", "senc", "catv", "occutc", "obs", "obsm", "choc", "manv"]
+USAGERS_COLS = ["Num_Acc", "place", "catu", "grav", "sexe", "trajet", "secu", "an_nais"]
+
+# Noms des indicatrices place / trajet, dans l'ordre de PLACE_LABELS / TRAJET_LABELS
+PLACE_COLS = ("Conducteur", "Avant", "Arrière", "Autre_x")
+TRAJET_COLS = ("Inconnu", "Travail", "Professionnel", "Loisirs", "Autre_y")
+
+# Échelle de gravité : 1 = Indemne < 2 = Blessé léger < 3 = Blessé hospitalisé < 4 = Tué
+GRAV_SIMPL = {1: 1, 4: 2, 3: 3, 2: 4}
+GRAV_LABELS = {1: "Indemne", 2: "Blessé léger", 3: "Blessé hospitalisé", 4: "Tué"}
+
+# Types de sortie : identiques pour tous les blocs (schéma Parquet stable)
+# Les noms Autre_x (place) / Autre_y (trajet) reprennent ceux du modèle Modele_Full
+FEATURE_DTYPES = {
+    "Num_Acc": "int64", "annee": "int16",
+    "an": "int8", "mois": "int8", "jour": "int8", "heure": "int8", "moment": "int8",
+    "lum": "int8", "agg": "int8", "int": "int8", "atm": "int8", "col": "int8",
+    "com": "str", "dep": "str",
+    "senc": "int8", "catv": "int8", "occutc": "int16", "obs": "int8", "obsm": "int8", "manv": "int8",
+    "nb_veh": "int16",
+    "choc_avant": "int8", "choc_arriere": "int8", "choc_lateral": "int8", "choc_multiple": "int8",
+    "catu": "int8", "secu": "int8", "pieton": "int8",
+    "Homme": "int16", "Femme": "int16",
+    "Arrière": "int16", "Autre_x": "int16", "Avant": "int16", "Conducteur": "int16",
+    "Autre_y": "int16", "Inconnu": "int16", "Loisirs": "int16", "Professionnel": "int16", "Travail": "int16",
+    "Adulte": "int16", "Enfant": "int16", "Jeune": "int16", "Senior": "int16",
+    "catr": "int8", "circ": "int8", "nbv": "int8", "prof": "int8",
+    "lartpc": "float32", "larrout": "float32",
+    "surf": "int8", "infra": "int8", "situ": "int8",
+    "grav_order_max": "int8",
+}
+
+
+def _codes(s):
+    """Série nullable -> float64 avec NaN (comparaisons vectorisées sans pd.NA)."""
+    return s.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+# -- Agrégats par accident ---------------------------------------------------------
+USAGERS_SPEC = {
+    "grav_order_max": ("grav_order", "max"),
+    "pieton": ("pieton", "max"),
+    "catu": ("catu", "first"),
+    "secu": ("secu", "first"),
+    **{c: (c, "sum") for c in ("Homme", "Femme") + PLACE_COLS + TRAJET_COLS + AGE_LABELS},
+}
+
+VEHICULES_SPEC = {
+    "nb_veh": ("num_veh", "nunique"),
+    "choc_avant": ("choc_avant", "max"),
+    "choc_arriere": ("choc_arriere", "max"),
+    "choc_lateral": ("choc_lateral", "max"),
+    "choc_multiple": ("choc_multiple", "max"),
+    "choc_connu": ("choc_connu", "any"),
+    **{c: (c, "first") for c in ("senc", "catv", "occutc", "obs", "obsm", "manv")},
+}
+
+
+def aggregate_usagers(u, annee):
+    """Usagers -> une ligne par accident (gravité max, comptages, premier usager)."""
+    work = pd.DataFrame({
+        "Num_Acc": u["Num_Acc"].to_numpy(),
+        "Homme": (_codes(u["sexe"]) == 1).astype(np.int8),
+        "Femme": (_codes(u["sexe"]) == 2).astype(np.int8),
+        "pieton": (_codes(u["catu"]) == 3).astype(np.int8),
+        **indicators(place_codes(u["place"]), PLACE_LABELS, PLACE_COLS),
+        **indicators(trajet_codes(u["trajet"]), TRAJET_LABELS, TRAJET_COLS),
+        **indicators(age_codes(annee - _codes(correct_year(u["an_nais"]))), AGE_LABELS),
+        "grav_order": u["grav"].map(GRAV_SIMPL).to_numpy(),
+        "catu": u["catu"].to_numpy(),
+        "secu": decode_secu_codes(u["secu"]),
+    })
+    return aggregate(work, "Num_Acc", USAGERS_SPEC)
+
+
+def aggregate_vehicules(v):
+    """Véhicules -> une ligne par accident (nb_veh, familles de choc, premier véhicule)."""
+    choc = _codes(v["choc"])
+    work = v[["Num_Acc", "num_veh", "senc", "catv", "occutc", "obs", "obsm", "manv"]].assign(
+        choc_avant=np.isin(choc, [1, 2, 3]).astype(np.int8),
+        choc_arriere=np.isin(choc, [4, 5, 6]).astype(np.int8),
+        choc_lateral=np.isin(choc, [7, 8]).astype(np.int8),
+        choc_multiple=(choc == 9).astype(np.int8),
+        choc_connu=~np.isnan(choc),
+    )
+    return aggregate(work, "Num_Acc", VEHICULES_SPEC)
+
+
+def encode_caracs(c):
+    """Caractéristiques : heure / moment de la journée depuis hrmn."""
+    hrmn = c["hrmn"].astype(str).str.replace(":", "", regex=False).str.zfill(4)
+    heure = pd.to_numeric(hrmn.str[:2], errors="coerce").fillna(0).astype(np.int8)
+    c = c.drop(columns=["hrmn"])
+    c["heure"] = heure
+    # 1 = matin, 2 = après-midi, 3 = soir, 4 = nuit (0h-6h)
+    c["moment"] = np.select([heure < 6, heure < 12, heure < 18], [4, 1, 2], 3).astype(np.int8)
+    return c
+
+
+def encode_lieux(l, nbv_median):
+    l = l.copy()
+    surf = _codes(l["surf"])
+    l["surf"] = np.where(np.isin(surf, [1, 2]), 1, np.where(np.isin(surf, [3, 4, 5, 6, 7, 8]), 0, -1))
+    l["lartpc"] = l["lartpc"].fillna(0)
+    l["larrout"] = l["larrout"].fillna(-1)
+    l["prof"] = l["prof"].fillna(-1)
+    l["nbv"] = l["nbv"].fillna(nbv_median)
+    l["circ"] = l["circ"].fillna(-1)
+    l["infra"] = l["infra"].fillna(0)
+    l["situ"] = l["situ"].fillna(-1)
+    return l
+
+
+@traced("pipeline.build_chunk")
+def build_chunk(caracs, lieux, vehicules, usagers, annee, nbv_median):
+    """Table par accident pour un bloc de Num_Acc (toutes les tables déjà filtrées)."""
+    caracs = caracs[~caracs["dep"].astype(str).isin(DEP_HORS_METROPOLE)]
+    caracs = caracs.dropna(subset=["atm", "col", "com"])
+    acc = encode_caracs(caracs)
+    acc = acc.merge(aggregate_vehicules(vehicules), on="Num_Acc", how="left")
+    acc = acc.merge(encode_lieux(lieux, nbv_median), on="Num_Acc", how="left")
+    acc = acc.dropna(subset=["catr", "senc", "manv"])
+    acc = acc[acc["choc_connu"].astype(bool)].drop(columns=["choc_connu"])
+    acc[["obs", "obsm"]] = acc[["obs", "obsm"]].fillna(-1)
+    # Jointure interne : un accident sans usager n'a pas de gravité
+    acc = acc.merge(aggregate_usagers(usagers, annee), on="Num_Acc", how="inner")
+    acc["annee"] = annee
+    return acc[list(FEATURE_DTYPES)].astype(FEATURE_DTYPES)
+
+
+# -- Lecture des tables par plage de Num_Acc ---------------------------------------
+def _read_range(table, annee, columns, lo, hi, store_dir=STORE_DIR):
+    path = partition_path(table, annee, store_dir)
+    if not path.exists():
+        return pd.DataFrame(columns=columns)
+    t = pq.read_table(path, columns=columns, filters=[("Num_Acc", ">=", lo), ("Num_Acc", "<=", hi)])
+    return t.to_pandas()
+
+
+def _nbv_median(annees, store_dir=STORE_DIR):
+    vals = [pq.read_table(partition_path("lieux", a, store_dir), columns=["nbv"]).column(0).to_numpy(zero_copy_only=False)
+            for a in annees if partition_path("lieux", a, store_dir).exists()]
+    vals = np.concatenate(vals).astype(np.float64) if vals else np.array([2.0])
+    return float(np.nanmedian(vals))
+
+
+def iter_feature_chunks(annee, chunk_size=DEFAULT_CHUNK_SIZE, nbv_median=2.0, store_dir=STORE_DIR):
+    """Génère les blocs de la table par accident pour une année."""
+    path = partition_path("caracteristiques", annee, store_dir)
+    pf = pq.ParquetFile(path)
+    for batch in pf.iter_batches(batch_size=chunk_size, columns=CARACS_COLS):
+        caracs = pa.Table.from_batches([batch]).to_pandas()
+        if caracs.empty:
+            continue
+        lo, hi = int(caracs["Num_Acc"].min()), int(caracs["Num_Acc"].max())
+        yield build_chunk(
+            caracs,
+            _read_range("lieux", annee, LIEUX_COLS, lo, hi, store_dir),
+            _read_range("vehicules", annee, VEHICULES_COLS, lo, hi, store_dir),
+            _read_range("usagers", annee, USAGERS_COLS, lo, hi, store_dir),
+            annee, nbv_median,
+        )
+
+
+def features_path(annee, out_dir=FEATURES_DIR):
+    return Path(out_dir) / f"annee={annee}" / "part-0.parquet"
+
+
+def load_features_manifest(out_dir=FEATURES_DIR):
+    p = Path(out_dir) / FEATURES_MANIFEST
+    if p.exists():
+        return json.loads(p.read_text(encoding="utf-8"))
+    return {}
+
+
+def save_features_manifest(manifest, out_dir=FEATURES_DIR):
+    p = Path(out_dir) / FEATURES_MANIFEST
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(p.name + f".tmp{os.getpid()}")
+    tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, p)
+
+
+def source_hashes(annee, store_manifest):
+    """État des partitions d'une année, par table : empreinte du CSV source, schéma et format.
+
+    Une partition régénérée par ``accidents.store`` (schéma ou ``LAYOUT_VERSION`` modifiés)
+    change cet état même si le CSV est identique : l'année est alors recalculée.
+    """
+    out = {}
+    for t in TABLES:
+        entry = store_manifest.get(t, {}).get(str(annee), {})
+        out[t] = [entry.get("sha256"), entry.get("schema"), entry.get("layout")]
+    return out
+
+
+def write_features(annee, chunk_size=DEFAULT_CHUNK_SIZE, nbv_median=2.0, out_dir=FEATURES_DIR,
+                   store_dir=STORE_DIR):
+    """Écrit la partition d'une année, bloc par bloc. Renvoie le nombre d'accidents écrits."""
+    path = features_path(annee, out_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+    writer, n = None, 0
+    try:
+        for chunk in iter_feature_chunks(annee, chunk_size, nbv_median, store_dir):
+            t = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, t.schema, compression="zstd")
+            writer.write_table(t)
+            n += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        os.replace(tmp, path)
+    return n
+
+
+def build_features(annees=None, chunk_size=DEFAULT_CHUNK_SIZE, out_dir=FEATURES_DIR, store_dir=STORE_DIR,
+                   force=False, data_dir=DATA_DIR):
+    """Construit la table par accident des années nouvelles ou modifiées, bloc par bloc.
+
+    ``annees`` : toutes les années disponibles par défaut ; ``force`` recalcule la médiane
+    de ``nbv`` et toutes les années. Renvoie un résumé : lignes écrites par année,
+    années inchangées, durée et pic mémoire du processus.
+    """
+    t0 = time.perf_counter()
+    annees = list(discover_annees(data_dir=data_dir, store_dir=store_dir) if annees is None else annees)
+    ingest(annees=annees, data_dir=data_dir, store_dir=store_dir)
+    store_manifest = load_manifest(store_dir)
+    manifest = load_features_manifest(out_dir)
+    if force or manifest.get("version") != FEATURES_VERSION or "nbv_median" not in manifest:
+        manifest = {"version": FEATURES_VERSION, "annees": {},
+                    "nbv_median": _nbv_median(discover_annees(data_dir=data_dir, store_dir=store_dir), store_dir)}
+    rows, skipped = {}, []
+    for annee in annees:
+        if not partition_path("caracteristiques", annee, store_dir).exists():
+            continue
+        sources = source_hashes(annee, store_manifest)
+        entry = manifest["annees"].get(str(annee))
+        if entry is not None and entry["sources"] == sources and features_path(annee, out_dir).exists():
+            skipped.append(annee)
+            continue
+        rows[annee] = write_features(annee, chunk_size, manifest["nbv_median"], out_dir, store_dir)
+        manifest["annees"][str(annee)] = {"sources": sources, "rows": rows[annee],
+                                          "sha256": file_sha256(features_path(annee, out_dir))}
+        save_features_manifest(manifest, out_dir)   # après chaque année : une interruption ne perd rien
+    return {
+        "rows": rows,
+        "skipped": skipped,
+        "nbv_median": manifest["nbv_median"],
+        "seconds": round(time.perf_counter() - t0, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def read_features_arrow(columns=None, annees=None, out_dir=FEATURES_DIR):
+    """Table par accident en ``pyarrow.Table`` (colonnes / années demandées uniquement)."""
+    if annees is None:
+        annees = sorted(int(p.parent.name.split("=")[1]) for p in Path(out_dir).glob("annee=*/part-0.parquet"))
+    parts = [pq.read_table(features_path(a, out_dir), columns=columns)
+             for a in annees if features_path(a, out_dir).exists()]
+    if not parts:
+        raise FileNotFoundError("Table par accident absente : lancer python -m accidents.pipeline")
+    return pa.concat_tables(parts)
+
+
+@traced("pipeline.read_features")
+def read_features(columns=None, annees=None, out_dir=FEATURES_DIR):
+    """Lit la table par accident (colonnes / années demandées uniquement)."""
+    return read_features_arrow(columns, annees, out_dir).to_pandas()
+
+
+def chunk_size_for(max_memory_mb):
+    """Taille de bloc (en accidents) pour rester sous ``max_memory_mb`` de données de travail."""
+    return max(1_000, int(max_memory_mb * 1024 * 1024 / BYTES_PER_ACCIDENT))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Construit la table par accident par blocs bornés en mémoire.")
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="accidents par bloc")
+    size.add_argument("--max-memory-mb", type=float, help="mémoire de travail visée par bloc")
+    parser.add_argument("--annees", type=int, nargs="+", help="années à traiter (défaut : toutes celles trouvées)")
+    parser.add_argument("--force", action="store_true", help="recalcule toutes les années")
+    args = parser.parse_args(argv)
+    chunk = chunk_size_for(args.max_memory_mb) if args.max_memory_mb else args.chunk_size
+    summary = build_features(args.annees, chunk_size=chunk, force=args.force)
+    print(f"{sum(summary['rows'].values())} accidents écrits dans {FEATURES_DIR} pour {sorted(summary['rows'])}, "
+          f"{len(summary['skipped'])} année(s) inchangée(s) "
+          f"({summary['seconds']} s, pic RSS {summary['peak_rss_mb']} Mo, blocs de {chunk})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Prétraitement OHE + standardisation, en matrice dense, creuse (CSR) ou sans OHE.
+
+Le pipeline documenté encode ``mois``, ``jour`` et ``heure`` par ``OneHotEncoder`` dans
+un ``ColumnTransformer``, puis applique ``StandardScaler(with_mean=False)`` et SMOTE.
+Selon le chemin suivi la matrice est densifiée, et HistGradientBoosting l'exige dense.
+Trois modes :
+
+- ``dense`` : le pipeline documenté, matrice dense float32 ;
+- ``sparse`` : la même chose en CSR de bout en bout (``sparse_output=True``,
+  ``sparse_threshold=1``, ``with_mean=False`` ne centre pas donc préserve les zéros ;
+  SMOTE, régression logistique, LinearSVC et RandomForest acceptent du CSR) ;
+- ``native`` : pas d'OHE pour les arbres. Les codes ordinaux sont passés tels quels et
+  HistGradientBoosting les déclare en ``categorical_features``.
+
+Sur CSR, les voisins de SMOTE sont cherchés en force brute par blocs de distances dont
+la taille suit ``working_memory`` de scikit-learn (1 Go par défaut) : le rapport l'ajuste
+à ``WORKING_MEMORY_MB`` (``sklearn.config_context``), à faire de même à l'entraînement.
+
+Rapport mémoire / durée par famille de modèles : ``PYTHONPATH=app python -m accidents.preprocessing``
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+OHE_COLUMNS = ("mois", "jour", "heure")
+WORKING_MEMORY_MB = 32
+MODES = ("dense", "sparse", "native")
+# Modes applicables à chaque famille : pas de CSR pour HGB, pas d'ordinal brut pour les modèles linéaires
+FAMILY_MODES = {
+    "logreg": ("dense", "sparse"),
+    "linearsvc": ("dense", "sparse"),
+    "rf": ("dense", "sparse", "native"),
+    "hgb": ("dense", "native"),
+}
+
+
+def ohe_indices(columns, ohe_columns=OHE_COLUMNS):
+    return [i for i, c in enumerate(columns) if c in ohe_columns]
+
+
+def encoder_steps(columns, mode="dense", ohe_columns=OHE_COLUMNS):
+    """Étapes OHE des colonnes calendaires puis standardisation ; aucune en mode natif."""
+    from sklearn.compose import ColumnTransformer
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+    if mode not in MODES:
+        raise ValueError(f"Mode inconnu : {mode} (attendu : {', '.join(MODES)})")
+    if mode == "native":
+        return []
+    is_sparse = mode == "sparse"
+    ct = ColumnTransformer(
+        [("ohe", OneHotEncoder(handle_unknown="ignore", sparse_output=is_sparse, dtype=np.float32),
+          ohe_indices(columns, ohe_columns))],
+        remainder="passthrough",
+        sparse_threshold=1.0 if is_sparse else 0.0,
+    )
+    return [("ohe", ct), ("scale", StandardScaler(with_mean=False))]
+
+
+def make_encoder(columns, mode="dense", ohe_columns=OHE_COLUMNS):
+    """Pipeline scikit-learn de l'encodeur seul ; ``None`` en mode natif."""
+    from sklearn.pipeline import Pipeline
+
+    steps = encoder_steps(columns, mode, ohe_columns)
+    return Pipeline(steps) if steps else None
+
+
+def make_estimator(family, columns, mode, seed=42, n_jobs=1):
+    from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.svm import LinearSVC
+
+    if mode not in FAMILY_MODES[family]:
+        raise ValueError(f"{family} n'accepte pas le mode {mode} (modes : {', '.join(FAMILY_MODES[family])})")
+    if family == "logreg":
+        return LogisticRegression(solver="saga", class_weight="balanced", max_iter=300, random_state=seed)
+    if family == "linearsvc":
+        return LinearSVC(class_weight="balanced", random_state=seed)
+    if family == "rf":
+        return RandomForestClassifier(n_estimators=100, min_samples_leaf=2, class_weight="balanced_subsample",
+                                      n_jobs=n_jobs, random_state=seed)
+    categorical = ohe_indices(columns) if mode == "native" else None
+    return HistGradientBoostingClassifier(class_weight="balanced", categorical_features=categorical,
+                                          random_state=seed)
+
+
+def build_pipeline(family, columns, mode="dense", smote=False, seed=42, n_jobs=1):
+    """Encodeur (sauf mode natif), SMOTE optionnel (SMOTENC en mode natif), puis le modèle."""
+    from imblearn.pipeline import Pipeline
+
+    steps = encoder_steps(columns, mode)
+    if smote:
+        from imblearn.over_sampling import SMOTE, SMOTENC
+        if mode == "native":
+            # Les codes ordinaux ne s'interpolent pas : SMOTENC reprend la modalité des voisins
+            sampler = SMOTENC(categorical_features=ohe_indices(columns), k_neighbors=3, random_state=seed)
+        else:
+            sampler = SMOTE(k_neighbors=3, random_state=seed)
+        steps.append(("smote", sampler))
+    steps.append(("model", make_estimator(family, columns, mode, seed, n_jobs)))
+    return Pipeline(steps)
+
+
+def matrix_nbytes(X):
+    """Octets occupés par une matrice dense ou creuse (données + indices)."""
+    if sparse.issparse(X):
+        X = X.tocsr()
+        return X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+    return np.asarray(X).nbytes
+
+
+# -- Rapport -----------------------------------------------------------------------
+def measure(family, mode, X, y, Xt, yt, columns, smote=False, working_memory=WORKING_MEMORY_MB):
+    """Durée d'ajustement, pic d'allocation (tracemalloc), taille de la matrice, F1 macro."""
+    from sklearn import config_context
+    from sklearn.metrics import f1_score
+
+    pipe = build_pipeline(family, columns, mode, smote=smote)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    with config_context(working_memory=working_memory):
+        pipe.fit(X, y)
+    fit_s = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    n_prep = len(encoder_steps(columns, mode))
+    Xp = pipe[:n_prep].transform(X) if n_prep else X
+    return {
+        "famille": family, "mode": mode, "format": "CSR" if sparse.issparse(Xp) else "dense",
+        "n_colonnes": Xp.shape[1], "matrice_mo": round(matrix_nbytes(Xp) / 2 ** 20, 2),
+        "pic_mo": round(peak / 2 ** 20, 1), "fit_s": round(fit_s, 3),
+        "f1_macro": round(float(f1_score(yt, pipe.predict(Xt), average="macro")), 4),
+    }
+
+
+def report(families=tuple(FAMILY_MODES), smote=False, max_rows=None):
+    """Toutes les combinaisons famille x mode sur le jeu matérialisé par ``accidents.train``."""
+    import json
+
+    from .train import TRAIN_DIR, load_split, materialize
+
+    if not (TRAIN_DIR / "meta.json").exists():
+        materialize()
+    columns = json.loads((TRAIN_DIR / "meta.json").read_text(encoding="utf-8"))["columns"]
+    X, y = load_split(TRAIN_DIR, "train")
+    Xt, yt = load_split(TRAIN_DIR, "test")
+    if max_rows:
+        X, y = X[:max_rows], y[:max_rows]
+    rows = [measure(f, m, X, y, Xt, yt, columns, smote) for f in families for m in FAMILY_MODES[f]]
+    out = pd.DataFrame(rows)
+    # Gains relatifs au pipeline dense documenté de la même famille
+    dense = out[out["mode"] == "dense"].set_index("famille")
+    for col, gain in (("matrice_mo", "gain_matrice_pct"), ("pic_mo", "gain_pic_pct"), ("fit_s", "gain_fit_pct")):
+        ref = out["famille"].map(dense[col])
+        out[gain] = (100 * (1 - out[col] / ref)).round(1)
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mémoire et durée d'ajustement : dense, CSR ou catégories natives.")
+    parser.add_argument("--families", nargs="+", default=list(FAMILY_MODES), choices=list(FAMILY_MODES))
+    parser.add_argument("--smote", action="store_true", help="ajoute SMOTE(k_neighbors=3) avant le modèle")
+    parser.add_argument("--max-rows", type=int)
+    parser.add_argument("--output", help="CSV où écrire le rapport")
+    args = parser.parse_args(argv)
+    out = report(args.families, args.smote, args.max_rows)
+    print(out.to_string(index=False))
+    if args.output:
+        out.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
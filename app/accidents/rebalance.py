@@ -0,0 +1,219 @@
+"""Rééquilibrage des classes à mémoire bornée : SMOTE partitionné ou pondération.
+
+``SMOTE(k_neighbors=3)`` cherche les voisins de chaque classe minoritaire sur toutes ses
+lignes à la fois (arbre ou force brute sur la classe entière). ``PartitionedSMOTE``
+découpe d'abord chaque classe en feuilles d'au plus ``leaf_size`` lignes par un arbre de
+projections aléatoires (coupe à la médiane d'une direction tirée au hasard), puis cherche
+les k voisins exactement *dans* chaque feuille : une matrice de distances
+``leaf_size x leaf_size`` à la fois, quelle que soit la taille du jeu. Les voisins sont
+donc approchés (deux points proches séparés par une coupe ne se voient pas).
+
+Les distances sont calculées sur les variables standardisées par classe, à la volée
+feuille par feuille, sans copie standardisée du jeu ; l'interpolation se fait dans
+l'espace d'origine. L'échantillonneur expose ``fit_resample`` et s'insère dans un
+``imblearn.pipeline.Pipeline`` à la place de ``SMOTE``.
+
+Sans lignes synthétiques : ``class_weights_dict`` (poids ``balanced`` du notebook) et
+``sample_weights`` pour les modèles qui acceptent ``sample_weight`` ;
+``class_weight="balanced"`` en est l'équivalent pour HGB, RF ou la régression logistique.
+
+Banc d'essai (durée, pic mémoire, F1 macro sur ``grav_order_max``) :
+``PYTHONPATH=app python -m accidents.rebalance [--scale 10]``
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator
+
+LEAF_SIZE = 1024
+STRATEGIES = ("aucun", "sample_weight", "smote", "partitioned")
+
+
+# -- Pondération -------------------------------------------------------------------
+def class_weights_dict(y):
+    """Poids ``balanced`` par classe (n / (K x n_classe)) et classes triées, comme le notebook."""
+    classes, counts = np.unique(y, return_counts=True)
+    weights = len(y) / (len(classes) * counts)
+    return dict(zip(classes.tolist(), weights.tolist())), classes
+
+
+def sample_weights(y, weights=None):
+    """Poids par ligne (float32) ; remplace ``np.vectorize(cw.get)(y)`` du notebook."""
+    if weights is None:
+        weights, _ = class_weights_dict(y)
+    classes = np.array(sorted(weights))
+    table = np.array([weights[c] for c in classes], dtype=np.float32)
+    return table[np.searchsorted(classes, y)]
+
+
+# -- SMOTE partitionné --------------------------------------------------------------
+def partition(X, idx, scale, leaf_size, rng):
+    """Feuilles (tableaux d'indices) d'un arbre de projections aléatoires sur ``X[idx]``."""
+    leaves, stack = [], [idx]
+    while stack:
+        part = stack.pop()
+        if len(part) <= leaf_size:
+            leaves.append(part)
+            continue
+        direction = (rng.standard_normal(X.shape[1]) / scale).astype(np.float32)
+        proj = X[part] @ direction
+        half = len(part) // 2
+        cut = np.argpartition(proj, half)
+        stack += [part[cut[:half]], part[cut[half:]]]
+    return leaves
+
+
+def leaf_neighbors(Z, k):
+    """k plus proches voisins (hors soi-même) de chaque ligne de ``Z``, par force brute."""
+    sq = np.einsum("ij,ij->i", Z, Z)
+    d = sq[:, None] + sq[None, :] - 2 * (Z @ Z.T)
+    np.fill_diagonal(d, np.inf)
+    return np.argpartition(d, k - 1, axis=1)[:, :k]
+
+
+class PartitionedSMOTE(BaseEstimator):
+    """SMOTE dont la recherche de voisins est bornée à des feuilles de ``leaf_size`` lignes.
+
+    ``sampling_strategy`` : ``"auto"`` (chaque classe portée à l'effectif de la plus
+    grande) ou dictionnaire ``{classe: effectif visé}`` comme ``make_smote_strategy``.
+    """
+
+    def __init__(self, sampling_strategy="auto", k_neighbors=3, leaf_size=LEAF_SIZE, random_state=None):
+        self.sampling_strategy = sampling_strategy
+        self.k_neighbors = k_neighbors
+        self.leaf_size = leaf_size
+        self.random_state = random_state
+
+    def _targets(self, y):
+        classes, counts = np.unique(y, return_counts=True)
+        if self.sampling_strategy == "auto":
+            return {c: int(counts.max()) for c in classes.tolist()}
+        return dict(self.sampling_strategy)
+
+    def fit(self, X, y):
+        return self
+
+    def fit_resample(self, X, y):
+        X = np.asarray(X, dtype=np.float32)
+        y = np.asarray(y)
+        rng = np.random.default_rng(self.random_state)
+        targets = {c: t for c, t in self._targets(y).items() if (y == c).sum() >= 2}
+        n_new = {c: max(0, t - int((y == c).sum())) for c, t in targets.items()}
+        # Sortie allouée une fois : lignes d'origine puis lignes synthétiques écrites en place
+        out_X = np.empty((len(y) + sum(n_new.values()), X.shape[1]), dtype=np.float32)
+        out_y = np.empty(len(out_X), dtype=y.dtype)
+        out_X[:len(y)], out_y[:len(y)] = X, y
+        pos = len(y)
+        for cls, n_cls in n_new.items():
+            if n_cls == 0:
+                continue
+            idx = np.flatnonzero(y == cls)
+            scale = X[idx].std(axis=0)
+            scale[scale == 0] = 1
+            leaves = partition(X, idx, scale, self.leaf_size, rng)
+            sizes = np.array([len(leaf) for leaf in leaves])
+            for leaf, n in zip(leaves, rng.multinomial(n_cls, sizes / sizes.sum())):
+                if n == 0:
+                    continue
+                Xl = X[leaf]
+                k = min(self.k_neighbors, len(leaf) - 1)
+                rows = rng.integers(len(leaf), size=n)
+                if k == 0:   # feuille d'une seule ligne : simple duplication
+                    out_X[pos:pos + n] = Xl[rows]
+                else:
+                    nbrs = leaf_neighbors(Xl / scale, k)[rows, rng.integers(k, size=n)]
+                    gap = rng.random(n, dtype=np.float32)[:, None]
+                    out_X[pos:pos + n] = Xl[rows] + gap * (Xl[nbrs] - Xl[rows])
+                out_y[pos:pos + n] = cls
+                pos += n
+        return out_X, out_y
+
+
+# -- Banc d'essai ------------------------------------------------------------------
+def make_resampler(strategy, y, seed=42, leaf_size=LEAF_SIZE):
+    """SMOTE puis RUS, avec les cibles du notebook (``hgb_smote_rus``) ; ``None`` sinon."""
+    from imblearn.over_sampling import SMOTE
+    from imblearn.pipeline import Pipeline
+
+    from .train import resampling_steps
+
+    if strategy not in ("smote", "partitioned"):
+        return None
+    if strategy == "smote":
+        def sampler(target, k):
+            return SMOTE(sampling_strategy=target, k_neighbors=k, random_state=seed)
+    else:
+        def sampler(target, k):
+            return PartitionedSMOTE(sampling_strategy=target, k_neighbors=k, leaf_size=leaf_size,
+                                    random_state=seed)
+    return Pipeline(resampling_steps(y, sampler, seed))
+
+
+def measure(strategy, X, y, Xt, yt, seed=42, leaf_size=LEAF_SIZE):
+    """Durées de rééquilibrage et d'ajustement, pic d'allocation, F1 macro (HGB)."""
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from sklearn.metrics import f1_score
+
+    model = HistGradientBoostingClassifier(random_state=seed)
+    resampler = make_resampler(strategy, y, seed, leaf_size)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    weights = None
+    if resampler is not None:
+        X, y = resampler.fit_resample(X, y)
+    elif strategy == "sample_weight":
+        weights = sample_weights(y)
+    rebalance_s = time.perf_counter() - t0
+    _, peak_rebalance = tracemalloc.get_traced_memory()
+    t0 = time.perf_counter()
+    model.fit(X, y, sample_weight=weights)
+    fit_s = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "strategie": strategy, "n_lignes": len(y),
+        "reequilibrage_s": round(rebalance_s, 3), "fit_s": round(fit_s, 3),
+        "pic_reequilibrage_mo": round(peak_rebalance / 2 ** 20, 1), "pic_total_mo": round(peak / 2 ** 20, 1),
+        "f1_macro": round(float(f1_score(yt, model.predict(Xt), average="macro")), 4),
+    }
+
+
+def scaled(X, y, scale, seed=42):
+    """Jeu répété ``scale`` fois avec un léger bruit, pour mesurer au-delà de l'échantillon."""
+    if scale <= 1:
+        return np.asarray(X), np.asarray(y)
+    rng = np.random.default_rng(seed)
+    X = np.tile(np.asarray(X), (scale, 1))
+    X += rng.normal(0, 0.01, X.shape).astype(np.float32)
+    return X, np.tile(np.asarray(y), scale)
+
+
+def bench(strategies=STRATEGIES, scale=1, leaf_size=LEAF_SIZE, seed=42):
+    from .train import TRAIN_DIR, load_split, materialize
+
+    if not (TRAIN_DIR / "meta.json").exists():
+        materialize()
+    X, y = load_split(TRAIN_DIR, "train")
+    Xt, yt = load_split(TRAIN_DIR, "test")
+    X, y = scaled(X, y, scale, seed)
+    return pd.DataFrame([measure(s, X, y, Xt, yt, seed, leaf_size) for s in strategies])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rééquilibrage des classes : durée, mémoire et F1 macro.")
+    parser.add_argument("--strategies", nargs="+", default=list(STRATEGIES), choices=STRATEGIES)
+    parser.add_argument("--scale", type=int, default=1, help="répète le jeu d'entraînement (avec bruit)")
+    parser.add_argument("--leaf-size", type=int, default=LEAF_SIZE)
+    parser.add_argument("--output", help="CSV où écrire le rapport")
+    args = parser.parse_args(argv)
+    out = bench(args.strategies, args.scale, args.leaf_size)
+    print(out.to_string(index=False))
+    if args.output:
+        out.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
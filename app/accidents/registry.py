@@ -0,0 +1,314 @@
+"""Registre local des modèles et artefacts (scaler, RandomForest, ...).
+
+Les artefacts sont décrits par des manifestes texte du même format que
+``models/lien_release_modèle_rf.txt`` (une ligne ``Libellé : URL``, avec un
+``sha256=<hex>`` optionnel en fin de ligne). La version est le tag de la release
+GitHub présent dans l'URL (``v1.0``, ``V1.1``, ...).
+
+Résolution d'un artefact ``(fichier, version)`` :
+
+1. ``models/<version>/<fichier>`` s'il existe déjà ;
+2. téléchargement depuis l'URL du manifeste vers ``models/<version>/`` (sauf mode hors-ligne) ;
+3. en mode hors-ligne uniquement : anciens emplacements non versionnés
+   (``models/<fichier>`` puis la racine du dépôt).
+
+Chaque fichier est vérifié par son empreinte SHA-256 (celle du manifeste si elle est
+renseignée, sinon celle enregistrée dans ``models/<version>/SHA256SUMS`` au
+téléchargement). L'objet désérialisé est gardé en mémoire une seule fois par
+processus et partagé par toutes les sessions Streamlit ; l'empreinte d'un fichier
+n'est recalculée que si sa taille ou sa date de modification change. Téléchargement et
+désérialisation se font sous un verrou propre à l'artefact : le chargement d'un
+modèle ne bloque pas les sessions qui utilisent les artefacts déjà en cache.
+
+Une erreur réseau au téléchargement (connexion, délai, statut HTTP) est levée en
+``ArtifactUnavailable``.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+import joblib
+
+from .config import MODELS_DIR, ROOT_DIR, env_flag
+
+MANIFEST_GLOB = "lien_release_*.txt"
+SUMS_FILE = "SHA256SUMS"
+
+_URL_RE = re.compile(r"(https?://\S+)")
+_SHA_RE = re.compile(r"sha256=([0-9a-fA-F]{64})")
+
+
+class ArtifactUnavailable(RuntimeError):
+    """Téléchargement d'un artefact impossible (réseau, délai dépassé, statut HTTP)."""
+
+
+@dataclass(frozen=True)
+class Artifact:
+    """Une entrée de manifeste."""
+    label: str
+    filename: str
+    version: str
+    url: str
+    sha256: str = None
+
+
+@dataclass(frozen=True)
+class LoadedArtifact:
+    """Un artefact chargé : l'objet Python et d'où il vient."""
+    obj: object
+    filename: str
+    version: str
+    path: Path
+    sha256: str
+
+
+def parse_manifest(path):
+    """Lit un manifeste ``Libellé : URL [sha256=...]`` et renvoie la liste des artefacts."""
+    artifacts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            m = _URL_RE.search(line)
+            if not m:
+                continue
+            url = m.group(1)
+            parts = url.rstrip("/").split("/")
+            if len(parts) < 2:
+                continue
+            sha = _SHA_RE.search(line)
+            label = line[:m.start()].split(":")[0].strip()
+            artifacts.append(Artifact(
+                label=label,
+                filename=parts[-1],
+                version=parts[-2],
+                url=url,
+                sha256=sha.group(1).lower() if sha else None,
+            ))
+    return artifacts
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Empreinte SHA-256 d'un fichier, lue par blocs."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _read_sums(directory):
+    sums = {}
+    p = Path(directory) / SUMS_FILE
+    if p.exists():
+        for line in p.read_text(encoding="utf-8").splitlines():
+            parts = line.split()
+            if len(parts) == 2:
+                sums[parts[1]] = parts[0].lower()
+    return sums
+
+
+def _write_sum(directory, filename, sha):
+    sums = _read_sums(directory)
+    sums[filename] = sha
+    lines = [f"{h}  {name}" for name, h in sorted(sums.items())]
+    (Path(directory) / SUMS_FILE).write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def record_sum(path):
+    """Enregistre l'empreinte d'un artefact produit localement dans le SHA256SUMS de son dossier."""
+    path = Path(path)
+    sha = file_sha256(path)
+    _write_sum(path.parent, path.name, sha)
+    return sha
+
+
+class ModelRegistry:
+    """Résout, vérifie et garde en cache les artefacts de modèles.
+
+    ``offline`` : ne jamais accéder au réseau (par défaut : variable d'environnement
+    ``ACCIDENTS_OFFLINE``). ``max_entries`` : nombre d'objets gardés en mémoire, le
+    moins récemment utilisé est évincé au-delà.
+    """
+
+    def __init__(self, models_dir=MODELS_DIR, offline=None, max_entries=4, timeout=60):
+        self.models_dir = Path(models_dir)
+        self.offline = env_flag("ACCIDENTS_OFFLINE") if offline is None else offline
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._cache = OrderedDict()   # (filename, version) -> (stat, LoadedArtifact)
+        self._lock = threading.RLock()   # cache et verrous par artefact, jamais pendant un chargement
+        self._loading = {}               # (filename, version) -> verrou de téléchargement/désérialisation
+        self._hashes = {}                # chemin -> (stat, sha256) : un fichier inchangé n'est pas relu
+        self._artifacts = None
+
+    # -- Manifestes ----------------------------------------------------------
+    def artifacts(self):
+        """Tous les artefacts déclarés dans les manifestes de ``models/``."""
+        if self._artifacts is None:
+            found = []
+            for manifest in sorted(self.models_dir.glob(MANIFEST_GLOB)):
+                found.extend(parse_manifest(manifest))
+            self._artifacts = found
+        return self._artifacts
+
+    def versions(self, filename):
+        return sorted({a.version for a in self.artifacts() if a.filename == filename})
+
+    def find(self, filename, version=None):
+        """Entrée de manifeste pour ``filename`` (première déclarée si pas de version)."""
+        for a in self.artifacts():
+            if a.filename == filename and (version is None or a.version.lower() == version.lower()):
+                return a
+        return None
+
+    # -- Résolution ----------------------------------------------------------
+    def resolve(self, filename, version=None):
+        """Chemin local vérifié de l'artefact, téléchargé si besoin.
+
+        Renvoie ``(path, version, sha256)``. Lève ``FileNotFoundError`` si l'artefact
+        est introuvable (ou hors-ligne et absent), ``ValueError`` si l'empreinte ne
+        correspond pas, ``ArtifactUnavailable`` si le téléchargement échoue.
+        """
+        entry = self.find(filename, version)
+        if entry is not None:
+            version = entry.version
+        expected = entry.sha256 if entry else None
+
+        if version is not None:
+            vdir = self.models_dir / version
+            path = vdir / filename
+            if not path.exists() and not self.offline and entry is not None:
+                self._download(entry, path)
+            if path.exists():
+                expected = expected or _read_sums(vdir).get(filename)
+                sha = self.sha256(path)
+                if expected and sha != expected:
+                    raise ValueError(
+                        f"Empreinte invalide pour {path} : {sha} (attendu {expected})")
+                return path, version, sha
+
+        if self.offline or version is None or entry is None:
+            for legacy in (self.models_dir / filename, ROOT_DIR / filename):
+                if legacy.exists():
+                    sha = self.sha256(legacy)
+                    if expected and sha != expected:
+                        raise ValueError(
+                            f"Empreinte invalide pour {legacy} : {sha} (attendu {expected})")
+                    return legacy, version or "local", sha
+
+        mode = " (mode hors-ligne)" if self.offline else ""
+        raise FileNotFoundError(f"Artefact introuvable : {filename} version {version}{mode}")
+
+    def sha256(self, path):
+        """Empreinte du fichier, recalculée seulement si sa taille ou sa date a changé."""
+        stat = _stat(path)
+        with self._lock:
+            hit = self._hashes.get(path)
+        if hit is not None and hit[0] == stat:
+            return hit[1]
+        sha = file_sha256(path)
+        with self._lock:
+            self._hashes[path] = (stat, sha)
+        return sha
+
+    def _download(self, entry, path):
+        import requests
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + f".part{os.getpid()}")
+        h = hashlib.sha256()
+        try:
+            with requests.get(entry.url, stream=True, timeout=self.timeout) as r:
+                r.raise_for_status()
+                with open(tmp, "wb") as f:
+                    for block in r.iter_content(chunk_size=1 << 20):
+                        f.write(block)
+                        h.update(block)
+        except requests.RequestException as e:
+            tmp.unlink(missing_ok=True)
+            raise ArtifactUnavailable(f"Téléchargement impossible de {entry.url} : {e}") from e
+        sha = h.hexdigest()
+        if entry.sha256 and sha != entry.sha256:
+            tmp.unlink(missing_ok=True)
+            raise ValueError(f"Empreinte invalide pour {entry.url} : {sha} (attendu {entry.sha256})")
+        # Remplacement atomique : un autre processus ne voit jamais de fichier partiel
+        os.replace(tmp, path)
+        _write_sum(path.parent, path.name, sha)
+
+    # -- Chargement et cache -------------------------------------------------
+    def load(self, filename, version=None):
+        """Charge l'artefact (``joblib.load``) une seule fois par processus."""
+        key = (filename, version)
+        loaded = self._cached(key)
+        if loaded is not None:
+            return loaded
+        with self._lock:
+            file_lock = self._loading.setdefault(key, threading.Lock())
+        with file_lock:
+            # Une autre session a pu terminer le chargement pendant l'attente
+            loaded = self._cached(key)
+            if loaded is not None:
+                return loaded
+            path, resolved_version, sha = self.resolve(filename, version)
+            loaded = LoadedArtifact(
+                obj=joblib.load(path),
+                filename=filename,
+                version=resolved_version,
+                path=path,
+                sha256=sha,
+            )
+            with self._lock:
+                self._cache[key] = (_stat(path), loaded)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+            return loaded
+
+    def _cached(self, key):
+        """Artefact en cache s'il est toujours à jour sur le disque, sinon ``None``."""
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is None:
+                return None
+            stat, loaded = hit
+            try:
+                current = _stat(loaded.path)
+            except OSError:   # fichier supprimé (dossier de version nettoyé) : nouvelle résolution
+                current = None
+            if current == stat:
+                self._cache.move_to_end(key)
+                return loaded
+            del self._cache[key]
+            return None
+
+    def evict(self, filename=None, version=None):
+        """Retire du cache un artefact (ou tous si ``filename`` est None)."""
+        with self._lock:
+            for key in list(self._cache):
+                if filename is None or (key[0] == filename and (version is None or key[1] == version)):
+                    del self._cache[key]
+
+    def cached(self):
+        """Liste des artefacts actuellement en mémoire (du plus ancien au plus récent)."""
+        with self._lock:
+            return [loaded for _, loaded in self._cache.values()]
+
+
+def _stat(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+_REGISTRY = None
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_registry():
+    """Registre partagé par tout le processus (donc par toutes les sessions)."""
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            _REGISTRY = ModelRegistry()
+        return _REGISTRY
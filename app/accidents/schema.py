@@ -0,0 +1,135 @@
+"""Schéma de types des quatre tables BAAC, appliqué dès la lecture des CSV.
+
+Les codes (``grav``, ``catv``, ``secu``, ...) tiennent sur un octet : ils sont lus
+directement en ``int8`` (ou ``Int8`` nullable quand la colonne contient des valeurs
+manquantes), les identifiants textuels répétés (``dep``, ``com``, ``num_veh``) en
+``category``. Appliquer le schéma pendant ``read_csv`` évite de matérialiser des
+colonnes float64/object puis de les réduire après coup, comme le faisaient
+``downcast_numeric`` et ``as_category`` dans les notebooks.
+
+Particularité 2009 : le fichier complet ``caracteristiques_2009.csv`` est séparé par
+des tabulations. Le séparateur est donc détecté sur la ligne d'en-tête.
+
+Rapport mémoire : ``PYTHONPATH=app python -m accidents.schema``
+"""
+import argparse
+import hashlib
+import json
+
+import pandas as pd
+
+from .tracing import traced
+
+SCHEMAS = {
+    "caracteristiques": {
+        "Num_Acc": "int64",
+        "an": "int8", "mois": "int8", "jour": "int8",
+        "hrmn": "str",
+        "lum": "int8", "agg": "int8", "int": "Int8",
+        "atm": "Int8", "col": "Int8",
+        "com": "category", "adr": "str", "gps": "category",
+        "lat": "float64", "long": "str",
+        "dep": "category",
+    },
+    "usagers": {
+        "Num_Acc": "int64",
+        "place": "Int8", "catu": "int8", "grav": "int8", "sexe": "int8",
+        "trajet": "Int8", "secu": "Int8",
+        "locp": "Int8", "actp": "Int8", "etatp": "Int8",
+        "an_nais": "Int16",
+        "num_veh": "category",
+    },
+    "lieux": {
+        "Num_Acc": "int64",
+        "catr": "Int8", "voie": "str", "v1": "Int8", "v2": "category",
+        "circ": "Int8", "nbv": "Int8",
+        "pr": "float32", "pr1": "float32",
+        "vosp": "Int8", "prof": "Int8", "plan": "Int8",
+        "lartpc": "float32", "larrout": "float32",
+        "surf": "Int8", "infra": "Int8", "situ": "Int8", "env1": "Int8",
+    },
+    "vehicules": {
+        "Num_Acc": "int64",
+        "senc": "Int8", "catv": "int8", "occutc": "int16",
+        "obs": "Int8", "obsm": "Int8", "choc": "Int8", "manv": "Int8",
+        "num_veh": "category",
+    },
+}
+
+ENCODING = "latin1"
+
+
+def schema_fingerprint(table):
+    """Empreinte courte du schéma : sert à invalider les partitions écrites avec un ancien schéma."""
+    raw = json.dumps(SCHEMAS[table], sort_keys=True).encode()
+    return hashlib.sha256(raw).hexdigest()[:12]
+
+
+def sniff_sep(path, encoding=ENCODING):
+    """Séparateur du fichier : tabulation si l'en-tête en contient une (2009), sinon virgule."""
+    with open(path, encoding=encoding) as f:
+        header = f.readline()
+    return "\t" if "\t" in header else ","
+
+
+@traced("schema.read_csv")
+def read_csv(path, table, usecols=None, **kwargs):
+    """``pd.read_csv`` avec le schéma de ``table`` appliqué pendant l'analyse.
+
+    Seules les colonnes du schéma présentes dans le fichier reçoivent un type imposé ;
+    les autres restent inférées par pandas.
+    """
+    sep = sniff_sep(path)
+    with open(path, encoding=ENCODING) as f:
+        header = [c.strip().strip('"') for c in f.readline().rstrip("\n").split(sep)]
+    wanted = header if usecols is None else [c for c in header if c in set(usecols)]
+    dtype = {c: t for c, t in SCHEMAS[table].items() if c in wanted}
+    return pd.read_csv(path, sep=sep, encoding=ENCODING, usecols=wanted, dtype=dtype,
+                       low_memory=False, **kwargs)
+
+
+def apply_schema(df, table):
+    """Convertit un DataFrame déjà chargé vers le schéma (colonnes connues uniquement)."""
+    for c, t in SCHEMAS[table].items():
+        if c in df.columns and str(df[c].dtype) != t:
+            df[c] = df[c].astype(t)
+    return df
+
+
+def memory_report(tables=None, annees=None, data_dir=None):
+    """Octets occupés par chaque table concaténée : lecture inférée vs lecture avec schéma."""
+    from .store import DATA_DIR, TABLES, discover_annees, source_path   # import local : store dépend de schema
+
+    data_dir = DATA_DIR if data_dir is None else data_dir
+    rows = []
+    for table in tables or TABLES:
+        paths = [source_path(table, a, data_dir) for a in (annees or discover_annees((table,), data_dir))]
+        paths = [p for p in paths if p.exists()]
+        if not paths:
+            continue
+        infer = pd.concat([pd.read_csv(p, sep=sniff_sep(p), encoding=ENCODING, low_memory=False)
+                           for p in paths], ignore_index=True)
+        typed = pd.concat([read_csv(p, table) for p in paths], ignore_index=True)
+        typed = apply_schema(typed, table)   # les catégories de chaque année sont réunies
+        avant = int(infer.memory_usage(deep=True).sum())
+        apres = int(typed.memory_usage(deep=True).sum())
+        rows.append({
+            "table": table, "lignes": len(typed),
+            "octets_avant": avant, "octets_apres": apres,
+            "gain_pct": round(100 * (1 - apres / avant), 1),
+        })
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare la mémoire des tables avec et sans schéma.")
+    parser.add_argument("--output", help="CSV où écrire le rapport")
+    args = parser.parse_args(argv)
+    report = memory_report()
+    print(report.to_string(index=False))
+    if args.output:
+        report.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Prédiction par lots : alignement des colonnes, standardisation et scoring vectorisés.
+
+Un ``Scorer`` associe le scaler et le modèle. Il accepte N lignes (DataFrame, tableau
+NumPy ou chemin de CSV), aligne les colonnes une seule fois via une table d'indices
+précalculée, puis standardise et prédit par blocs. Classes et probabilités sont
+obtenues en un seul appel à ``predict_proba`` (la classe prédite est l'argmax, comme
+le fait ``predict`` pour les forêts et le boosting de scikit-learn).
+"""
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .tracing import traced
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+
+@dataclass
+class ScoreResult:
+    """Résultat d'un scoring : classes prédites et probabilités (N x n_classes)."""
+    classes: np.ndarray
+    pred: np.ndarray
+    proba: np.ndarray = None
+
+    def __len__(self):
+        return len(self.pred)
+
+    @property
+    def confidence(self):
+        """Probabilité de la classe prédite (None si le modèle n'a pas de predict_proba)."""
+        return None if self.proba is None else self.proba.max(axis=1)
+
+    def to_frame(self):
+        out = pd.DataFrame({"pred": self.pred})
+        if self.proba is not None:
+            for j, c in enumerate(self.classes):
+                out[f"proba_{c}"] = self.proba[:, j]
+        return out
+
+
+class Scorer:
+    """Scaler + modèle, appliqués par blocs vectorisés.
+
+    ``feature_names`` : ordre des colonnes attendu. Par défaut ``feature_names_in_`` du
+    scaler (ou du modèle) ; si aucun des deux n'en a, les colonnes sont prises dans
+    l'ordre fourni et seul leur nombre est contrôlé. ``sha256`` : empreinte(s) des
+    artefacts chargés, qui identifie le modèle servi (clé du cache de prédictions).
+    """
+
+    def __init__(self, scaler, model, feature_names=None, chunk_size=DEFAULT_CHUNK_SIZE, version=None,
+                 sha256=None):
+        self.scaler = scaler
+        self.model = model
+        self.chunk_size = chunk_size
+        self.version = version
+        self.sha256 = sha256
+        if feature_names is None:
+            for est in (scaler, model):
+                if est is not None and hasattr(est, "feature_names_in_"):
+                    feature_names = list(est.feature_names_in_)
+                    break
+        self.feature_names = None if feature_names is None else list(feature_names)
+        ref = scaler if scaler is not None else model
+        self.n_features = len(self.feature_names) if self.feature_names else getattr(ref, "n_features_in_", None)
+        self.classes = np.asarray(getattr(model, "classes_", []))
+        self.has_proba = hasattr(model, "predict_proba")
+        self._index_maps = {}   # tuple(colonnes d'entrée) -> indices vers feature_names
+
+    @classmethod
+    def from_registry(cls, registry, scaler_file, model_file, version=None, compact=True, **kwargs):
+        """Construit un ``Scorer`` à partir des artefacts du registre de modèles.
+
+        ``compact`` : utilise l'export memmap ``<modèle>.forest`` (``accidents.export``)
+        placé à côté du pickle s'il en provient, sans désérialiser le pickle.
+        """
+        scaler = registry.load(scaler_file, version=version) if scaler_file else None
+        scaler_sha = [scaler.sha256] if scaler else []
+        scaler = scaler.obj if scaler else None
+        if compact:
+            from .export import load_for
+
+            path, resolved, sha = registry.resolve(model_file, version)
+            model = load_for(path, sha)
+            if model is not None:
+                return cls(scaler, model, version=resolved, sha256="+".join(scaler_sha + [sha]), **kwargs)
+        model = registry.load(model_file, version=version)
+        return cls(scaler, model.obj, version=model.version, sha256="+".join(scaler_sha + [model.sha256]), **kwargs)
+
+    # -- Alignement ------------------------------------------------------------
+    def index_map(self, columns):
+        """Indices (dans ``columns``) des colonnes attendues, calculés une fois par schéma."""
+        key = tuple(columns)
+        idx = self._index_maps.get(key)
+        if idx is None:
+            if self.feature_names is None:
+                if self.n_features is not None and len(key) != self.n_features:
+                    raise ValueError(
+                        f"{len(key)} colonnes reçues, {self.n_features} attendues par le modèle")
+                idx = np.arange(len(key))
+            else:
+                idx = pd.Index(key).get_indexer(self.feature_names)
+                missing = [c for c, i in zip(self.feature_names, idx) if i < 0]
+                if missing:
+                    raise KeyError(f"Colonnes manquantes pour le modèle : {missing}")
+            self._index_maps[key] = idx
+        return idx
+
+    def align(self, X):
+        """Matrice float64 (N x n_features) dans l'ordre attendu par le scaler."""
+        if isinstance(X, pd.Series):
+            X = X.to_frame().T
+        if isinstance(X, pd.DataFrame):
+            idx = self.index_map(X.columns)
+            if len(idx) == X.shape[1] and np.array_equal(idx, np.arange(len(idx))):
+                return X.to_numpy(dtype=np.float64)
+            return X.iloc[:, idx].to_numpy(dtype=np.float64)
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if self.n_features is not None and X.shape[1] != self.n_features:
+            raise ValueError(f"{X.shape[1]} colonnes reçues, {self.n_features} attendues par le modèle")
+        return X
+
+    def transform(self, X_aligned):
+        if self.scaler is None:
+            return X_aligned
+        if self.feature_names is not None and hasattr(self.scaler, "feature_names_in_"):
+            # Évite l'avertissement "X does not have valid feature names"
+            return self.scaler.transform(pd.DataFrame(X_aligned, columns=self.feature_names, copy=False))
+        return self.scaler.transform(X_aligned)
+
+    # -- Scoring ---------------------------------------------------------------
+    def _score_block(self, X_aligned):
+        Xs = self.transform(X_aligned)
+        if self.has_proba:
+            proba = self.model.predict_proba(Xs)
+            return self.classes[proba.argmax(axis=1)], proba
+        return np.asarray(self.model.predict(Xs)), None
+
+    def _blocks(self, X):
+        if isinstance(X, (str, Path)):
+            for chunk in pd.read_csv(X, chunksize=self.chunk_size, low_memory=False):
+                yield self.align(chunk)
+            return
+        Xa = self.align(X)
+        for start in range(0, len(Xa), self.chunk_size):
+            yield Xa[start:start + self.chunk_size]
+
+    @traced("scoring.score")
+    def score(self, X):
+        """Score N lignes en une passe : renvoie un ``ScoreResult``."""
+        preds, probas = [], []
+        for block in self._blocks(X):
+            if len(block) == 0:
+                continue
+            pred, proba = self._score_block(block)
+            preds.append(pred)
+            if proba is not None:
+                probas.append(proba)
+        if not preds:
+            n_cls = len(self.classes)
+            return ScoreResult(self.classes, np.empty(0, dtype=self.classes.dtype),
+                               np.empty((0, n_cls)) if self.has_proba else None)
+        return ScoreResult(
+            classes=self.classes,
+            pred=np.concatenate(preds),
+            proba=np.vstack(probas) if probas else None,
+        )
@@ -0,0 +1,293 @@
+"""Recherche d'hyperparamètres par divisions successives (successive halving).
+
+La page Modélisation montre un ``RandomizedSearchCV`` limité à 5 candidats, ``cv=2``
+et ``n_jobs=1`` faute de mémoire. Ici :
+
+- les candidats sont évalués par un pool de processus qui ouvrent tous la même copie
+  memmap de X (``data/store/train/X_<jeu>.npy``) : aucune copie par processus ;
+- à chaque tour, les candidats sont évalués sur ``r`` lignes (``r`` multiplié par
+  ``factor`` d'un tour à l'autre) et seul le meilleur tiers (``1/factor``) passe au
+  tour suivant : la plupart des configurations sont écartées après un ajustement
+  sur un petit échantillon ;
+- chaque score (paramètres, nombre de lignes, pli) est ajouté à un cache JSONL
+  (``reports/search_cache/<estimateur>_<jeu>.jsonl``) : une recherche interrompue reprend
+  là où elle s'était arrêtée.
+
+Comme le ``search.fit(X_train_bal, y_train_bal)`` de la page, la recherche porte par
+défaut sur le jeu équilibré ``train_bal`` (RUS puis SMOTE, ``train.materialize_balanced``),
+écrit à côté de ``X_train.npy`` au premier lancement. Les tours s'arrêtent dès qu'il ne
+reste qu'un candidat : le dernier tour départage au plus ``factor`` candidats sur toutes
+les lignes.
+
+Ligne de commande : ``PYTHONPATH=app python -m accidents.search hgb --n-candidates 81``
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+
+from .config import MODELS_DIR, REPORTS_DIR
+from .train import BALANCED_PART, TRAIN_DIR, load_split
+
+CACHE_DIR = REPORTS_DIR / "search_cache"
+
+
+def param_space(name):
+    """Distributions de la page Modélisation (HGB) élargies, et équivalents RF / BRF."""
+    from scipy.stats import loguniform, randint, uniform
+
+    if name == "hgb":
+        return {
+            "learning_rate": loguniform(0.02, 0.3),
+            "max_iter": randint(100, 400),
+            "max_depth": randint(3, 12),
+            "min_samples_leaf": randint(20, 200),
+            "l2_regularization": loguniform(1e-4, 10),
+            "max_leaf_nodes": randint(15, 63),
+        }
+    if name in ("rf", "brf"):
+        return {
+            "n_estimators": randint(100, 400),
+            "max_depth": randint(8, 30),
+            "min_samples_leaf": randint(1, 20),
+            "max_features": uniform(0.1, 0.6),
+        }
+    raise ValueError(f"Pas d'espace de recherche pour {name} (hgb, rf, brf)")
+
+
+def make_estimator(name, params, seed=42):
+    if name == "hgb":
+        from sklearn.ensemble import HistGradientBoostingClassifier
+        return HistGradientBoostingClassifier(random_state=seed, **params)
+    if name == "rf":
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(class_weight="balanced_subsample", random_state=seed, n_jobs=1, **params)
+    if name == "brf":
+        from imblearn.ensemble import BalancedRandomForestClassifier
+        return BalancedRandomForestClassifier(sampling_strategy="all", replacement=True, bootstrap=False,
+                                              random_state=seed, n_jobs=1, **params)
+    raise ValueError(f"Estimateur inconnu : {name}")
+
+
+# -- Évaluation dans les processus du pool ----------------------------------------
+_DATA = {}
+
+
+def _init_worker(data_dir, part):
+    # Ouverture unique des memmaps par processus : les pages sont partagées par le noyau
+    _DATA["X"], _DATA["y"] = load_split(data_dir, part)
+
+
+def _evaluate(name, params, train_idx, val_idx, seed):
+    from sklearn.metrics import f1_score
+
+    X, y = _DATA["X"], _DATA["y"]
+    t0 = time.perf_counter()
+    model = make_estimator(name, params, seed).fit(X[train_idx], y[train_idx])
+    score = f1_score(y[val_idx], model.predict(X[val_idx]), average="macro")
+    return float(score), time.perf_counter() - t0
+
+
+# -- Cache des scores --------------------------------------------------------------
+def data_fingerprint(data_dir, part):
+    """Empreinte du jeu de données : les scores en cache ne valent que pour ces données."""
+    x = Path(data_dir) / f"X_{part}.npy"
+    st = x.stat()
+    return hashlib.sha1(f"{x.name}:{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()[:12]
+
+
+def task_key(name, params, n_rows, fold, cv, seed, fingerprint):
+    raw = json.dumps([name, params, n_rows, fold, cv, seed, fingerprint], sort_keys=True)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class ScoreCache:
+    """Scores par (paramètres, lignes, pli) dans un fichier JSONL en ajout seul."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.scores = {}
+        if self.path.exists():
+            for line in self.path.read_text(encoding="utf-8").splitlines():
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue   # dernière ligne tronquée par une interruption
+                self.scores[rec["key"]] = rec["score"]
+
+    def get(self, key):
+        return self.scores.get(key)
+
+    def put(self, key, score, **info):
+        self.scores[key] = score
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": key, "score": score, **info}) + "\n")
+
+
+# -- Divisions successives ---------------------------------------------------------
+def _sample_params(name, n_candidates, seed):
+    from sklearn.model_selection import ParameterSampler
+
+    out = []
+    for p in ParameterSampler(param_space(name), n_candidates, random_state=seed):
+        out.append({k: (round(float(v), 6) if isinstance(v, (float, np.floating)) else int(v)) for k, v in p.items()})
+    return out
+
+
+def _folds(y, n_rows, cv, seed):
+    """Plis stratifiés sur un sous-échantillon stratifié de ``n_rows`` lignes (fixé par ``seed``)."""
+    from sklearn.model_selection import StratifiedKFold, StratifiedShuffleSplit
+
+    if n_rows < len(y):
+        sub, _ = next(StratifiedShuffleSplit(n_splits=1, train_size=n_rows, random_state=seed).split(
+            np.zeros(len(y)), y))
+        sub = np.sort(sub)
+    else:
+        sub = np.arange(len(y))
+    skf = StratifiedKFold(n_splits=cv, shuffle=True, random_state=seed)
+    return [(sub[tr], sub[va]) for tr, va in skf.split(np.zeros(len(sub)), y[sub])]
+
+
+def n_rounds_for(n_candidates, factor):
+    """Tours évalués : on garde ``ceil(n / factor)`` candidats jusqu'à en avoir au plus ``factor``."""
+    rounds = 1
+    while n_candidates > factor:
+        n_candidates = int(np.ceil(n_candidates / factor))
+        rounds += 1
+    return rounds
+
+
+def halving_search(name, n_candidates=27, factor=3, min_rows=None, cv=3, n_jobs=-1, seed=42,
+                   data_dir=TRAIN_DIR, part=BALANCED_PART, cache_dir=CACHE_DIR, log=print):
+    """Recherche par divisions successives ; renvoie le meilleur jeu de paramètres et l'historique."""
+    _, y = load_split(data_dir, part)
+    y = np.asarray(y)
+    n_total = len(y)
+    n_rounds = n_rounds_for(n_candidates, factor)
+    if min_rows is None:
+        min_rows = max(cv * 20, n_total // factor ** (n_rounds - 1))
+    fingerprint = data_fingerprint(data_dir, part)
+    cache = ScoreCache(Path(cache_dir) / f"{name}_{part}.jsonl")
+    n_jobs = os.cpu_count() if n_jobs in (None, -1) else n_jobs
+
+    candidates = _sample_params(name, n_candidates, seed)
+    history = []
+    computed = reused = 0
+    t_start = time.perf_counter()
+    ctx = get_context("spawn")
+    with ProcessPoolExecutor(max_workers=n_jobs, mp_context=ctx, initializer=_init_worker,
+                             initargs=(str(data_dir), part)) as pool:
+        for rnd in range(n_rounds):
+            n_rows = int(min(n_total, min_rows * factor ** rnd))
+            folds = _folds(y, n_rows, cv, seed)
+            scores = np.zeros((len(candidates), cv))
+            pending = {}
+            for ci, params in enumerate(candidates):
+                for fi, (tr, va) in enumerate(folds):
+                    key = task_key(name, params, n_rows, fi, cv, seed, fingerprint)
+                    cached = cache.get(key)
+                    if cached is not None:
+                        scores[ci, fi] = cached
+                        reused += 1
+                    else:
+                        pending[pool.submit(_evaluate, name, params, tr, va, seed)] = (ci, fi, key)
+            for fut in as_completed(pending):
+                ci, fi, key = pending[fut]
+                score, seconds = fut.result()
+                scores[ci, fi] = score
+                cache.put(key, score, params=candidates[ci], n_rows=n_rows, fold=fi, seconds=round(seconds, 3))
+                computed += 1
+            mean = scores.mean(axis=1)
+            for ci, params in enumerate(candidates):
+                history.append({"round": rnd, "n_rows": n_rows, "params": params,
+                                "f1_macro": round(float(mean[ci]), 4), "std": round(float(scores[ci].std()), 4)})
+            keep = max(1, int(np.ceil(len(candidates) / factor))) if rnd < n_rounds - 1 else 1
+            order = np.argsort(-mean, kind="stable")[:keep]
+            log(f"tour {rnd} : {len(candidates)} candidats sur {n_rows} lignes, meilleur F1 macro "
+                f"{mean[order[0]]:.4f} ({len(pending)} ajustements, {time.perf_counter() - t_start:.1f} s)")
+            candidates = [candidates[i] for i in order]
+            best_score = round(float(mean[order[0]]), 4)
+
+    return {
+        "estimator": name, "best_params": candidates[0], "best_f1_macro": best_score,
+        "n_candidates": n_candidates, "factor": factor, "cv": cv,
+        "n_rounds": n_rounds, "fits_computed": computed, "fits_reused": reused,
+        "elapsed_s": round(time.perf_counter() - t_start, 2), "history": history,
+    }
+
+
+def baseline_search(data_dir=TRAIN_DIR, part=BALANCED_PART, seed=42):
+    """Le ``RandomizedSearchCV`` HGB de la page Modélisation (5 candidats, cv=2, n_jobs=1)."""
+    from scipy.stats import randint, uniform
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from sklearn.model_selection import RandomizedSearchCV
+
+    X, y = load_split(data_dir, part)
+    param_dist = {
+        "learning_rate": uniform(0.05, 0.1),
+        "max_iter": randint(100, 200),
+        "max_depth": randint(3, 6),
+        "min_samples_leaf": randint(20, 60),
+    }
+    search = RandomizedSearchCV(HistGradientBoostingClassifier(random_state=seed), param_distributions=param_dist,
+                                n_iter=5, cv=2, scoring="f1_macro", n_jobs=1, random_state=seed)
+    t0 = time.perf_counter()
+    search.fit(X, y)
+    return {"best_params": search.best_params_, "best_f1_macro": round(float(search.best_score_), 4),
+            "elapsed_s": round(time.perf_counter() - t0, 2)}
+
+
+def main(argv=None):
+    from .registry import record_sum
+
+    parser = argparse.ArgumentParser(description="Recherche d'hyperparamètres par divisions successives.")
+    parser.add_argument("estimator", choices=("hgb", "rf", "brf"))
+    parser.add_argument("--n-candidates", type=int, default=27)
+    parser.add_argument("--factor", type=int, default=3)
+    parser.add_argument("--cv", type=int, default=3)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--part", default=BALANCED_PART, help="jeu matérialisé : train_bal (équilibré), train")
+    parser.add_argument("--compare", action="store_true", help="mesure aussi le RandomizedSearchCV de la page (HGB)")
+    parser.add_argument("--refit", metavar="VERSION", help="réentraîne le meilleur sur tout le jeu -> models/VERSION/")
+    args = parser.parse_args(argv)
+
+    from .train import materialize, materialize_balanced
+
+    source, balanced = TRAIN_DIR / "X_train.npy", TRAIN_DIR / f"X_{BALANCED_PART}.npy"
+    if not source.exists():
+        materialize()
+    # Jeu équilibré (re)construit s'il manque ou date d'avant le dernier X_train
+    if args.part == BALANCED_PART and (not balanced.exists()
+                                       or balanced.stat().st_mtime_ns < source.stat().st_mtime_ns):
+        print(f"Jeu équilibré {BALANCED_PART} : {materialize_balanced()}")
+    res = halving_search(args.estimator, args.n_candidates, args.factor, cv=args.cv,
+                         n_jobs=args.n_jobs, part=args.part)
+    if args.compare:
+        res["baseline"] = baseline_search(part=args.part)
+        print(f"RandomizedSearchCV (5 candidats, cv=2) : F1 macro {res['baseline']['best_f1_macro']} "
+              f"en {res['baseline']['elapsed_s']} s")
+    out = REPORTS_DIR / f"search_{args.estimator}.json"
+    out.write_text(json.dumps(res, indent=1), encoding="utf-8")
+    print(f"Meilleurs paramètres ({res['best_f1_macro']}) : {res['best_params']}")
+    print(f"{res['fits_computed']} ajustements calculés, {res['fits_reused']} repris du cache, "
+          f"{res['elapsed_s']} s -> {out}")
+    if args.refit:
+        import joblib
+
+        X, y = load_split(TRAIN_DIR, args.part)
+        model = make_estimator(args.estimator, res["best_params"]).fit(X, y)
+        path = MODELS_DIR / args.refit / f"search_{args.estimator}.joblib"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        joblib.dump(model, path)
+        print(f"Modèle réentraîné : {path} (sha256 {record_sum(path)[:12]})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""Service HTTP local de prédiction, avec regroupement des requêtes en micro-lots.
+
+Le service charge une seule fois le scaler et le modèle (registre de modèles, export
+memmap ``.forest`` si présent) puis répond sur :
+
+- ``POST /predict`` : corps JSON ``{"rows": [{"lum": 1, "secu": 0, ...}, ...]}`` ;
+  réponse ``{"classes": [...], "pred": [...], "proba": [[...], ...], "version": ...}`` ;
+- ``GET /health`` : version du modèle et compteurs (requêtes, lots, lignes, cache de
+  prédictions avec ``--cache``).
+
+Chaque requête est alignée sur les colonnes du modèle dans son propre thread puis
+confiée au ``MicroBatcher`` : un thread unique attend au plus ``max_wait_ms`` d'autres
+requêtes (ou ``max_batch`` lignes), empile les lignes et appelle une seule fois le
+prédicteur vectorisé, puis redécoupe le résultat par requête.
+
+``ServiceClient`` est le client utilisé par la page de prédiction lorsque la variable
+d'environnement ``ACCIDENTS_SERVICE_URL`` est définie.
+
+Ligne de commande : ``PYTHONPATH=app python -m accidents.service [--port 8765] [--max-wait-ms 5]``
+(test de charge : ``accidents.loadtest``)
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from .scoring import ScoreResult
+
+SERVICE_URL_ENV = "ACCIDENTS_SERVICE_URL"
+DEFAULT_PORT = 8765
+MAX_BATCH = 512
+MAX_WAIT_MS = 5.0
+REQUEST_TIMEOUT = 30
+
+# Artefacts servis par défaut : ceux de la page de prédiction
+MODEL_VERSION = "v1.0"
+SCALER_FILE = "Enora_scaler.joblib"
+MODEL_FILE = "Modele_Enora_rf.joblib"
+
+
+class MicroBatcher:
+    """Regroupe les lignes soumises par plusieurs threads en un seul appel à ``score``.
+
+    ``score`` reçoit une matrice (N x p) et renvoie un ``ScoreResult`` ; ``submit`` renvoie
+    un ``Future`` résolu avec le ``ScoreResult`` des seules lignes soumises.
+    """
+
+    def __init__(self, score, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.score = score
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.stats = {"requests": 0, "batches": 0, "rows": 0}
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, X):
+        future = Future()
+        self._queue.put((X, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first):
+        """Premier élément + ceux arrivés avant l'échéance ; ``None`` en fin de liste = arrêt."""
+        batch, n = [first], len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while n < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                batch.append(None)
+                break
+            batch.append(item)
+            n += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            stop = batch[-1] is None
+            items = [b for b in batch if b is not None]
+            self._flush(items)
+            if stop:
+                return
+
+    def _flush(self, items):
+        sizes = [len(X) for X, _ in items]
+        try:
+            res = self.score(np.vstack([X for X, _ in items]))
+        except Exception as exc:   # l'erreur est renvoyée à chaque requête du lot
+            for _, future in items:
+                future.set_exception(exc)
+            return
+        self.stats["requests"] += len(items)
+        self.stats["batches"] += 1
+        self.stats["rows"] += sum(sizes)
+        start = 0
+        for (_, future), n in zip(items, sizes):
+            proba = None if res.proba is None else res.proba[start:start + n]
+            future.set_result(ScoreResult(res.classes, res.pred[start:start + n], proba))
+            start += n
+
+
+# -- Serveur -----------------------------------------------------------------------
+def result_payload(res, version):
+    return {
+        "classes": res.classes.tolist(),
+        "pred": res.pred.tolist(),
+        "proba": None if res.proba is None else res.proba.round(6).tolist(),
+        "version": version,
+    }
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    server_version = "accidents-service/1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._send(404, {"error": f"Chemin inconnu : {self.path}"})
+        scorer = self.server.scorer
+        self._send(200, {"status": "ok", "version": scorer.version, "model": type(scorer.model).__name__,
+                         "features": scorer.feature_names, "classes": scorer.classes.tolist(),
+                         "max_batch": self.server.batcher.max_batch,
+                         "max_wait_ms": self.server.batcher.max_wait * 1000, **self.server.batcher.stats,
+                         "cache": scorer.cache.info() if hasattr(scorer, "cache") else None})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            return self._send(404, {"error": f"Chemin inconnu : {self.path}"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            rows = json.loads(self.rfile.read(length))["rows"]
+            X = self.server.scorer.align(pd.DataFrame.from_records(rows))
+        except (ValueError, KeyError, TypeError) as exc:
+            return self._send(400, {"error": f"{type(exc).__name__}: {exc}"})
+        try:
+            res = self.server.batcher.submit(X).result(timeout=REQUEST_TIMEOUT)
+        except Exception as exc:
+            return self._send(500, {"error": f"{type(exc).__name__}: {exc}"})
+        self._send(200, result_payload(res, self.server.scorer.version))
+
+
+class PredictionServer(ThreadingHTTPServer):
+    # File d'attente de connexions de 5 par défaut : au-delà, les SYN perdus coûtent 1 s
+    request_queue_size = 256
+    daemon_threads = True
+
+
+def make_server(scorer, host="127.0.0.1", port=DEFAULT_PORT, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS,
+                verbose=False):
+    """Serveur prêt à ``serve_forever`` ; ``port=0`` choisit un port libre."""
+    server = PredictionServer((host, port), PredictionHandler)
+    server.scorer = scorer
+    server.batcher = MicroBatcher(scorer.score, max_batch, max_wait_ms)
+    server.verbose = verbose
+    return server
+
+
+# -- Client ------------------------------------------------------------------------
+class ServiceClient:
+    """Client du service : ``score`` renvoie un ``ScoreResult`` comme ``Scorer.score``."""
+
+    def __init__(self, url=None, timeout=REQUEST_TIMEOUT):
+        url = url or os.environ.get(SERVICE_URL_ENV)
+        if not url:
+            raise ValueError(f"URL du service absente (variable {SERVICE_URL_ENV})")
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.version = None
+
+    def _request(self, path, payload=None):
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        req = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as r:
+                return json.loads(r.read())
+        except urllib.error.HTTPError as exc:
+            detail = json.loads(exc.read() or b"{}").get("error", exc.reason)
+            raise RuntimeError(f"Service de prédiction : HTTP {exc.code} : {detail}") from None
+
+    def health(self):
+        return self._request("/health")
+
+    def score(self, X):
+        if isinstance(X, pd.Series):
+            X = X.to_frame().T
+        rows = X.astype(object).where(X.notna(), None).to_dict(orient="records")
+        out = self._request("/predict", {"rows": rows})
+        self.version = out["version"]
+        proba = None if out["proba"] is None else np.asarray(out["proba"])
+        return ScoreResult(np.asarray(out["classes"]), np.asarray(out["pred"]), proba)
+
+
+def main(argv=None):
+    from .registry import get_registry
+    from .scoring import Scorer
+
+    parser = argparse.ArgumentParser(description="Service HTTP de prédiction avec micro-lots.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--version", default=MODEL_VERSION, help="version du registre (models/<version>/)")
+    parser.add_argument("--scaler", default=SCALER_FILE, help="fichier du scaler ('' : aucun)")
+    parser.add_argument("--model", default=MODEL_FILE)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="lignes au plus par appel au modèle")
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS, help="attente maximale d'un micro-lot")
+    parser.add_argument("--no-compact", action="store_true", help="ignore l'export .forest et charge le pickle")
+    parser.add_argument("--cache", action="store_true", help="cache des prédictions (accidents.cache)")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    scorer = Scorer.from_registry(get_registry(), args.scaler or None, args.model, version=args.version,
+                                  compact=not args.no_compact)
+    if args.cache:
+        from .cache import CachedScorer, get_cache
+
+        scorer = CachedScorer(scorer, get_cache())
+    server = make_server(scorer, args.host, args.port, args.max_batch, args.max_wait_ms, args.verbose)
+    host, port = server.server_address[:2]
+    print(f"Service de prédiction {type(scorer.model).__name__} {scorer.version} sur http://{host}:{port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""Couche de données partagée : tables Arrow en lecture seule, projetées en mémoire.
+
+Un ``st.cache_data`` qui renvoie un DataFrame complet le sérialise à l'écriture, puis
+le désérialise à chaque appel : chaque session reçoit sa propre copie et la mémoire
+du serveur croît avec le nombre d'utilisateurs connectés. Ici, chaque table (les
+quatre tables annuelles et la table par accident ``accidents``) est écrite une fois
+en Arrow IPC non compressé dans ``data/store/shared/<nom>-<empreinte>.arrow`` puis
+ouverte par ``pyarrow.memory_map`` : les colonnes pointent directement dans le fichier
+projeté, les pages correspondantes restent dans le cache du système et sont partagées
+par toutes les sessions (et par tous les processus servant l'application).
+
+``get_shared()`` renvoie l'instance du processus. ``table(nom, colonnes)`` donne une
+vue ``pyarrow.Table`` (immuable, sans copie, projection comprise) ; un résultat calculé
+depuis une table et mis en cache ailleurs prend ``snapshot_fingerprint(nom)`` en
+argument, pour être recalculé quand l'instantané change ; filtres, tris et
+pagination se font en ``pyarrow.compute`` et seule la page affichée est convertie en
+pandas. ``frame(nom, colonnes)`` convertit la projection demandée : les colonnes
+numériques sans valeur manquante restent des vues en lecture seule, les autres sont
+copiées (à réserver aux projections étroites).
+
+L'empreinte d'une table annuelle vient du manifeste de ``accidents.store`` (SHA-256
+des CSV sources, schéma), celle de la table par accident du manifeste de
+``accidents.pipeline`` (ou de l'échantillon ``mini`` quand il est la source retenue,
+cf. ``accidents.cube.resolve_source``). Elle est revérifiée au plus toutes les
+``REFRESH_SECONDS`` : une année ajoutée par ``accidents.update`` produit un nouveau
+fichier, les anciennes vues restant valides pour les sessions qui les détiennent.
+
+Contrôle « mémoire plate » (``tests/test_shared.py`` le lance sur les échantillons) :
+``PYTHONPATH=app python -m accidents.shared [--sessions 1 10 25 50] [--accidents 200000] [--check]``
+simule N sessions tenant chacune les cinq tables, servies par ``st.cache_data`` puis
+par cette couche, et compare la croissance du RSS par session.
+"""
+import argparse
+import gc
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import pyarrow as pa
+
+from .config import DATA_DIR
+from .store import STORE_DIR, TABLES, ingest, load_manifest, read_arrow
+from .tracing import rss_mb, traced
+
+MERGED = "accidents"
+NAMES = (*TABLES, MERGED)
+SHARED_SUBDIR = "shared"
+REFRESH_SECONDS = 30
+SESSIONS = (1, 10, 25, 50)
+MAX_MB_PER_SESSION = 0.5   # seuil de --check pour la couche partagée
+
+
+def _digest(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class SharedData:
+    """Tables projetées en mémoire, une seule fois par processus."""
+
+    def __init__(self, data_dir=DATA_DIR, store_dir=STORE_DIR, source="auto", refresh_seconds=REFRESH_SECONDS):
+        self.data_dir = Path(data_dir)
+        self.store_dir = Path(store_dir)
+        self.source = source
+        self.refresh_seconds = refresh_seconds
+        self._entries = {}   # nom -> (empreinte, table, date de vérification)
+        self._lock = threading.Lock()
+
+    @property
+    def shared_dir(self):
+        return self.store_dir / SHARED_SUBDIR
+
+    # -- Empreintes et instantanés ---------------------------------------------------
+    def _merged_source(self):
+        from .cube import resolve_source
+
+        return resolve_source(self.source, self.store_dir / "features")
+
+    def fingerprint(self, name):
+        """Empreinte du contenu de ``name`` ; convertit d'abord les CSV nouveaux ou modifiés."""
+        if name in TABLES:
+            ingest((name,), data_dir=self.data_dir, store_dir=self.store_dir)
+            entries = load_manifest(self.store_dir).get(name, {})
+            return _digest({a: [e["sha256"], e["schema"], e["layout"]] for a, e in entries.items()})
+        if self._merged_source() == "features":
+            from .pipeline import load_features_manifest
+
+            manifest = load_features_manifest(self.store_dir / "features")
+            return _digest(["features", manifest.get("version"),
+                            {a: e["sha256"] for a, e in manifest.get("annees", {}).items()}])
+        from .cube import MINI_FILE, MINI_GRAV_SHIFT
+
+        st = os.stat(MINI_FILE)
+        return _digest(["mini", MINI_GRAV_SHIFT, st.st_size, st.st_mtime_ns])
+
+    def snapshot_path(self, name, fingerprint):
+        return self.shared_dir / f"{name}-{fingerprint}.arrow"
+
+    def _read(self, name):
+        if name in TABLES:
+            return read_arrow(name, ensure=False, data_dir=self.data_dir, store_dir=self.store_dir)
+        if self._merged_source() == "features":
+            from .pipeline import read_features_arrow
+
+            return read_features_arrow(out_dir=self.store_dir / "features")
+        from .cube import read_mini
+
+        return pa.Table.from_pandas(read_mini(), preserve_index=False)
+
+    @traced("shared.build_snapshot", rows=None)
+    def build_snapshot(self, name, fingerprint):
+        """Écrit l'instantané IPC de ``name`` (un seul bloc par colonne, sans compression)."""
+        path = self.snapshot_path(name, fingerprint)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        t = self._read(name).unify_dictionaries().combine_chunks()
+        tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+        with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, t.schema) as writer:
+            writer.write_table(t)
+        os.replace(tmp, path)
+        # Anciennes versions : les vues déjà ouvertes restent valides (fichier supprimé
+        # mais toujours projeté tant qu'une vue le référence)
+        for old in self.shared_dir.glob(f"{name}-*.arrow"):
+            if old != path:
+                old.unlink(missing_ok=True)
+        return path
+
+    # -- Accès -----------------------------------------------------------------------
+    def _entry(self, name):
+        if name not in NAMES:
+            raise KeyError(f"Table inconnue : {name} (attendu : {', '.join(NAMES)})")
+        with self._lock:
+            entry = self._entries.get(name)
+            now = time.monotonic()
+            if entry is not None and now - entry[2] < self.refresh_seconds:
+                return entry
+            fp = self.fingerprint(name)
+            if entry is not None and entry[0] == fp:
+                entry = self._entries[name] = (fp, entry[1], now)
+                return entry
+            path = self.snapshot_path(name, fp)
+            if not path.exists():
+                self.build_snapshot(name, fp)
+            table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+            entry = self._entries[name] = (fp, table, now)
+            return entry
+
+    def snapshot_fingerprint(self, name):
+        """Empreinte de l'instantané servi pour ``name`` (clé de cache des résultats dérivés)."""
+        return self._entry(name)[0]
+
+    def table(self, name, columns=None):
+        """Vue ``pyarrow.Table`` de ``name`` (projection sans copie)."""
+        table = self._entry(name)[1]
+        return table if columns is None else table.select(list(columns))
+
+    def frame(self, name, columns=None):
+        """Projection convertie en DataFrame (copie des colonnes non numériques ou avec manquants)."""
+        return self.table(name, columns).to_pandas(split_blocks=True)
+
+    def info(self):
+        """Tables déjà ouvertes : lignes, colonnes, taille et fichier projeté."""
+        with self._lock:
+            return {name: {"rows": t.num_rows, "columns": t.num_columns, "mb": round(t.nbytes / 2 ** 20, 1),
+                           "path": str(self.snapshot_path(name, fp))}
+                    for name, (fp, t, _) in self._entries.items()}
+
+
+_SHARED = None
+_SHARED_LOCK = threading.Lock()
+
+
+def get_shared():
+    """Couche partagée par tout le processus (toutes les sessions Streamlit)."""
+    global _SHARED
+    with _SHARED_LOCK:
+        if _SHARED is None:
+            _SHARED = SharedData()
+        return _SHARED
+
+
+# -- Contrôle : mémoire en fonction du nombre de sessions -------------------------------
+def simulate(mode, sessions, data_dir=DATA_DIR, store_dir=STORE_DIR):
+    """RSS (Mo) après l'ouverture de ``n`` sessions, pour chaque ``n`` de ``sessions``.
+
+    Chaque session tient les cinq tables jusqu'à la fin, comme une session Streamlit
+    garde les objets renvoyés par ses chargeurs pendant un rendu :
+
+    - ``cache_data`` : chargeur ``@st.cache_data`` renvoyant le DataFrame complet ;
+    - ``shared`` : vues ``SharedData.table`` et la page de 50 lignes affichée.
+    """
+    import warnings
+
+    warnings.filterwarnings("ignore")
+    import streamlit as st
+
+    layer = SharedData(data_dir, store_dir)
+    for name in NAMES:   # instantanés écrits avant la mesure, comme au premier rendu
+        layer.table(name)
+
+    @st.cache_data(show_spinner=False)
+    def load(name):
+        return layer.frame(name)
+
+    def open_session():
+        if mode == "cache_data":
+            return [load(name) for name in NAMES]
+        views = [layer.table(name) for name in NAMES]
+        return views + [v.slice(0, 50).to_pandas() for v in views]
+
+    held, out = [], []
+    open_session()   # premier appel : remplissage du cache, hors mesure
+    gc.collect()
+    base = rss_mb()
+    for n in sorted(sessions):
+        while len(held) < n:
+            held.append(open_session())
+        gc.collect()
+        out.append({"mode": mode, "sessions": n, "rss_mo": round(rss_mb() - base, 1)})
+    return out
+
+
+def slope(rows):
+    """Croissance du RSS par session (moindres carrés)."""
+    import numpy as np
+
+    x = np.array([r["sessions"] for r in rows], dtype=float)
+    y = np.array([r["rss_mo"] for r in rows], dtype=float)
+    return float(np.polyfit(x, y, 1)[0]) if len(x) > 1 else float("nan")
+
+
+def synthetic_store(accidents, work):
+    """Tables synthétiques (``accidents.synth``) et table par accident dans ``work``."""
+    from . import synth
+    from .pipeline import build_features
+
+    data_dir, store_dir = work / "data", work / "data" / "store"
+    profile = synth.Profile.fit()
+    synth.generate(profile, data_dir, -(-accidents // len(profile.annees)))
+    build_features(out_dir=store_dir / "features", store_dir=store_dir, data_dir=data_dir)
+    return data_dir, store_dir
+
+
+def main(argv=None):
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Mémoire du serveur selon le nombre de sessions simulées.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=list(SESSIONS))
+    parser.add_argument("--accidents", type=int, default=0,
+                        help="tables synthétiques de cette taille (défaut : échantillons de data/)")
+    parser.add_argument("--check", action="store_true",
+                        help=f"code 1 si la couche partagée dépasse {MAX_MB_PER_SESSION} Mo par session")
+    args = parser.parse_args(argv)
+
+    work = Path(tempfile.mkdtemp(prefix="accidents-shared-"))
+    try:
+        data_dir, store_dir = DATA_DIR, STORE_DIR
+        if args.accidents:
+            data_dir, store_dir = synthetic_store(args.accidents, work)
+        rows = []
+        for mode in ("cache_data", "shared"):   # un processus neuf par mode
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                rows += pool.submit(simulate, mode, args.sessions, data_dir, store_dir).result()
+        layer = SharedData(data_dir, store_dir)
+        sizes = {name: layer.table(name).num_rows for name in NAMES}
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    print(f"Lignes : {sizes}")
+    table = pd.DataFrame(rows).pivot(index="sessions", columns="mode", values="rss_mo")
+    print(f"Croissance du RSS (Mo) depuis la première session :\n{table.to_string()}")
+    slopes = {mode: slope([r for r in rows if r["mode"] == mode]) for mode in ("cache_data", "shared")}
+    for mode, s in slopes.items():
+        print(f"{mode:>10} : {s:.3f} Mo par session")
+    if args.check:
+        if slopes["shared"] > MAX_MB_PER_SESSION:
+            print(f"ÉCHEC : {slopes['shared']:.3f} Mo par session > {MAX_MB_PER_SESSION}")
+            raise SystemExit(1)
+        print("Mémoire plate : OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Profil de démarrage des pages Streamlit : temps d'import et premier rendu.
+
+Chaque page est exécutée dans un processus neuf (``python -X importtime``) avec
+``streamlit.testing.v1.AppTest``, depuis la racine du dépôt comme ``streamlit run`` :
+
+- ``import_ms`` : imports déclenchés par la page (somme des imports de premier niveau
+  réalisés pendant le premier rendu, Streamlit et AppTest étant déjà chargés) ;
+- ``first_render_ms`` : premier rendu complet, imports et chargements de données compris ;
+- ``rerun_ms`` : second rendu de la même session (caches Streamlit remplis) ;
+- ``heavy`` : bibliothèques lourdes chargées par la page (``HEAVY_MODULES``) ;
+- ``top_imports`` : les imports les plus coûteux.
+
+Le médian de ``--repeat`` exécutions est retenu. ``--record`` écrit la référence dans
+``reports/startup_baseline.json`` ; ``--check`` échoue (code 1) si un premier rendu
+dépasse sa référence de plus de ``--tolerance`` (et de ``--slack-ms``).
+
+Ligne de commande : ``PYTHONPATH=app python -m accidents.startup [--record | --check]``
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from .config import REPORTS_DIR
+
+ROOT = Path(__file__).resolve().parents[2]
+APP_DIR = ROOT / "app"
+BASELINE_FILE = REPORTS_DIR / "startup_baseline.json"
+HEAVY_MODULES = ("matplotlib", "seaborn", "sklearn", "scipy", "plotly", "PIL", "shap", "imblearn", "joblib")
+MARKER = "--accidents.startup: rendu--"
+TOLERANCE = 0.30
+SLACK_MS = 250
+
+# Exécuté dans le sous-processus : argv[1] = page, argv[2] = délai maximal du rendu
+_PROBE = f"""
+import json, sys, time
+import streamlit
+from streamlit.testing.v1 import AppTest
+before = set(sys.modules)
+print({MARKER!r}, file=sys.stderr, flush=True)
+at = AppTest.from_file(sys.argv[1], default_timeout=float(sys.argv[2]))
+t0 = time.perf_counter(); at.run(); first = time.perf_counter() - t0
+t0 = time.perf_counter(); at.run(); rerun = time.perf_counter() - t0
+loaded = {{m.split(".")[0] for m in set(sys.modules) - before}}
+print(json.dumps({{"first_render_ms": 1000 * first, "rerun_ms": 1000 * rerun,
+                  "heavy": sorted(loaded & set({HEAVY_MODULES!r})),
+                  "exceptions": [str(e.value)[:200] for e in at.exception]}}))
+"""
+
+
+def pages(app_dir=APP_DIR):
+    """Page d'accueil puis pages de ``pages/``, dans l'ordre du menu."""
+    return [app_dir / "app.py", *sorted((app_dir / "pages").glob("*.py"))]
+
+
+def parse_importtime(stderr, top=5):
+    """Imports de premier niveau après le marqueur : total (ms) et les ``top`` plus coûteux."""
+    lines = stderr.splitlines()
+    if MARKER in lines:
+        lines = lines[lines.index(MARKER) + 1:]
+    imports = []
+    for line in lines:
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.startswith("  "):   # import imbriqué, déjà compté par son parent
+            continue
+        imports.append((name.strip(), int(cumulative) / 1000))
+    imports.sort(key=lambda x: -x[1])
+    return sum(ms for _, ms in imports), [f"{name} ({ms:.0f} ms)" for name, ms in imports[:top]]
+
+
+def profile_page(page, timeout=300, root=ROOT):
+    """Une exécution de ``page`` dans un processus neuf."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(APP_DIR), os.environ.get("PYTHONPATH")])))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-W", "ignore", "-c", _PROBE, str(page), str(timeout)],
+                          cwd=root, env=env, capture_output=True, text=True, timeout=timeout + 60)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{Path(page).name} : code {proc.returncode}\n{proc.stderr[-2000:]}")
+    out = json.loads(proc.stdout.strip().splitlines()[-1])
+    out["import_ms"], out["top_imports"] = parse_importtime(proc.stderr)
+    return out
+
+
+def profile(page_paths, repeat=3, timeout=300):
+    """Médiane de ``repeat`` exécutions par page : ``{page: mesures}``."""
+    results = {}
+    for page in page_paths:
+        runs = [profile_page(page, timeout) for _ in range(repeat)]
+        res = {k: round(float(pd.Series([r[k] for r in runs]).median()), 1)
+               for k in ("import_ms", "first_render_ms", "rerun_ms")}
+        res.update(heavy=runs[-1]["heavy"], top_imports=runs[-1]["top_imports"], exceptions=runs[-1]["exceptions"])
+        results[Path(page).name] = res
+    return results
+
+
+def regressions(results, baseline, tolerance=TOLERANCE, slack_ms=SLACK_MS):
+    """Pages dont le premier rendu dépasse la référence au-delà de la tolérance."""
+    out = []
+    for page, res in results.items():
+        ref = baseline.get("pages", {}).get(page)
+        if ref is None:
+            continue
+        limit = ref["first_render_ms"] * (1 + tolerance) + slack_ms
+        if res["first_render_ms"] > limit:
+            out.append(f"{page} : {res['first_render_ms']:.0f} ms > {limit:.0f} ms "
+                       f"(référence {ref['first_render_ms']:.0f} ms)")
+        for module in set(res["heavy"]) - set(ref.get("heavy", [])):
+            out.append(f"{page} : {module} désormais importé au démarrage")
+    return out
+
+
+def main(argv=None):
+    import streamlit
+
+    parser = argparse.ArgumentParser(description="Temps d'import et de premier rendu de chaque page.")
+    parser.add_argument("--pages", nargs="+", help="pages à profiler (défaut : toutes)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300, help="délai maximal d'un rendu (s)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--record", action="store_true", help="enregistre les mesures comme référence")
+    mode.add_argument("--check", action="store_true", help="compare à la référence, code 1 si régression")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--slack-ms", type=float, default=SLACK_MS)
+    args = parser.parse_args(argv)
+
+    page_paths = [Path(p).resolve() for p in args.pages] if args.pages else pages()
+    results = profile(page_paths, args.repeat, args.timeout)
+    table = pd.DataFrame(results).T[["import_ms", "first_render_ms", "rerun_ms", "heavy"]]
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline.exists() else None
+    if baseline is not None:
+        table.insert(2, "reference_ms", [baseline["pages"].get(p, {}).get("first_render_ms") for p in table.index])
+    print(table.to_string())
+    for page, res in results.items():
+        if res["exceptions"]:
+            print(f"{page} : exceptions {res['exceptions']}")
+
+    if args.record:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps({
+            "python": platform.python_version(), "streamlit": streamlit.__version__, "cpus": os.cpu_count(),
+            "repeat": args.repeat, "pages": results}, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Référence -> {args.baseline}")
+    elif args.check:
+        if baseline is None:
+            parser.error(f"Aucune référence ({args.baseline}) : lancer d'abord --record")
+        found = regressions(results, baseline, args.tolerance, args.slack_ms)
+        for line in found:
+            print(f"RÉGRESSION {line}")
+        if found:
+            sys.exit(1)
+        print("Aucune régression.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Stockage colonnaire (Parquet) des quatre tables annuelles.
+
+Chaque CSV annuel (``data/sample_<table>_<annee>.csv``, ou le fichier complet
+``<table>_<annee>.csv`` / ``<table>-<annee>.csv`` de data.gouv.fr) est converti une seule fois en
+``data/store/<table>/annee=<annee>/part-0.parquet`` avec les types compacts de
+``accidents.schema``. Le manifeste ``data/store/_manifest.json`` garde pour chaque
+fichier source sa taille, sa date de modification, son empreinte SHA-256 et celle du
+schéma : une partition n'est regénérée que si son CSV ou le schéma a changé.
+
+Les années ne sont pas figées : ``discover_annees`` les déduit des fichiers présents,
+si bien qu'une nouvelle édition annuelle déposée dans ``data/`` est convertie sans
+toucher aux autres années.
+
+Les lecteurs ne chargent que les colonnes et les années demandées.
+
+Ligne de commande : ``PYTHONPATH=app python -m accidents.store [--force]``
+"""
+import argparse
+import json
+import os
+import re
+import threading
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from . import schema
+from .config import DATA_DIR
+from .registry import file_sha256
+from .tracing import traced
+
+TABLES = ("caracteristiques", "usagers", "lieux", "vehicules")
+ANNEES = range(2005, 2019)   # années du projet initial ; les lecteurs utilisent discover_annees
+
+SOURCE_PATTERN = "sample_{table}_{annee}.csv"
+# Fichiers complets de data.gouv.fr, utilisés à défaut d'échantillon
+FULL_PATTERNS = ("{table}_{annee}.csv", "{table}-{annee}.csv")
+SOURCE_RE = re.compile(r"^(?:sample_)?(?P<table>[a-z]+)[_-](?P<annee>\d{4})\.csv$")
+STORE_DIR = DATA_DIR / "store"
+MANIFEST_FILE = "_manifest.json"
+PART_FILE = "part-0.parquet"
+
+# Partitions triées par Num_Acc, en groupes de lignes bornés : une lecture filtrée sur
+# une plage de Num_Acc ne décode que les groupes concernés (cf. accidents.pipeline)
+ROW_GROUP_SIZE = 64_000
+LAYOUT_VERSION = 2
+
+_lock = threading.Lock()
+
+
+def source_path(table, annee, data_dir=DATA_DIR):
+    """Échantillon de l'année s'il existe, sinon le premier fichier complet présent."""
+    for pattern in (SOURCE_PATTERN, *FULL_PATTERNS):
+        path = Path(data_dir) / pattern.format(table=table, annee=annee)
+        if path.exists():
+            return path
+    return Path(data_dir) / SOURCE_PATTERN.format(table=table, annee=annee)
+
+
+def partition_path(table, annee, store_dir=STORE_DIR):
+    return Path(store_dir) / table / f"annee={annee}" / PART_FILE
+
+
+def discover_annees(tables=TABLES, data_dir=DATA_DIR, store_dir=STORE_DIR):
+    """Années présentes pour au moins une table : CSV source ou partition déjà convertie."""
+    annees = set()
+    for path in Path(data_dir).glob("*.csv"):
+        m = SOURCE_RE.match(path.name)
+        if m and m["table"] in tables:
+            annees.add(int(m["annee"]))
+    for table in tables:
+        annees.update(int(p.name.split("=")[1]) for p in Path(store_dir, table).glob("annee=*"))
+    return sorted(annees)
+
+
+def read_source_csv(table, annee, data_dir=DATA_DIR):
+    """Lit un CSV annuel brut avec le schéma de la table."""
+    return schema.read_csv(source_path(table, annee, data_dir), table)
+
+
+# -- Manifeste -----------------------------------------------------------------
+def load_manifest(store_dir=STORE_DIR):
+    p = Path(store_dir) / MANIFEST_FILE
+    if p.exists():
+        return json.loads(p.read_text(encoding="utf-8"))
+    return {}
+
+
+def save_manifest(manifest, store_dir=STORE_DIR):
+    p = Path(store_dir) / MANIFEST_FILE
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(p.name + f".tmp{os.getpid()}")
+    tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, p)
+
+
+def _source_state(path):
+    st = os.stat(path)
+    return {"source": path.name, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def is_stale(table, annee, manifest, data_dir=DATA_DIR, store_dir=STORE_DIR):
+    """Vrai si la partition doit être (re)générée ; met à jour la date si seul le mtime a bougé."""
+    src = source_path(table, annee, data_dir)
+    entry = manifest.get(table, {}).get(str(annee))
+    if entry is None or not partition_path(table, annee, store_dir).exists():
+        return True
+    if entry.get("schema") != schema.schema_fingerprint(table) or entry.get("layout") != LAYOUT_VERSION:
+        return True
+    state = _source_state(src)
+    if entry["size"] == state["size"] and entry["mtime_ns"] == state["mtime_ns"]:
+        return False
+    if entry["size"] == state["size"] and entry["sha256"] == file_sha256(src):
+        entry["mtime_ns"] = state["mtime_ns"]   # fichier touché mais contenu identique
+        return False
+    return True
+
+
+# -- Ingestion -----------------------------------------------------------------
+def write_partition(df, table, annee, store_dir=STORE_DIR):
+    path = partition_path(table, annee, store_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+    df = df.sort_values("Num_Acc", kind="stable")   # stable : garde l'ordre des véhicules/usagers
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp,
+                   compression="zstd", row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp, path)
+
+
+def ingest(tables=TABLES, annees=None, force=False, data_dir=DATA_DIR, store_dir=STORE_DIR):
+    """Convertit les CSV nouveaux ou modifiés. Renvoie la liste des (table, annee) écrits.
+
+    ``annees`` : toutes les années trouvées par ``discover_annees`` par défaut.
+    """
+    if annees is None:
+        annees = discover_annees(tables, data_dir, store_dir)
+    written = []
+    with _lock:
+        manifest = load_manifest(store_dir)
+        before = json.dumps(manifest, sort_keys=True)
+        for table in tables:
+            for annee in annees:
+                src = source_path(table, annee, data_dir)
+                if not src.exists():
+                    continue
+                if not force and not is_stale(table, annee, manifest, data_dir, store_dir):
+                    continue
+                df = read_source_csv(table, annee, data_dir)
+                write_partition(df, table, annee, store_dir)
+                manifest.setdefault(table, {})[str(annee)] = {
+                    **_source_state(src), "sha256": file_sha256(src), "rows": len(df),
+                    "schema": schema.schema_fingerprint(table), "layout": LAYOUT_VERSION}
+                written.append((table, annee))
+        if json.dumps(manifest, sort_keys=True) != before:
+            save_manifest(manifest, store_dir)
+    return written
+
+
+# -- Lecture -------------------------------------------------------------------
+@traced("store.read_arrow", rows=lambda t: t.num_rows)
+def read_arrow(table, columns=None, annees=None, ensure=True, data_dir=DATA_DIR, store_dir=STORE_DIR):
+    """Lit une table depuis le stockage colonnaire, en ``pyarrow.Table``.
+
+    ``columns`` : colonnes à charger (toutes par défaut) ; ``annees`` : années à charger
+    (toutes celles de ``discover_annees`` par défaut). La colonne ``annee`` est toujours
+    ajoutée. ``ensure`` : convertit d'abord les CSV nouveaux ou modifiés.
+    """
+    annees = list(discover_annees((table,), data_dir, store_dir) if annees is None else annees)
+    if not annees:
+        raise FileNotFoundError(f"Aucune année disponible pour {table}")
+    if ensure:
+        ingest((table,), annees, data_dir=data_dir, store_dir=store_dir)
+    cols = None if columns is None else [c for c in columns if c != "annee"]
+    parts = []
+    for annee in annees:
+        path = partition_path(table, annee, store_dir)
+        if not path.exists():
+            continue
+        t = pq.read_table(path, columns=cols)
+        parts.append(t.append_column("annee", pa.array([annee] * t.num_rows, pa.int16())))
+    if not parts:
+        raise FileNotFoundError(f"Aucune partition pour {table} ({annees[0]}-{annees[-1]})")
+    # Concaténation côté Arrow : les dictionnaires (colonnes category) sont réunis
+    # sans repasser par des colonnes object
+    return pa.concat_tables(parts, promote_options="permissive").unify_dictionaries()
+
+
+@traced("store.read_table")
+def read_table(table, columns=None, annees=None, ensure=True, data_dir=DATA_DIR, store_dir=STORE_DIR):
+    """``read_arrow`` converti en DataFrame (mêmes paramètres)."""
+    return read_arrow(table, columns, annees, ensure, data_dir, store_dir).to_pandas()
+
+
+@traced("store.preview", rows=lambda res: len(res[0]))
+def preview(table, n=5, annees=None, ensure=True, data_dir=DATA_DIR, store_dir=STORE_DIR):
+    """Premières lignes et dimensions d'une table sans la charger.
+
+    Renvoie ``(head, n_lignes, n_colonnes)`` comme ``read_table(...).head(n)`` et
+    ``.shape`` : les lignes viennent du premier lot de la première partition, le nombre
+    de lignes des métadonnées Parquet de chaque partition.
+    """
+    annees = list(discover_annees((table,), data_dir, store_dir) if annees is None else annees)
+    if not annees:
+        raise FileNotFoundError(f"Aucune année disponible pour {table}")
+    if ensure:
+        ingest((table,), annees, data_dir=data_dir, store_dir=store_dir)
+    files = [(annee, pq.ParquetFile(partition_path(table, annee, store_dir)))
+             for annee in annees if partition_path(table, annee, store_dir).exists()]
+    if not files:
+        raise FileNotFoundError(f"Aucune partition pour {table} ({annees[0]}-{annees[-1]})")
+    annee, first = files[0]
+    head = pa.Table.from_batches([next(first.iter_batches(batch_size=n))]).slice(0, n)
+    head = head.append_column("annee", pa.array([annee] * head.num_rows, pa.int16()))
+    n_rows = sum(f.metadata.num_rows for _, f in files)
+    n_cols = len({name for _, f in files for name in f.schema_arrow.names} | {"annee"})
+    return head.to_pandas(), n_rows, n_cols
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convertit les CSV annuels en Parquet partitionné par année.")
+    parser.add_argument("--force", action="store_true", help="regénère toutes les partitions")
+    parser.add_argument("--tables", nargs="+", default=list(TABLES), choices=TABLES)
+    args = parser.parse_args(argv)
+    written = ingest(args.tables, force=args.force)
+    print(f"{len(written)} partition(s) écrite(s) dans {STORE_DIR}")
+
+
+if __name__ == "__main__":
+    main()
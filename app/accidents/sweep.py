@@ -0,0 +1,106 @@
+"""Analyse de sensibilité : toutes les valeurs d'une ou deux variables en un seul appel.
+
+À partir d'une ligne de référence, ``grid`` construit la grille cartésienne des valeurs
+observées des variables choisies (``lum``, ``secu``, ``col``, ...). Toutes les autres
+colonnes restent celles de la ligne de référence. ``sweep`` score la grille en un seul
+appel vectorisé et renvoie les probabilités par classe au format long, prêtes à tracer.
+
+Comparaison avec un scoring ligne à ligne (une relance de la page par valeur) :
+``PYTHONPATH=app python -m accidents.sweep --version <v> --model hgb.joblib --variables lum col``
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from .tracing import traced
+
+SWEEP_VARIABLES = ("lum", "secu", "col", "obs", "catv", "situ", "agg", "surf", "atm")
+MAX_VARIABLES = 2
+MAX_GRID = 20_000
+
+
+def observed_values(df, variable):
+    """Valeurs entières observées d'une variable, triées (comme les listes de la page)."""
+    return sorted(df[variable].dropna().astype(int).unique().tolist())
+
+
+def grid(base, values):
+    """Grille cartésienne : ``base`` répétée, chaque variable de ``values`` parcourant ses valeurs.
+
+    ``values`` : ``{variable: [valeurs]}`` ; la première variable varie le plus lentement.
+    """
+    if not values:
+        raise ValueError("Aucune variable à faire varier")
+    if len(values) > MAX_VARIABLES:
+        raise ValueError(f"Au plus {MAX_VARIABLES} variables à la fois")
+    sizes = [len(v) for v in values.values()]
+    n = int(np.prod(sizes))
+    if n == 0:
+        raise ValueError("Une variable n'a aucune valeur observée")
+    if n > MAX_GRID:
+        raise ValueError(f"Grille de {n} lignes (maximum {MAX_GRID})")
+    out = pd.DataFrame(np.repeat(base.to_frame().T.to_numpy(), n, axis=0), columns=base.index)
+    out = out.infer_objects()
+    inner = n
+    for (var, vals), size in zip(values.items(), sizes):
+        inner //= size
+        out[var] = np.tile(np.repeat(np.asarray(vals), inner), n // (size * inner))
+    return out
+
+
+@traced("sweep.sweep")
+def sweep(scorer, base, values):
+    """Probabilités par classe sur la grille, scorée en un appel : une ligne par (point, classe).
+
+    Colonnes : les variables de ``values``, ``classe``, ``proba`` et ``pred`` (classe
+    prédite au point de la grille).
+    """
+    g = grid(base, values)
+    res = scorer.score(g)
+    if res.proba is None:
+        raise ValueError("Le modèle ne fournit pas de probabilités (predict_proba)")
+    keys = g[list(values)].reset_index(drop=True)
+    k = len(res.classes)
+    out = keys.loc[keys.index.repeat(k)].reset_index(drop=True)
+    out["classe"] = np.tile(res.classes, len(g))
+    out["proba"] = res.proba.ravel()
+    out["pred"] = np.repeat(res.pred, k)
+    return out
+
+
+def main(argv=None):
+    import json
+
+    from .registry import ModelRegistry
+    from .scoring import Scorer
+    from .train import TRAIN_DIR, load_split
+
+    parser = argparse.ArgumentParser(description="Balayage d'une ou deux variables : un appel groupé vs ligne à ligne.")
+    parser.add_argument("--version", required=True, help="dossier models/<version>/ (accidents.train)")
+    parser.add_argument("--model", default="hgb.joblib")
+    parser.add_argument("--variables", nargs="+", default=["lum", "col"])
+    parser.add_argument("--row", type=int, default=0, help="ligne de référence du jeu de test")
+    args = parser.parse_args(argv)
+
+    columns = json.loads((TRAIN_DIR / "meta.json").read_text(encoding="utf-8"))["columns"]
+    X, _ = load_split(TRAIN_DIR, "test")
+    df = pd.DataFrame(np.asarray(X), columns=columns)
+    scorer = Scorer.from_registry(ModelRegistry(offline=True), None, args.model, version=args.version)
+    values = {v: observed_values(df, v) for v in args.variables}
+
+    t0 = time.perf_counter()
+    res = sweep(scorer, df.iloc[args.row], values)
+    batched = time.perf_counter() - t0
+    g = grid(df.iloc[args.row], values)
+    t0 = time.perf_counter()
+    loop = np.vstack([scorer.score(g.iloc[i]).proba for i in range(len(g))])
+    row_by_row = time.perf_counter() - t0
+    ecart = np.abs(loop.ravel() - res["proba"].to_numpy()).max()
+    print(f"{len(g)} points x {res['classe'].nunique()} classes : un appel {1000 * batched:.1f} ms, "
+          f"ligne à ligne {1000 * row_by_row:.1f} ms (x{row_by_row / batched:.0f}) ; écart max {ecart:.1e}")
+
+
+if __name__ == "__main__":
+    main()
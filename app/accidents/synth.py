@@ -0,0 +1,222 @@
+"""Générateur de fichiers BAAC synthétiques pour les essais à grande échelle.
+
+Les échantillons livrés (environ 1000 lignes par table et par année) ne montrent pas le
+comportement du pipeline au volume réel (958 469 accidents, 1 635 811 véhicules,
+2 142 195 usagers sur 2005-2018). ``Profile.fit`` apprend sur les échantillons :
+
+- la loi marginale de chaque colonne, par table et par année, sur le texte brut des CSV
+  (les valeurs émises gardent donc exactement le format d'origine : ``hrmn``, ``dep``
+  sur trois caractères, décimales, valeurs manquantes) ;
+- la loi jointe (véhicules, usagers) par accident, lue dans la table par accident
+  ``sample_merged_accident_mini.csv`` (``nb_veh`` et somme des places) : 1,71 véhicule
+  et 2,24 usagers par accident, comme les données complètes.
+
+``generate`` écrit ensuite ``<table>_<annee>.csv`` (noms des fichiers complets, que
+reconnaît ``accidents.store``) par blocs de ``chunk_size`` accidents ajoutés au fichier :
+la mémoire ne dépend que de la taille du bloc. Les clés sont cohérentes : un
+``Num_Acc`` par accident (``<annee>`` suivi de 8 chiffres), partagé par
+caractéristiques et lieux, ``num_veh`` (``A01``, ``B01``, ...) pour chaque véhicule,
+chaque usager rattaché à un véhicule de son accident (un par véhicule d'abord, le
+reste au hasard).
+
+Les colonnes sont tirées indépendamment : les corrélations entre variables (et avec
+la gravité) ne sont pas reproduites. Ces données servent à mesurer volumes, durées et
+mémoire, pas à entraîner un modèle.
+
+Ligne de commande : ``PYTHONPATH=app python -m accidents.synth --accidents 958469 --out data/synth [--check]``
+"""
+import argparse
+import string
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .config import DATA_DIR
+from .schema import ENCODING
+from .store import TABLES, discover_annees, source_path
+
+SYNTH_DIR = DATA_DIR / "synth"
+MINI_FILE = DATA_DIR / "sample_merged_accident_mini.csv"
+OUTPUT_PATTERN = "{table}_{annee}.csv"
+DEFAULT_CHUNK_SIZE = 100_000
+ACCIDENTS_REELS = 958_469
+# Clés générées, jamais tirées dans les marginales
+KEYS = ("Num_Acc", "num_veh")
+PLACE_COLUMNS = ("Conducteur", "Avant", "Arrière", "Autre")
+VEH_CODES = np.array([f"{c}01" for c in string.ascii_uppercase])
+
+
+class Profile:
+    """Lois apprises sur les échantillons : marginales par (année, table, colonne) et cardinalités."""
+
+    def __init__(self, columns, marginals, cardinalities):
+        self.columns = columns              # {table: [colonnes dans l'ordre du CSV]}
+        self.marginals = marginals          # {annee: {table: {colonne: (valeurs, probabilités)}}}
+        self.cardinalities = cardinalities  # (paires (n_veh, n_usagers), probabilités)
+
+    @property
+    def annees(self):
+        return sorted(self.marginals)
+
+    @classmethod
+    def fit(cls, data_dir=DATA_DIR, mini_file=MINI_FILE, annees=None):
+        annees = list(discover_annees(data_dir=data_dir) if annees is None else annees)
+        columns, marginals = {}, {}
+        for annee in annees:
+            for table in TABLES:
+                path = source_path(table, annee, data_dir)
+                if not path.exists():
+                    continue
+                # Texte brut : '' pour une valeur manquante, format d'origine conservé
+                df = pd.read_csv(path, sep=None, engine="python", encoding=ENCODING, dtype=str,
+                                 keep_default_na=False)
+                df.columns = [c.strip().strip('"') for c in df.columns]
+                columns.setdefault(table, list(df.columns))
+                marginals.setdefault(annee, {})[table] = {
+                    c: _distribution(df[c]) for c in df.columns if c not in KEYS}
+        marginals = {a: m for a, m in marginals.items() if len(m) == len(TABLES)}
+        if not marginals:
+            raise FileNotFoundError(f"Aucune année avec les quatre tables dans {data_dir}")
+        mini = pd.read_csv(mini_file, usecols=["nb_veh", *PLACE_COLUMNS])
+        n_veh = mini["nb_veh"].fillna(1).clip(1, len(VEH_CODES)).astype(np.int64)
+        n_usagers = mini[list(PLACE_COLUMNS)].fillna(0).sum(axis=1).clip(lower=1).astype(np.int64)
+        pairs = pd.DataFrame({"n_veh": n_veh, "n_usagers": n_usagers}).value_counts(normalize=True)
+        cardinalities = (np.array(pairs.index.tolist(), dtype=np.int64), pairs.to_numpy())
+        return cls(columns, marginals, cardinalities)
+
+    def ratios(self):
+        """Véhicules par accident et usagers par véhicule attendus."""
+        pairs, p = self.cardinalities
+        veh, usagers = (pairs * p[:, None]).sum(axis=0)
+        return {"vehicules_par_accident": round(float(veh), 3), "usagers_par_vehicule": round(float(usagers / veh), 3)}
+
+
+def _distribution(col):
+    counts = col.value_counts(normalize=True, sort=False)
+    return counts.index.to_numpy(dtype=object), counts.to_numpy(dtype=np.float64)
+
+
+def _draw(dist, n, rng):
+    values, p = dist
+    return values[rng.choice(len(values), size=n, p=p)]
+
+
+def generate_block(profile, annee, start, n, rng):
+    """Quatre DataFrames (texte) pour les accidents ``start .. start + n - 1`` de l'année."""
+    m = profile.marginals[annee]
+    num_acc = annee * 10 ** 8 + start + 1 + np.arange(n, dtype=np.int64)
+    pairs, p = profile.cardinalities
+    nv, nu = pairs[rng.choice(len(pairs), size=n, p=p)].T
+
+    def frame(table, keys, n_rows):
+        out = {c: keys[c] if c in keys else _draw(m[table][c], n_rows, rng) for c in profile.columns[table]}
+        return pd.DataFrame(out, columns=profile.columns[table])
+
+    # Véhicules : A01, B01, ... dans chaque accident
+    veh_acc = np.repeat(np.arange(n), nv)
+    veh_rank = np.arange(len(veh_acc)) - np.repeat(np.cumsum(nv) - nv, nv)
+    # Usagers : un par véhicule tant qu'il y en a, les suivants sur un véhicule tiré au hasard
+    usa_acc = np.repeat(np.arange(n), nu)
+    usa_rank = np.arange(len(usa_acc)) - np.repeat(np.cumsum(nu) - nu, nu)
+    usa_veh = np.where(usa_rank < nv[usa_acc], usa_rank,
+                       (rng.random(len(usa_acc)) * nv[usa_acc]).astype(np.int64))
+    return {
+        "caracteristiques": frame("caracteristiques", {"Num_Acc": num_acc}, n),
+        "lieux": frame("lieux", {"Num_Acc": num_acc}, n),
+        "vehicules": frame("vehicules", {"Num_Acc": num_acc[veh_acc], "num_veh": VEH_CODES[veh_rank]}, len(veh_acc)),
+        "usagers": frame("usagers", {"Num_Acc": num_acc[usa_acc], "num_veh": VEH_CODES[usa_veh]}, len(usa_acc)),
+    }
+
+
+def generate(profile, out_dir=SYNTH_DIR, accidents_per_year=1000, annees=None, chunk_size=DEFAULT_CHUNK_SIZE,
+             seed=42):
+    """Écrit les quatre tables de chaque année par blocs ; renvoie les lignes écrites par table.
+
+    ``accidents_per_year`` : un entier, ou ``{annee: n}``.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    annees = profile.annees if annees is None else list(annees)
+    rows = dict.fromkeys(TABLES, 0)
+    for annee in annees:
+        n_year = accidents_per_year[annee] if isinstance(accidents_per_year, dict) else accidents_per_year
+        rng = np.random.default_rng([seed, annee])
+        files = {t: open(out_dir / OUTPUT_PATTERN.format(table=t, annee=annee), "w", encoding=ENCODING, newline="")
+                 for t in TABLES}
+        try:
+            for start in range(0, n_year, chunk_size):
+                block = generate_block(profile, annee, start, min(chunk_size, n_year - start), rng)
+                for table, df in block.items():
+                    df.to_csv(files[table], header=start == 0, index=False, lineterminator="\n")
+                    rows[table] += len(df)
+        finally:
+            for f in files.values():
+                f.close()
+    return rows
+
+
+def check(profile, out_dir=SYNTH_DIR, annee=None):
+    """Relit une année générée : schéma, clés, cardinalités et écart aux marginales apprises."""
+    from . import schema
+
+    annee = profile.annees[0] if annee is None else annee
+    paths = {t: Path(out_dir) / OUTPUT_PATTERN.format(table=t, annee=annee) for t in TABLES}
+    typed = {t: schema.read_csv(p, t) for t, p in paths.items()}   # lève une erreur si un type ne passe pas
+    c, l, v, u = (typed[t] for t in ("caracteristiques", "lieux", "vehicules", "usagers"))
+    veh_keys = pd.MultiIndex.from_frame(v[["Num_Acc", "num_veh"]].astype({"num_veh": str}))
+    usa_keys = pd.MultiIndex.from_frame(u[["Num_Acc", "num_veh"]].astype({"num_veh": str}))
+    # Écart de variation totale entre loi apprise et loi générée, colonne par colonne
+    tv = {}
+    for table, path in paths.items():
+        raw = pd.read_csv(path, encoding=ENCODING, dtype=str, keep_default_na=False)
+        for col, (values, p) in profile.marginals[annee][table].items():
+            observed = raw[col].value_counts(normalize=True)
+            expected = pd.Series(p, index=values)
+            tv[f"{table}.{col}"] = 0.5 * float(observed.reindex(expected.index, fill_value=0).sub(expected).abs().sum()
+                                               + observed.drop(expected.index, errors="ignore").sum())
+    worst = max(tv, key=tv.get)
+    return {
+        "annee": annee, "accidents": len(c),
+        "num_acc_uniques": bool(c["Num_Acc"].is_unique),
+        "lieux_alignes": bool(np.array_equal(c["Num_Acc"].to_numpy(), l["Num_Acc"].to_numpy())),
+        "vehicules_rattaches": bool(v["Num_Acc"].isin(c["Num_Acc"]).all()),
+        "usagers_rattaches": bool(usa_keys.isin(veh_keys).all()),
+        "vehicules_par_accident": round(len(v) / len(c), 3),
+        "usagers_par_vehicule": round(len(u) / len(v), 3),
+        "ecart_marginal_max": f"{worst} : {tv[worst]:.4f}",
+        "ecart_marginal_moyen": round(float(np.mean(list(tv.values()))), 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génère des tables BAAC synthétiques de taille arbitraire.")
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument("--accidents", type=int, default=ACCIDENTS_REELS, help="accidents au total, répartis par année")
+    size.add_argument("--accidents-per-year", type=int)
+    parser.add_argument("--annees", type=int, nargs="+", help="années à générer (défaut : celles des échantillons)")
+    parser.add_argument("--out", type=Path, default=SYNTH_DIR)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="accidents par bloc écrit")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--check", action="store_true", help="relit la première année générée et la contrôle")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    profile = Profile.fit(annees=args.annees)
+    print(f"Profil appris sur {len(profile.annees)} année(s) en {time.perf_counter() - t0:.1f} s : {profile.ratios()}")
+    annees = profile.annees
+    per_year = args.accidents_per_year or -(-args.accidents // len(annees))
+    t0 = time.perf_counter()
+    rows = generate(profile, args.out, per_year, annees, args.chunk_size, args.seed)
+    elapsed = time.perf_counter() - t0
+    total = sum(rows.values())
+    print(f"{rows} -> {args.out}")
+    print(f"{total} lignes en {elapsed:.1f} s ({total / elapsed:,.0f} lignes/s)".replace(",", " "))
+    if args.check:
+        for k, val in check(profile, args.out, annees[0]).items():
+            print(f"  {k} : {val}")
+
+
+if __name__ == "__main__":
+    main()
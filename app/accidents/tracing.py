@@ -0,0 +1,242 @@
+"""Traces légères des étapes coûteuses : durée, lignes traitées, variation mémoire.
+
+``span`` (gestionnaire de contexte) et ``traced`` (décorateur) enregistrent chaque
+appel dans un tampon circulaire du processus (``ACCIDENTS_TRACE_BUFFER`` entrées, 2000
+par défaut) : nom, durée (ms), lignes produites, variation du RSS (Mo), profondeur
+d'imbrication, exception éventuelle. Un enregistrement coûte une trentaine de
+microsecondes (horloge et lecture de ``/proc/self/statm``) : à réserver aux étapes d'au
+moins une milliseconde. ``ACCIDENTS_TRACING=0`` le désactive.
+
+Côté Streamlit, chaque page appelle ``begin_run`` en tête de script (un identifiant de
+rendu par exécution, rattaché à la session) puis ``sidebar_panel`` en fin de script et
+avant chaque ``st.stop()`` : le panneau liste les étapes de ce rendu et le temps restant
+hors étapes tracées (script, widgets, sérialisation). Son export ne contient que les
+traces de la session qui le demande. Un appel à une fonction ``st.cache_data`` entouré
+d'un ``span`` mesure la vérification du cache ; l'étape interne (``store.preview``,
+``scoring.score``...) n'apparaît qu'en cas de calcul effectif.
+
+``export_json`` sérialise le tampon ; ``summarize`` l'agrège par étape pour l'analyse
+hors ligne : ``PYTHONPATH=app python -m accidents.tracing traces.json [--by page]``.
+"""
+import argparse
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from .config import env_flag
+
+BUFFER_SIZE = int(os.environ.get("ACCIDENTS_TRACE_BUFFER", 2000))
+ENABLED = env_flag("ACCIDENTS_TRACING", True)
+
+_buffer = deque(maxlen=BUFFER_SIZE)
+_lock = threading.Lock()
+_local = threading.local()   # rendu et pile d'étapes du thread (un thread de script par session)
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_mb():
+    """RSS courant du processus (Mo), ``None`` hors Linux."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _session_id():
+    if "streamlit" not in sys.modules:
+        return None
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else None
+
+
+# -- Enregistrement ----------------------------------------------------------------
+def begin_run(page):
+    """Ouvre un nouveau rendu pour le thread courant ; les étapes suivantes lui sont rattachées."""
+    _local.run = {"id": uuid.uuid4().hex[:8], "page": page, "session": _session_id(),
+                  "t0": time.perf_counter(), "start": time.time()}
+    _local.stack = []
+    return _local.run
+
+
+def current_run():
+    return getattr(_local, "run", None)
+
+
+class Span:
+    """Étape en cours : ``rows`` peut être renseigné dans le bloc ``with``."""
+
+    __slots__ = ("name", "rows")
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+
+
+@contextmanager
+def span(name, rows=None):
+    """Mesure le bloc : ``with span("fusion") as s: ...; s.rows = len(df)``."""
+    s = Span(name, rows)
+    if not ENABLED:
+        yield s
+        return
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    parent = stack[-1] if stack else None
+    stack.append(name)
+    mem0, start, t0 = rss_mb(), time.time(), time.perf_counter()
+    error = None
+    try:
+        yield s
+    except BaseException as exc:
+        error = type(exc).__name__
+        raise
+    finally:
+        ms = (time.perf_counter() - t0) * 1000
+        mem1 = rss_mb()
+        stack.pop()
+        run = current_run()
+        record = {
+            "run": run["id"] if run else None, "page": run["page"] if run else None,
+            "session": run["session"] if run else None,
+            "name": name, "parent": parent, "depth": len(stack), "start": round(start, 6), "ms": round(ms, 3),
+            "rows": None if s.rows is None else int(s.rows),
+            "mem_delta_mb": None if mem0 is None or mem1 is None else round(mem1 - mem0, 2),
+            "error": error,
+        }
+        with _lock:
+            _buffer.append(record)
+
+
+def _count_rows(result):
+    if hasattr(result, "__len__") and not isinstance(result, (str, bytes, dict)):
+        return len(result)
+    return None
+
+
+def traced(name=None, rows=_count_rows):
+    """Décorateur : un ``span`` par appel ; ``rows(résultat)`` donne les lignes produites."""
+    def decorate(func):
+        label = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(label) as s:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    s.rows = rows(result)
+                return result
+        return wrapper
+    return decorate
+
+
+# -- Lecture et export -------------------------------------------------------------
+def records(run=None, session=None):
+    """Copie du tampon, éventuellement restreinte à un rendu ou une session."""
+    with _lock:
+        out = list(_buffer)
+    if run is not None:
+        out = [r for r in out if r["run"] == run]
+    if session is not None:
+        out = [r for r in out if r["session"] == session]
+    return out
+
+
+def clear():
+    with _lock:
+        _buffer.clear()
+
+
+def export_json(spans=None):
+    """Tampon (ou ``spans``) en JSON, avec le contexte du processus."""
+    return json.dumps({
+        "exported_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "pid": os.getpid(), "buffer_size": BUFFER_SIZE,
+        "spans": records() if spans is None else spans,
+    }, ensure_ascii=False)
+
+
+def load(path):
+    """Étapes d'un export ``export_json``."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["spans"]
+
+
+def summarize(spans, by=("name",)):
+    """Par étape : nombre d'appels, durée totale, médiane, p95 et max (ms), lignes, mémoire."""
+    import pandas as pd
+
+    df = pd.DataFrame(spans)
+    if df.empty:
+        return df
+    g = df.groupby(list(by), dropna=False)
+    out = pd.DataFrame({
+        "appels": g.size(),
+        "total_ms": g["ms"].sum(),
+        "median_ms": g["ms"].median(),
+        "p95_ms": g["ms"].quantile(0.95),
+        "max_ms": g["ms"].max(),
+        "lignes": g["rows"].sum(min_count=1),
+        "mem_delta_mb": g["mem_delta_mb"].sum(min_count=1),
+        "erreurs": g["error"].count(),
+    })
+    return out.sort_values("total_ms", ascending=False).round(2)
+
+
+# -- Panneau Streamlit -------------------------------------------------------------
+# Tableau Markdown plutôt que st.dataframe : la page d'accueil n'importe pas pandas
+def run_table(run_id):
+    """Étapes d'un rendu (tableau Markdown), dans l'ordre de début, indentées selon l'imbrication."""
+    spans = sorted(records(run=run_id), key=lambda r: r["start"])
+    lines = ["| étape | ms | lignes | Δ mémoire (Mo) |", "|:--|--:|--:|--:|"]
+    for r in spans:
+        name = "· " * r["depth"] + f"`{r['name']}`" + (f" ({r['error']})" if r["error"] else "")
+        rows = "" if r["rows"] is None else f"{r['rows']:,}".replace(",", " ")
+        mem = "" if r["mem_delta_mb"] is None else f"{r['mem_delta_mb']:+.1f}"
+        lines.append(f"| {name} | {r['ms']:.1f} | {rows} | {mem} |")
+    return "\n".join(lines) if spans else ""
+
+
+def sidebar_panel():
+    """Panneau repliable des temps du rendu courant, à appeler en fin de page."""
+    import streamlit as st
+
+    run = current_run()
+    if not ENABLED or run is None:
+        return
+    total = (time.perf_counter() - run["t0"]) * 1000
+    table = run_table(run["id"])
+    top = [r["ms"] for r in records(run=run["id"]) if r["depth"] == 0]
+    with st.sidebar.expander(f"⏱️ Rendu : {total:.0f} ms", expanded=False):
+        if table:
+            st.markdown(table)
+        else:
+            st.caption("Aucune étape tracée pendant ce rendu.")
+        st.caption(f"Hors étapes tracées (script, widgets, sérialisation) : {max(total - sum(top), 0):.0f} ms")
+        # Traces de cette session seulement : le tampon est commun à toutes les sessions
+        st.download_button("Exporter les traces (JSON)", export_json(records(session=run["session"])),
+                           file_name="traces.json", mime="application/json", key="tracing_export")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Agrège un export de traces par étape.")
+    parser.add_argument("path", help="fichier JSON exporté depuis le panneau ou par export_json")
+    parser.add_argument("--by", nargs="+", default=["name"], choices=("name", "page", "session", "run", "parent"))
+    args = parser.parse_args(argv)
+    spans = load(args.path)
+    print(f"{len(spans)} étapes, {len({s['run'] for s in spans})} rendu(s)")
+    print(summarize(spans, args.by).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""Entraînement des modèles candidats à mémoire bornée.
+
+Reprend la boucle ``bench_usag`` du notebook de modélisation (HGB pondéré, RandomForest
+balanced_subsample, ExtraTrees, BalancedRandomForest, régression logistique saga,
+LinearSVC, HGB + RUS + SMOTE, XGBoost) sans charger la table par accident en mémoire :
+
+1. ``materialize`` lit la table par blocs et écrit ``X_train.npy`` / ``X_test.npy``
+   (float32) et ``y_*.npy`` (int8) dans ``data/store/train/``. L'affectation
+   train / test se fait ligne à ligne par hachage de ``Num_Acc`` : aucun mélange
+   global ni copie n'est nécessaire.
+2. Chaque candidat est entraîné dans un processus neuf qui ouvre ces fichiers en
+   memmap. Le pic de mémoire (RSS) mesuré est donc celui du seul modèle, et une
+   limite d'espace d'adresses optionnelle (``--memory-limit-mb``) transforme un
+   dépassement en échec du candidat plutôt qu'en arrêt de toute la série.
+3. Les modèles sont écrits dans ``models/<version>/<candidat>.joblib`` (empreintes
+   dans ``SHA256SUMS``) et le tableau des résultats (durées, pic RSS, F1 macro)
+   dans ``reports/train_<version>.json``.
+
+Ligne de commande : ``PYTHONPATH=app python -m accidents.train [--models hgb rf ...]``
+"""
+import argparse
+import json
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+
+from .config import MODELS_DIR, REPORTS_DIR
+from .store import STORE_DIR
+
+TRAIN_DIR = STORE_DIR / "train"
+TARGET = "grav_order_max"
+# Identifiants, libellés et doublons de l'année : jamais utilisés comme variables
+EXCLUDED = ("Num_Acc", "com", "dep", "an", "annee", TARGET)
+TEST_SHARE = 0.2
+PREDICT_CHUNK = 50_000
+
+
+# -- Données -----------------------------------------------------------------------
+def is_test(num_acc, test_share=TEST_SHARE):
+    """Affectation déterministe au jeu de test (hachage de Fibonacci du Num_Acc)."""
+    h = (np.asarray(num_acc).astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(32)
+    return h < np.uint64(test_share * 2 ** 32)
+
+
+def feature_columns(frame):
+    return [c for c in frame.columns if c not in EXCLUDED and frame[c].dtype.kind in "biuf"]
+
+
+def materialize(source="auto", out_dir=TRAIN_DIR, chunk_size=100_000, test_share=TEST_SHARE):
+    """Écrit X/y train et test en .npy (float32 / int8) en deux passes par blocs.
+
+    Première passe : nombre de lignes de chaque jeu (``Num_Acc`` seul) ; seconde passe :
+    remplissage des memmaps. Les manquants sont codés -1 comme dans le notebook.
+    """
+    from .cube import iter_source
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    first = next(iter_source(source, chunk_size=1))
+    columns = feature_columns(first)
+
+    n_train = n_test = 0
+    for chunk in iter_source(source, columns=[TARGET], chunk_size=chunk_size):
+        chunk = chunk[chunk[TARGET].notna()]
+        t = is_test(chunk["Num_Acc"].to_numpy(), test_share)
+        n_test += int(t.sum())
+        n_train += int((~t).sum())
+
+    open_memmap = np.lib.format.open_memmap
+    arrays = {
+        "X_train": open_memmap(out_dir / "X_train.npy", "w+", np.float32, (n_train, len(columns))),
+        "X_test": open_memmap(out_dir / "X_test.npy", "w+", np.float32, (n_test, len(columns))),
+        "y_train": open_memmap(out_dir / "y_train.npy", "w+", np.int8, (n_train,)),
+        "y_test": open_memmap(out_dir / "y_test.npy", "w+", np.int8, (n_test,)),
+    }
+    pos = {"train": 0, "test": 0}
+    for chunk in iter_source(source, columns=columns + [TARGET], chunk_size=chunk_size):
+        chunk = chunk[chunk[TARGET].notna()]
+        t = is_test(chunk["Num_Acc"].to_numpy(), test_share)
+        X = chunk[columns].to_numpy(dtype=np.float32, na_value=np.nan)
+        X[np.isnan(X)] = -1
+        y = chunk[TARGET].to_numpy(dtype=np.int8)
+        for part, mask in (("train", ~t), ("test", t)):
+            n = int(mask.sum())
+            arrays[f"X_{part}"][pos[part]:pos[part] + n] = X[mask]
+            arrays[f"y_{part}"][pos[part]:pos[part] + n] = y[mask]
+            pos[part] += n
+    for a in arrays.values():
+        a.flush()
+    meta = {"columns": columns, "target": TARGET, "n_train": n_train, "n_test": n_test,
+            "classes": sorted(np.unique(np.concatenate([arrays["y_train"], arrays["y_test"]])).tolist())}
+    (out_dir / "meta.json").write_text(json.dumps(meta, indent=1), encoding="utf-8")
+    return meta
+
+
+def load_split(data_dir=TRAIN_DIR, part="train"):
+    """X (memmap float32 en lecture seule) et y d'un jeu matérialisé."""
+    data_dir = Path(data_dir)
+    return (np.load(data_dir / f"X_{part}.npy", mmap_mode="r"),
+            np.load(data_dir / f"y_{part}.npy", mmap_mode="r"))
+
+
+# Jeu équilibré de la recherche d'hyperparamètres (notebook : ``X_train_bal``) : RUS
+# léger des deux classes les plus fréquentes (x 0,5 puis x 0,8), puis SMOTE ``auto``
+BALANCED_PART = "train_bal"
+BALANCE_UNDER = (0.5, 0.8)
+
+
+def balance_strategy(y, factors=BALANCE_UNDER):
+    """``strategy_under`` du notebook : effectif visé des classes, de la plus fréquente à la moins fréquente."""
+    classes, counts = np.unique(y, return_counts=True)
+    order = np.argsort(-counts, kind="stable")
+    ratios = list(factors) + [1.0] * (len(order) - len(factors))
+    return {int(classes[i]): int(counts[i] * r) for i, r in zip(order, ratios)}
+
+
+def materialize_balanced(data_dir=TRAIN_DIR, part="train", out_part=BALANCED_PART, seed=42):
+    """Écrit ``X_<out_part>.npy`` / ``y_<out_part>.npy`` : ``part`` sous-échantillonné puis sur-échantillonné.
+
+    Comme le notebook (``RandomUnderSampler(strategy_under)`` puis ``SMOTE('auto',
+    k_neighbors=3)``), avec ``PartitionedSMOTE`` pour borner la recherche de voisins.
+    Renvoie l'effectif de chaque classe.
+    """
+    from imblearn.under_sampling import RandomUnderSampler
+
+    from .rebalance import PartitionedSMOTE
+
+    data_dir = Path(data_dir)
+    X, y = load_split(data_dir, part)
+    y = np.asarray(y)
+    keep = RandomUnderSampler(sampling_strategy=balance_strategy(y), random_state=seed)
+    keep.fit_resample(np.zeros((len(y), 1), dtype=np.int8), y)   # indices seuls : X n'est pas copié
+    idx = np.sort(keep.sample_indices_)
+    Xb, yb = PartitionedSMOTE(k_neighbors=3, random_state=seed).fit_resample(X[idx], y[idx])
+    for name, a in (("X", Xb), ("y", yb)):
+        np.save(data_dir / f"{name}_{out_part}.npy", a)
+    classes, counts = np.unique(yb, return_counts=True)
+    return dict(zip(classes.tolist(), counts.tolist()))
+
+
+# -- Candidats ---------------------------------------------------------------------
+# Cibles de rééquilibrage du notebook (``pipe_smote_hgb`` : SMOTE puis RUS)
+SMOTE_RATIO = 0.5
+RUS_ALPHA = 0.9
+
+
+def make_smote_strategy(y, ratio=SMOTE_RATIO):
+    """Porte chaque classe minoritaire à ``ratio`` x la classe majoritaire (notebook)."""
+    classes, counts = np.unique(y, return_counts=True)
+    cible = int(counts.max() * ratio)
+    return {int(c): cible for c, n in zip(classes, counts) if n < cible}
+
+
+def make_rus_strategy(y, alpha=RUS_ALPHA):
+    """Ramène les classes au-delà de ``alpha`` x la classe majoritaire à ce plafond (notebook)."""
+    classes, counts = np.unique(y, return_counts=True)
+    plafond = int(counts.max() * alpha)
+    return {int(c): plafond for c, n in zip(classes, counts) if n > plafond}
+
+
+def resampling_steps(y, make_sampler, seed=42):
+    """Étapes ``smote`` puis ``rus`` du notebook pour les classes ``y``.
+
+    ``make_sampler(cibles, k_neighbors)`` construit l'étape SMOTE (``SMOTE`` ou
+    ``PartitionedSMOTE``) ; sans cible, toutes les classes sauf la majoritaire sont
+    portées à son effectif, et l'étape RUS n'est ajoutée que si elle retire des lignes.
+    """
+    from imblearn.under_sampling import RandomUnderSampler
+
+    k = 3 if np.unique(y, return_counts=True)[1].min() > 3 else 1
+    steps = [("smote", make_sampler(make_smote_strategy(y) or "auto", k))]
+    rus = make_rus_strategy(y)
+    if rus:
+        steps.append(("rus", RandomUnderSampler(sampling_strategy=rus, random_state=seed)))
+    return steps
+
+
+def make_candidate(name, y, n_jobs=1, seed=42):
+    from sklearn.ensemble import ExtraTreesClassifier, HistGradientBoostingClassifier, RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.svm import LinearSVC
+
+    if name == "hgb":
+        return HistGradientBoostingClassifier(class_weight="balanced", random_state=seed)
+    if name == "rf":
+        return RandomForestClassifier(n_estimators=200, min_samples_leaf=2, class_weight="balanced_subsample",
+                                      n_jobs=n_jobs, random_state=seed)
+    if name == "extratrees":
+        return ExtraTreesClassifier(n_estimators=200, min_samples_leaf=2, class_weight="balanced",
+                                    n_jobs=n_jobs, random_state=seed)
+    if name == "brf":
+        from imblearn.ensemble import BalancedRandomForestClassifier
+        return BalancedRandomForestClassifier(n_estimators=200, sampling_strategy="all", replacement=True,
+                                              bootstrap=False, n_jobs=n_jobs, random_state=seed)
+    if name == "logreg":
+        return make_pipeline(StandardScaler(), LogisticRegression(solver="saga", class_weight="balanced",
+                                                                  max_iter=300, random_state=seed))
+    if name == "linearsvc":
+        return make_pipeline(StandardScaler(), LinearSVC(class_weight="balanced", random_state=seed))
+    if name == "hgb_smote_rus":
+        from imblearn.pipeline import Pipeline
+
+        from .rebalance import PartitionedSMOTE
+        # Voisins cherchés par feuilles bornées plutôt que sur toute la classe (accidents.rebalance)
+        steps = resampling_steps(y, lambda target, k: PartitionedSMOTE(sampling_strategy=target, k_neighbors=k,
+                                                                       random_state=seed), seed)
+        return Pipeline(steps + [("hgb", HistGradientBoostingClassifier(random_state=seed))])
+    if name == "xgb":
+        from xgboost import XGBClassifier
+        return XGBClassifier(n_estimators=300, tree_method="hist", max_bin=64, n_jobs=n_jobs, random_state=seed)
+    raise ValueError(f"Candidat inconnu : {name} (attendu : {', '.join(CANDIDATES)})")
+
+
+CANDIDATES = ("hgb", "rf", "extratrees", "brf", "logreg", "linearsvc", "hgb_smote_rus", "xgb")
+# XGBoost attend des classes 0..K-1 : il est entraîné sur les indices de classe
+ENCODED_LABELS = ("xgb",)
+
+
+def _predict_blocks(model, X):
+    return np.concatenate([model.predict(X[s:s + PREDICT_CHUNK]) for s in range(0, len(X), PREDICT_CHUNK)])
+
+
+def fit_candidate(name, data_dir, model_path, n_jobs=1, seed=42, memory_limit_mb=None):
+    """Entraîne et évalue un candidat ; exécuté dans un processus dédié."""
+    from sklearn.metrics import accuracy_score, f1_score
+    import joblib
+
+    if memory_limit_mb:
+        limit = int(memory_limit_mb * 1024 * 1024)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    X, y = load_split(data_dir, "train")
+    Xt, yt = load_split(data_dir, "test")
+    classes = np.unique(y)
+    encoded = name in ENCODED_LABELS
+    y_fit = np.searchsorted(classes, y) if encoded else np.asarray(y)
+
+    model = make_candidate(name, y_fit, n_jobs=n_jobs, seed=seed)
+    t0 = time.perf_counter()
+    model.fit(X, y_fit)
+    fit_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    pred = _predict_blocks(model, Xt)
+    predict_s = time.perf_counter() - t0
+    if encoded:
+        pred = classes[pred.astype(np.intp)]
+
+    Path(model_path).parent.mkdir(parents=True, exist_ok=True)
+    joblib.dump(model, model_path)
+    return {
+        "fit_s": round(fit_s, 3),
+        "predict_s": round(predict_s, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "f1_macro": round(float(f1_score(yt, pred, average="macro")), 4),
+        "accuracy": round(float(accuracy_score(yt, pred)), 4),
+        "classes_encodees": encoded,
+    }
+
+
+def run(models=CANDIDATES, version="local", source="auto", n_jobs=1, seed=42, memory_limit_mb=None,
+        rebuild=False, data_dir=TRAIN_DIR, models_dir=MODELS_DIR, reports_dir=REPORTS_DIR):
+    """Matérialise les données si besoin, entraîne chaque candidat, écrit modèles et résultats."""
+    from .registry import record_sum
+
+    data_dir = Path(data_dir)
+    if rebuild or not (data_dir / "meta.json").exists():
+        materialize(source, data_dir)
+    meta = json.loads((data_dir / "meta.json").read_text(encoding="utf-8"))
+
+    results = []
+    ctx = get_context("spawn")
+    for name in models:
+        model_path = Path(models_dir) / version / f"{name}.joblib"
+        row = {"model": name, "n_train": meta["n_train"], "n_test": meta["n_test"],
+               "n_features": len(meta["columns"])}
+        t0 = time.perf_counter()
+        # Un processus neuf par candidat : pic RSS isolé, mémoire rendue au système ensuite
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            try:
+                row.update(pool.submit(fit_candidate, name, data_dir, model_path, n_jobs, seed,
+                                       memory_limit_mb).result())
+                row.update(status="ok", path=str(model_path.relative_to(models_dir)), sha256=record_sum(model_path))
+            except MemoryError:
+                row["status"] = "memoire"
+            except BrokenProcessPool:
+                row["status"] = "interrompu"   # processus tué (OOM killer, signal)
+            except Exception as exc:   # un candidat en échec n'arrête pas la série
+                row["status"] = f"erreur : {type(exc).__name__}: {exc}"
+        row["total_s"] = round(time.perf_counter() - t0, 3)
+        results.append(row)
+        print(f"{name:>14} {row['status']:<10} F1 macro={row.get('f1_macro', '-')} "
+              f"fit={row.get('fit_s', '-')} s pic RSS={row.get('peak_rss_mb', '-')} Mo")
+
+    report = {"version": version, "source": source, "target": meta["target"], "columns": meta["columns"],
+              "classes": meta["classes"], "reequilibrage": {"smote_ratio": SMOTE_RATIO, "rus_alpha": RUS_ALPHA},
+              "results": results}
+    out = Path(reports_dir) / f"train_{version}.json"
+    out.write_text(json.dumps(report, indent=1, ensure_ascii=False), encoding="utf-8")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Entraîne les modèles candidats à mémoire bornée.")
+    parser.add_argument("--models", nargs="+", default=list(CANDIDATES), choices=CANDIDATES)
+    parser.add_argument("--version", default="local", help="dossier models/<version>/")
+    parser.add_argument("--source", choices=("auto", "features", "mini"), default="auto")
+    parser.add_argument("--n-jobs", type=int, default=1)
+    parser.add_argument("--memory-limit-mb", type=float, help="limite d'espace d'adresses par candidat")
+    parser.add_argument("--rebuild", action="store_true", help="rematérialise X/y depuis la source")
+    args = parser.parse_args(argv)
+    run(args.models, args.version, args.source, args.n_jobs, memory_limit_mb=args.memory_limit_mb,
+        rebuild=args.rebuild)
+    print(f"Résultats : {REPORTS_DIR / f'train_{args.version}.json'}")
+
+
+if __name__ == "__main__":
+    main()
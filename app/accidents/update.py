@@ -0,0 +1,74 @@
+"""Mise à jour incrémentale après le dépôt d'une nouvelle édition annuelle.
+
+Enchaîne les trois étapes, chacune tenant son propre manifeste :
+
+1. ``accidents.store.ingest`` : CSV annuels -> partitions Parquet (taille, date et
+   SHA-256 de chaque fichier source dans ``data/store/_manifest.json``) ;
+2. ``accidents.pipeline.build_features`` : table par accident des seules années dont
+   une source ou une partition (schéma, format) a changé
+   (``data/store/features/_manifest.json``) ;
+3. ``accidents.cube.update_cube`` : lignes du cube de ces années uniquement
+   (``data/store/cube/_manifest.json``), quand le cube est construit depuis la table
+   par accident (et non depuis l'échantillon ``mini``).
+
+Une année inchangée n'est ni relue, ni réécrite. Les années sont celles des fichiers
+présents dans ``data/`` (``accidents.store.discover_annees``) : déposer
+``sample_<table>_2019.csv`` (ou ``<table>-2019.csv``) pour les quatre tables suffit.
+
+Ligne de commande : ``PYTHONPATH=app python -m accidents.update [--force]``
+"""
+import argparse
+import time
+
+from .config import DATA_DIR
+from .cube import update_cube
+from .pipeline import DEFAULT_CHUNK_SIZE, build_features
+from .store import STORE_DIR, discover_annees, ingest
+
+
+def update(force=False, chunk_size=DEFAULT_CHUNK_SIZE, data_dir=DATA_DIR, store_dir=STORE_DIR, source="auto"):
+    """Met à jour partitions, table par accident et cube. Renvoie le détail par étape."""
+    annees = discover_annees(data_dir=data_dir, store_dir=store_dir)
+    features_dir = store_dir / "features"
+
+    t0 = time.perf_counter()
+    written = ingest(annees=annees, force=force, data_dir=data_dir, store_dir=store_dir)
+    t1 = time.perf_counter()
+    features = build_features(annees, chunk_size, features_dir, store_dir, force, data_dir)
+    t2 = time.perf_counter()
+    cube = update_cube(store_dir / "cube" / "cube.parquet", features_dir, source)
+    t3 = time.perf_counter()
+    return {
+        "annees": annees,
+        "partitions": {"ecrites": written, "secondes": round(t1 - t0, 3)},
+        "features": {"recalculees": sorted(features["rows"]), "inchangees": features["skipped"],
+                     "accidents": sum(features["rows"].values()), "secondes": round(t2 - t1, 3)},
+        "cube": {**cube, "secondes": round(t3 - t2, 3)},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Intègre les années nouvelles ou modifiées sans retraiter les autres.")
+    parser.add_argument("--force", action="store_true", help="retraite toutes les années")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--source", choices=("auto", "features", "mini"), default="auto",
+                        help="source du cube (accidents.cube)")
+    args = parser.parse_args(argv)
+    res = update(args.force, args.chunk_size, source=args.source)
+    annees = res["annees"]
+    print(f"Années trouvées : {annees[0]}-{annees[-1]} ({len(annees)})" if annees else "Aucune année trouvée")
+    written = sorted({a for _, a in res["partitions"]["ecrites"]})
+    print(f"Partitions : {len(res['partitions']['ecrites'])} écrite(s), années {written} "
+          f"({res['partitions']['secondes']} s)")
+    print(f"Table par accident : années {res['features']['recalculees']} recalculées "
+          f"({res['features']['accidents']} accidents), {len(res['features']['inchangees'])} inchangée(s) "
+          f"({res['features']['secondes']} s)")
+    if res["cube"]["source"] == "mini":
+        print("Cube : construit depuis l'échantillon mini, inchangé")
+    else:
+        print(f"Cube : années {res['cube']['recalculees']} recalculées, {res['cube']['retirees']} retirées "
+              f"({res['cube']['secondes']} s)")
+
+
+if __name__ == "__main__":
+    main()
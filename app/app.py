@@ -1,4 +1,7 @@
 import streamlit as st
+from accidents.tracing import begin_run, sidebar_panel
+
+begin_run("Accueil")
 
 # 1) largeur de page : "centered" ou "wide"
 st.set_page_config(layout="centered", page_title="Accidents routiers", page_icon="🚧")
@@ -81,3 +84,5 @@ Notre démarche est donc progressive :
 1.	partir d’une **exploration** descriptive des données,
 2.	poursuivre avec un travail de **visualisation et de pré-processing**,
 3.	avant d’aborder la **modélisation** proprement dite.""")
+
+sidebar_panel()
@@ -1,18 +1,16 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
-from sklearn.preprocessing import OneHotEncoder
-from scipy.stats import chi2_contingency
-import plotly.express as px
 import warnings
 warnings.filterwarnings("ignore")
-import io
-from PIL import Image
+from accidents.browse import PAGE_SIZES, choices, n_pages, query, summary, summary_caption, value_range
+from accidents.shared import MERGED, get_shared
+from accidents.cube import MOMENT_LABELS, cube_fingerprint, filter_cube, load_cube, shares, totals
+from accidents.pipeline import GRAV_LABELS
+from accidents.tracing import begin_run, sidebar_panel, span, traced
+# plotly et scipy (via accidents.association) ne sont importés que par la section Dataviz
 
 # 1) largeur de page : "centered" ou "wide"
 st.set_page_config(layout="centered", page_title="Accidents routiers", page_icon="🚧")
+begin_run("Exploration")
 
 # 2) CSS simple : largeur max + tailles + espacement
 st.markdown("""
@@ -65,101 +63,52 @@ Il a donc fallu évaluer leur pertinence afin de décider de les garder ou non.
 """)
 
 #############################################################################
-##                      Caractéristiques                                   ##
+##                 Aperçu des tables (Caractéristiques, Usagers, Lieux, Véhicules)
 #############################################################################
 
-#st.markdown("<u><font size=5>__Caractéristiques__</font></u>", unsafe_allow_html=True)
-
-@st.cache_data
-def load_caracteristiques_2005_2018():
-    caracteristiques_2005_2018 = []
-    dtypes_caracs = {
-        "dep": "category", "com": "category",
-        "lum": "int8", "agg": "int8", "int": "int8",
-        "atm": "int8", "col": "int8",
-        "mois": "int8", "jour": "int8", "an": "int16"
-    }
-
-    for annee in range(2005, 2019):                                            #### Filtrer jusqu'en 2009 au lieu de 2019 (pour les tests)
-        chemin = f'data/sample_caracteristiques_{annee}.csv'  
-        #sep = '\t' if annee == 2009 else ','
-        sep=','
-        df = pd.read_csv(
-            chemin, sep=',', encoding='latin1',
-            dtype={'dep': str, 'com': str, 'hrmn': str}  
-        )
-        df['annee'] = annee
-        caracteristiques_2005_2018.append(df)
-
-    caracs = pd.concat(caracteristiques_2005_2018, ignore_index=True)
-    return caracs
-
-# Appel
-caracs = load_caracteristiques_2005_2018()
-
-
-#############################################################################
-##                              Usagers                                    ##
-#############################################################################
-#st.markdown("<u><font size=5>__Usagers__</font></u>", unsafe_allow_html=True)
-
-@st.cache_data
-def load_usagers_2005_2018():
-    usagers_2005_2018 = []
-    for annee in range(2005, 2019):                                            #### Filtrer jusqu'en 2009 au lieu de 2019 (pour les tests)
-        chemin = f'data/sample_usagers_{annee}.csv'
-        df = pd.read_csv(chemin, sep=',', encoding='latin1')
-        df['annee'] = annee
-        usagers_2005_2018.append(df)
-
-    usagers = pd.concat(usagers_2005_2018, ignore_index=True)
-    return usagers
-
-# Appel
-usagers = load_usagers_2005_2018()
-
-
-
-#############################################################################
-##                              Lieux                                      ##
-#############################################################################
-#st.markdown("<u><font size=5>__Lieux__</font></u>", unsafe_allow_html=True)
-
-@st.cache_data
-def load_lieux_2005_2018():
-    lieux_2005_2018 = []
-    for annee in range(2005, 2019):                                            #### Filtrer jusqu'en 2009 au lieu de 2019 (pour les tests)
-        chemin = f'data/sample_lieux_{annee}.csv'
-        df = pd.read_csv(chemin, sep=',', encoding='latin1')
-        df['annee'] = annee
-        lieux_2005_2018.append(df)
-
-    lieux = pd.concat(lieux_2005_2018, ignore_index=True)
-    return lieux
-
-# Appel
-lieux = load_lieux_2005_2018()
-
-
-#############################################################################
-##                              Vehicules                                  ##
-#############################################################################
-#st.markdown("<u><font size=5>__Vehicules__</font></u>", unsafe_allow_html=True)
-
-@st.cache_data
-def load_vehicules_2005_2018():
-    vehicules_2005_2018 = []
-    for annee in range(2005, 2019):                                            #### Filtrer jusqu'en 2009 au lieu de 2019 (pour les tests)
-        chemin = f'data/sample_vehicules_{annee}.csv'
-        df = pd.read_csv(chemin, sep=',', encoding='latin1')
-        df['annee'] = annee
-        vehicules_2005_2018.append(df)
-
-    vehicules = pd.concat(vehicules_2005_2018, ignore_index=True)
-    return vehicules
-
-# Appel
-vehicules = load_vehicules_2005_2018()
+def browse_table(name):
+    """Table paginée : colonnes, filtre et tri appliqués côté serveur sur la vue Arrow
+    partagée (accidents.shared), seule la page affichée est envoyée au navigateur."""
+    t = get_shared().table(name)
+    with st.expander("Colonnes, filtre et tri"):
+        cols = st.multiselect("Colonnes affichées", t.column_names, default=t.column_names, key=f"{name}_cols")
+        f1, f2 = st.columns(2)
+        fcol = f1.selectbox("Filtrer sur", [None, *t.column_names], format_func=lambda c: c or "—",
+                            key=f"{name}_filtre")
+        filters = {}
+        if fcol is not None:
+            values = choices(t, fcol)
+            bounds = value_range(t, fcol) if values is None else None
+            if values is not None:
+                filters[fcol] = f2.multiselect("Valeurs", values, key=f"{name}_valeurs_{fcol}")
+            elif bounds is not None and bounds[0] < bounds[1]:
+                filters[fcol] = f2.slider("Intervalle", *bounds, value=bounds, key=f"{name}_intervalle_{fcol}")
+            else:
+                filters[fcol] = f2.text_input("Contient", key=f"{name}_texte_{fcol}")
+        s1, s2 = st.columns(2)
+        sort = s1.selectbox("Trier par", [None, *t.column_names], format_func=lambda c: c or "—", key=f"{name}_tri")
+        descending = s2.toggle("Ordre décroissant", key=f"{name}_desc")
+    p1, p2 = st.columns(2)
+    page_size = p1.selectbox("Lignes par page", PAGE_SIZES, key=f"{name}_taille")
+    page = p2.number_input("Page", min_value=1, value=1, step=1, key=f"{name}_page")
+    if not cols:
+        st.info("Choisir au moins une colonne.")
+        return t
+    df, n = query(t, cols, filters, sort, descending, page - 1, page_size)
+    with span("rendu.dataframe", rows=len(df)):
+        st.dataframe(df)
+    k, pages = min(page, n_pages(n, page_size)), n_pages(n, page_size)
+    first = (k - 1) * page_size
+    total = f"{n:,}".replace(",", " ")
+    st.caption(f"Lignes {first + 1}–{first + len(df)} sur {total} retenues, page {k}/{pages}"
+               if n else "Aucune ligne retenue.")
+    return t
+
+def info_table(t):
+    # Équivalent de df.info() calculé sur la vue Arrow (métadonnées, sans conversion)
+    info = summary(t)
+    st.dataframe(info, hide_index=True)
+    st.caption(summary_caption(t, info))
 
 
 #############################################################################
@@ -168,147 +117,60 @@ vehicules = load_vehicules_2005_2018()
 
 st.divider()
 
-# Onglets pour organiser ton code existant (colle tes blocs EDA dans les bons onglets)
-tab1, tab2, tab3 = st.tabs(["📥 Chargement", "🔍 Exploration / 🧼 Nettoyage", "📊 Dataviz"])
-with tab1:
+# Sections : contrairement à st.tabs, seule la section affichée est exécutée
+# (ses imports et ses chargements de données n'ont lieu qu'à son ouverture)
+SECTIONS = ["📥 Chargement", "🔍 Exploration / 🧼 Nettoyage", "📊 Dataviz"]
+section = st.segmented_control("Section", SECTIONS, default=SECTIONS[0], key="exploration_section",
+                               label_visibility="collapsed") or SECTIONS[0]
+
+if section == SECTIONS[0]:
     st.markdown("#### Aperçu du DataFrame : `Caractéristiques`")
-    st.dataframe(caracs.head())
+    caracs = browse_table("caracteristiques")
     c1, c2, c3 = st.columns(3)
     c1.metric("Lignes totales (full):", "958 469")
-    c2.metric("Lignes totales (sample):", f"{caracs.shape[0]:,}".replace(",", " "))
-    c3.metric("Colonnes totales:", caracs.shape[1])
-    #c3.metric("Mémoire (Mo)", round(caracs.memory_usage(deep=True).sum()/1024**2, 2))
+    c2.metric("Lignes totales (sample):", f"{caracs.num_rows:,}".replace(",", " "))
+    c3.metric("Colonnes totales:", caracs.num_columns)
 
     st.subheader("Résumé du DataFrame : `Caractéristiques`")
-    st.code("""
-    <class 'pandas.core.frame.DataFrame'>
-    RangeIndex: 958469 entries, 0 to 958468
-    Data columns (total 17 columns):
-    #   Column   Non-Null Count   Dtype  
-    ---  ------   --------------   -----  
-    0   Num_Acc  958469 non-null  int64  
-    1   an       958469 non-null  int64  
-    2   mois     958469 non-null  int64  
-    3   jour     958469 non-null  int64  
-    4   hrmn     958469 non-null  object 
-    5   lum      958469 non-null  int64  
-    6   agg      958469 non-null  int64  
-    7   int      958469 non-null  int64  
-    8   atm      958396 non-null  float64
-    9   col      958450 non-null  float64
-    10  com      958467 non-null  object 
-    11  adr      816550 non-null  object 
-    12  gps      480052 non-null  object 
-    13  lat      471401 non-null  float64
-    14  long     471397 non-null  object 
-    15  dep      958469 non-null  object 
-    16  annee    958469 non-null  int64  
-    dtypes: float64(3), int64(8), object(6)
-    """)
+    info_table(caracs)
 
     st.divider()
 
     st.markdown("#### Aperçu du DataFrame : `Usagers`")
-    st.dataframe(usagers.head())
+    usagers = browse_table("usagers")
     c1, c2, c3 = st.columns(3)
     c1.metric("Lignes totales (full):", "2 142 195")
-    c2.metric("Lignes totales (sample):", f"{usagers.shape[0]:,}".replace(",", " "))
-    c3.metric("Colonnes totales:", usagers.shape[1])
-    #c3.metric("Mémoire (Mo)", round(usagers.memory_usage(deep=True).sum()/1024**2, 2))
+    c2.metric("Lignes totales (sample):", f"{usagers.num_rows:,}".replace(",", " "))
+    c3.metric("Colonnes totales:", usagers.num_columns)
    
     st.subheader("Résumé du DataFrame : `Usagers`")
-    st.code("""
-    <class 'pandas.core.frame.DataFrame'>
-    RangeIndex: 2142195 entries, 0 to 2142194
-    Data columns (total 13 columns):
-    #   Column   Dtype  
-    ---  ------   -----  
-    0   Num_Acc  int64  
-    1   place    float64
-    2   catu     int64  
-    3   grav     int64  
-    4   sexe     int64  
-    5   trajet   float64
-    6   secu     float64
-    7   locp     float64
-    8   actp     float64
-    9   etatp    float64
-    10  an_nais  float64
-    11  num_veh  object 
-    12  annee    int64  
-    dtypes: float64(7), int64(5), object(1)
-    """)
+    info_table(usagers)
     
     st.divider()
 
     st.markdown("#### Aperçu du DataFrame : `Lieux`")
-    st.dataframe(lieux.head())
+    lieux = browse_table("lieux")
     c1, c2, c3 = st.columns(3)
     c1.metric("Lignes totales (full):", "958 469")
-    c2.metric("Lignes totales (sample):", f"{lieux.shape[0]:,}".replace(",", " "))
-    c3.metric("Colonnes totales:", lieux.shape[1])
-    #c3.metric("Mémoire (Mo)", round(lieux.memory_usage(deep=True).sum()/1024**2, 2))
+    c2.metric("Lignes totales (sample):", f"{lieux.num_rows:,}".replace(",", " "))
+    c3.metric("Colonnes totales:", lieux.num_columns)
             
     st.subheader("Résumé du DataFrame : `Lieux`")
-    st.code("""
-    <class 'pandas.core.frame.DataFrame'>
-    RangeIndex: 958469 entries, 0 to 958468
-    Data columns (total 19 columns):
-    #   Column   Non-Null Count   Dtype  
-    ---  ------   --------------   -----  
-    0   Num_Acc  958469 non-null  int64  
-    1   catr     958468 non-null  float64
-    2   voie     869558 non-null  object 
-    3   v1       333391 non-null  float64
-    4   v2       39348 non-null   object 
-    5   circ     956895 non-null  float64
-    6   nbv      955738 non-null  float64
-    7   pr       482985 non-null  float64
-    8   pr1      481166 non-null  float64
-    9   vosp     955708 non-null  float64
-    10  prof     956520 non-null  float64
-    11  plan     956188 non-null  float64
-    12  lartpc   902271 non-null  float64
-    13  larrout  904096 non-null  float64
-    14  surf     956545 non-null  float64
-    15  infra    953061 non-null  float64
-    16  situ     953499 non-null  float64
-    17  env1     953029 non-null  float64
-    18  annee    958469 non-null  int64  
-    dtypes: float64(15), int64(2), object(2)
-    """)
+    info_table(lieux)
     st.divider()
 
     st.markdown("#### Aperçu du DataFrame : `Véhicules`")
-    st.dataframe(vehicules.head())
+    vehicules = browse_table("vehicules")
     c1, c2, c3 = st.columns(3)
     c1.metric("Lignes totales (full):", "1 635 811")
-    c2.metric("Lignes totales (sample):", f"{vehicules.shape[0]:,}".replace(",", " "))
-    c3.metric("Colonnes totales:", vehicules.shape[1])
-    #c3.metric("Mémoire (Mo)", round(vehicules.memory_usage(deep=True).sum()/1024**2, 2))  
+    c2.metric("Lignes totales (sample):", f"{vehicules.num_rows:,}".replace(",", " "))
+    c3.metric("Colonnes totales:", vehicules.num_columns)
 
     st.subheader("Résumé du DataFrame `Vehicules`")
-    st.code("""
-    <class 'pandas.core.frame.DataFrame'>
-    RangeIndex: 1635811 entries, 0 to 1635810
-    Data columns (total 10 columns):
-    #   Column   Non-Null Count    Dtype  
-    ---  ------   --------------    -----  
-    0   Num_Acc  1635811 non-null  int64  
-    1   senc     1635539 non-null  float64
-    2   catv     1635811 non-null  int64  
-    3   occutc   1635811 non-null  int64  
-    4   obs      1634805 non-null  float64
-    5   obsm     1635033 non-null  float64
-    6   choc     1635414 non-null  float64
-    7   manv     1635343 non-null  float64
-    8   num_veh  1635811 non-null  object 
-    9   annee    1635811 non-null  int64  
-    dtypes: float64(5), int64(4), object(1)
-    """)
+    info_table(vehicules)
 
             
-with tab2:
+if section == SECTIONS[1]:
     st.write("### Préparation des données")
     st.write(""" Pour préparer au mieux les données en vue de la modélisation, nous avons testé deux approches :
     - la première consistait à prétraiter chaque DataFrame séparément avant de les fusionner,
@@ -573,8 +435,67 @@ with tab2:
 
 
 
-with tab3:
+#############################################################################
+##                     Cube de comptages (Dataviz)                         ##
+#############################################################################
+
+@traced("exploration.load_cube_dataviz")
+@st.cache_resource(max_entries=1)
+def load_cube_dataviz(fingerprint):
+    # Un seul exemplaire par processus, partagé par toutes les sessions ; rechargé quand
+    # update_cube (ou une reconstruction) réécrit le cube et son manifeste
+    return load_cube()
+
+LABELS = {"n_accidents": "Nombre d'accidents", "annee": "Année", "mois": "Mois", "part": "% des accidents",
+          "usagers": "Nombre d'usagers", "modalite": ""}
+
+def chart(fig, height=380):
+    fig.update_layout(margin=dict(l=10, r=10, t=50, b=10), height=height)
+    with span("rendu.plotly_chart"):
+        st.plotly_chart(fig, use_container_width=True)
+
+def repartition_usagers(cube, measures, title, names=None):
+    t = cube[measures].sum().rename(index=names or {}).rename_axis("modalite").reset_index(name="usagers")
+    chart(px.bar(t, x="modalite", y="usagers", title=title, labels=LABELS, text_auto=True))
+
+# ``fingerprint`` : empreinte de l'instantané partagé, recalcul quand les données changent
+@traced("exploration.association_gravite")
+@st.cache_data(max_entries=4)
+def association_gravite(fingerprint, bias_correction=False):
+    # Chi² / V de Cramér de chaque variable avec la gravité, sur la table par accident
+    res = association(get_shared().frame(MERGED), target="grav_order_max", bias_correction=bias_correction,
+                      n_jobs=N_JOBS)
+    return with_target(res, "grav_order_max")
+
+@traced("exploration.matrice_association")
+@st.cache_data(max_entries=2)
+def matrice_association(fingerprint):
+    return to_matrix(association(get_shared().frame(MERGED), n_jobs=N_JOBS))
+
+def distribution_gravite(cube, by, title):
+    t = shares(cube, "grav_order_max", by)
+    t["Gravité"] = t["grav_order_max"].map(GRAV_LABELS).fillna("Inconnue")
+    chart(px.bar(t, x=by, y="part", color="Gravité", barmode="group", title=title,
+                 labels=LABELS, category_orders={"Gravité": list(GRAV_LABELS.values())}))
+
+
+if section == SECTIONS[2]:
+    import plotly.express as px
+    from accidents.association import N_JOBS, association, to_matrix, with_target
+
     st.markdown("#### Dataviz")
+    cube = load_cube_dataviz(cube_fingerprint())
+    with st.expander("Filtres"):
+        a0, a1 = int(cube["annee"].min()), int(cube["annee"].max())
+        annees = st.slider("Années", a0, a1, (a0, a1)) if a0 < a1 else (a0, a1)
+        f1, f2, f3 = st.columns(3)
+        agg_sel = f1.multiselect("Agglomération (agg)", sorted(cube["agg"].unique()))
+        lum_sel = f2.multiselect("Luminosité (lum)", sorted(cube["lum"].unique()))
+        grav_sel = f3.multiselect("Gravité", sorted(cube["grav_order_max"].unique()),
+                                  format_func=lambda g: GRAV_LABELS.get(g, str(g)))
+        dep_sel = st.multiselect("Département", list(cube["dep"].cat.categories))
+    cube_f = filter_cube(cube, annee=annees, agg=agg_sel, lum=lum_sel, grav_order_max=grav_sel, dep=dep_sel)
+    st.caption(f"{int(cube_f['n_accidents'].sum()):,} accidents sélectionnés".replace(",", " "))
     #############################################################################
     ##                                DataViz                                  ##
     #############################################################################
@@ -583,14 +504,14 @@ with tab3:
     ## Nombre d'accident par années (=>sample => 1000 lignes = 1000 accidents)
     #####
             
-    # Chargement de graphes issus du notebook
+    # Graphiques calculés depuis le cube ; les matrices de corrélation restent issues du notebook
     #for name in ["Evol_acc_annee.png","Evol_acc_mois.png","Repart_moment.png", "Repart_age.png", "Repart_sexe.png", "Repart_Trajet.png", "Repart_Gravité.png","Dist_agg_grav.png", "Dist_int_grav.png", "Dist_lum_grav.png", "Dist_secu_grav.png", "Corr_var_expl_Grav.png", "Corr_var_expl.png"]
      
     col = st.columns([1,12,1])[1]
     with col:
          # Evol accidents/année
-         name="Evol_acc_annee.png"
-         st.image(f"reports/{name}", width=400, use_container_width=True)
+         chart(px.line(totals(cube_f, "annee"), x="annee", y="n_accidents", markers=True,
+                       title="Évolution du nombre d'accidents par année", labels=LABELS))
          st.markdown("""
          **Analyse :** 
          - Baisse nette et continue entre 2005 et 2018 - coïncide avec l'installation de plus de 500 radars en 2005
@@ -599,8 +520,8 @@ with tab3:
 
     # Evol accidents/mois
     with col:
-         name="Evol_acc_mois.png"
-         st.image(f"reports/{name}", width=400, use_container_width=True)
+         chart(px.bar(totals(cube_f, "mois"), x="mois", y="n_accidents",
+                      title="Nombre d'accidents par mois", labels=LABELS))
          st.markdown("""
          **Analyse :** 
          - Accidents plus fréquents entre avril et juillet : pic estival lié à l'augmentation des déplacements (vacances, loisirs, + motards/cyclistes)  
@@ -610,8 +531,9 @@ with tab3:
 
     # Repart/moment
     with col:
-         name="Repart_moment.png"
-         st.image(f"reports/{name}", width=400, use_container_width=True)
+         t = totals(cube_f, "moment")
+         t["moment"] = t["moment"].map(MOMENT_LABELS)
+         chart(px.pie(t, names="moment", values="n_accidents", title="Répartition des accidents par moment de la journée"))
          st.markdown("""
          **Analyse :** 
          - L'après-midi est la période la plus accidentogène (38.5%) : corrélé à un trafic élevé et à un rythme de circulation actif  
@@ -623,8 +545,7 @@ with tab3:
 
     # Repart/age
     with col:
-         name="Repart_age.png"
-         st.image(f"reports/{name}", width=400, use_container_width=True)
+         repartition_usagers(cube_f, ["Enfant", "Jeune", "Adulte", "Senior"], "Répartition des usagers par classe d'âge")
          st.markdown("""
          **Analyse :** 
          - Les **adultes** constituent la majorité des usagers accidentés, en lien avec leur exposition plus forte au trafic quotidien
@@ -635,8 +556,8 @@ with tab3:
      
     # Repart/sexe
     with col:
-         name="Repart_sexe.png"
-         st.image(f"reports/{name}", width=400, use_container_width=True)
+         t = cube_f[["Homme", "Femme"]].sum().rename_axis("sexe").reset_index(name="usagers")
+         chart(px.pie(t, names="sexe", values="usagers", title="Répartition des usagers par sexe"))
          st.markdown("""
          **Analyse :** 
          - Les **hommes** représentent environ deux tiers des usagers impliqués dans un accident
@@ -647,8 +568,8 @@ with tab3:
      
     # Repart/Trajet
     with col:
-         name="Repart_Trajet.png"
-         st.image(f"reports/{name}", width=400, use_container_width=True)
+         repartition_usagers(cube_f, ["Loisirs", "Travail", "Professionnel", "Inconnu", "Autre_y"],
+                             "Répartition des usagers par motif de trajet", names={"Autre_y": "Autre"})
          st.markdown("""
          **Analyse :** 
          - Les **trajets de loisirs** sont majoritaires parmi les usagers impliqués, 
@@ -661,8 +582,10 @@ with tab3:
      
     # Repart/Gravité
     with col:
-         name="Repart_Gravité.png"
-         st.image(f"reports/{name}", width=400, use_container_width=True)
+         t = totals(cube_f, "grav_order_max")
+         t["Gravité"] = t["grav_order_max"].map(GRAV_LABELS).fillna("Inconnue")
+         chart(px.bar(t, x="Gravité", y="n_accidents", title="Gravité maximale par accident", labels=LABELS,
+                      category_orders={"Gravité": list(GRAV_LABELS.values())}))
          st.markdown("""
          **Analyse :** 
          - La majorité des accidents impliquent des **usagers indemnes**
@@ -674,8 +597,7 @@ with tab3:
 
     # Distribution agg/gravite
     with col:
-         name="Dist_agg_grav.png"
-         st.image(f"reports/{name}", width=400, use_container_width=True)
+         distribution_gravite(cube_f, "agg", "Gravité selon la localisation (1 = hors agglomération, 2 = en agglomération)")
          st.markdown("""
          **Analyse :** 
          - Les **accidents hors agglomération** sont proportionnellement **plus graves** (davantage de blessés graves et de tués)
@@ -686,8 +608,7 @@ with tab3:
      
     # Distribution int/gravite
     with col:
-         name="Dist_int_grav.png"
-         st.image(f"reports/{name}", width=400, use_container_width=True)
+         distribution_gravite(cube_f, "int", "Gravité selon le type d'intersection")
          with st.expander("Définition des labels `int` (type d'intersection)"):
              st.markdown("""
              | Code | Type d'intersection |
@@ -714,8 +635,7 @@ with tab3:
 
     # Distribution lum/gravite
     with col:
-         name="Dist_lum_grav.png"
-         st.image(f"reports/{name}", width=400, use_container_width=True)
+         distribution_gravite(cube_f, "lum", "Gravité selon la luminosité")
          with st.expander("Définition des valeurs `lum`"):
             st.markdown("""
              | Code | Type d'intersection |
@@ -737,8 +657,7 @@ with tab3:
      
     # Distribution secu/gravite
     with col:
-         name="Dist_secu_grav.png"
-         st.image(f"reports/{name}", width=400, use_container_width=True)
+         distribution_gravite(cube_f, "secu", "Gravité selon l'équipement de sécurité")
          with st.expander("Définition des valeurs `secu`"):
              st.markdown("""
               | Code | Signification |
@@ -761,8 +680,15 @@ with tab3:
 
     # Corr var expl/gravite
     with col:
-         name="Corr_var_expl_Grav.png"
-         st.image(f"reports/{name}", width=400, use_container_width=True)
+         biais = st.checkbox("V de Cramér corrigé du biais (Bergsma)", key="cramer_biais")
+         fingerprint = get_shared().snapshot_fingerprint(MERGED)
+         t = association_gravite(fingerprint, biais).sort_values("cramers_v")
+         chart(px.bar(t, x="cramers_v", y="variable", orientation="h", hover_data=["chi2", "ddl", "p_value"],
+                      title="Association des variables explicatives avec la gravité maximale (V de Cramér)",
+                      labels={"cramers_v": "V de Cramér", "variable": ""}), height=max(400, 18 * len(t)))
+         with st.expander("Matrice complète (V de Cramér)"):
+             chart(px.imshow(matrice_association(fingerprint), color_continuous_scale="Reds", zmin=0, zmax=1),
+                   height=800)
          st.markdown("""
          **Analyse :** 
          - Aucune variable avec corrélation forte (> 0.3), mais certaines tendances directionnelles
@@ -782,5 +708,4 @@ with tab3:
          """)
          st.divider()
 
-
-
+sidebar_panel()
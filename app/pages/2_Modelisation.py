@@ -1,7 +1,9 @@
 import streamlit as st
 import pandas as pd
 import os
+from accidents.tracing import begin_run, sidebar_panel
 
+begin_run("Modélisation")
 st.title("Modélisation")
 st.write("""Nous avons encodé la variable gravité afin d’obtenir une seule ligne par accident, correspondant à la gravité maximale observée.
 La classe Indemne a ainsi disparu, laissant un modèle de prédiction sur trois niveaux de gravité : Blessé léger, Blessé hospitalisé et Tué.""")
@@ -87,13 +89,21 @@ with st.expander("Voir le résultat"):
   st.image("reports/Balanced_Random_hyperparam_debut.png", use_container_width=True)
   st.image("reports/Balanced_Random_hyperparam.png", use_container_width=True)
 
-
-
-
-
-
-
-
-
-
-
+st.write("#### Derniers entraînements")
+runs = sorted((f for f in os.listdir("reports") if f.startswith("train_") and f.endswith(".json")),
+              key=lambda f: os.path.getmtime(os.path.join("reports", f)))
+if runs:
+  run = pd.read_json(os.path.join("reports", runs[-1]), typ="series")
+  st.caption(f"Version {run['version']} : {len(run['columns'])} variables, cible {run['target']}")
+  if "reequilibrage" in run:
+    r = run["reequilibrage"]
+    st.caption(f"hgb_smote_rus : cibles du notebook, SMOTE jusqu'à {r['smote_ratio']} x la classe majoritaire "
+               f"puis RUS plafonné à {r['rus_alpha']} x")
+  res = pd.DataFrame(run["results"])
+  cols = [c for c in ["model", "status", "f1_macro", "accuracy", "fit_s", "predict_s", "peak_rss_mb", "n_train"] if c in res]
+  st.dataframe(res[cols].sort_values("f1_macro", ascending=False) if "f1_macro" in res else res[cols],
+               use_container_width=True, hide_index=True)
+else:
+  st.info("Aucun résultat : lancer `PYTHONPATH=app python -m accidents.train`")
+
+sidebar_panel()
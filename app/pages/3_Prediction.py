@@ -1,8 +1,19 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import plotly.express as px
 import streamlit as st
 import pandas as pd
-import joblib
-import requests
-
+from accidents.cache import CachedScorer, get_cache
+from accidents.explain import explainer_for, importance_path, needs_pickle
+from accidents.registry import ArtifactUnavailable, get_registry
+from accidents.scoring import Scorer
+from accidents.service import SERVICE_URL_ENV, ServiceClient
+from accidents.sweep import SWEEP_VARIABLES, observed_values, sweep
+from accidents.tracing import begin_run, sidebar_panel, span
+
+begin_run("Prédiction")
 st.title("🎯 Démo de prédiction")
 
 # --- Charger le modèle et le sample ---
@@ -26,18 +37,30 @@ st.title("🎯 Démo de prédiction")
 #                 low_memory=False)
 
 FEATURES = ["lum","secu","col","obs", "catv","situ", "agg", "surf","atm"]  
-df = pd.read_csv("data/X_test_encoded_sample.csv",
-                 sep=",",
-                 #skiprows=1,    # J'ai ajouté ce saut car une ligne est apparue dans ce df en 1ere ligne!??
-                 nrows=1000,
-                 low_memory=False)
-#df = df_full[(df_full[["lum","secu","col","obs", "catv","situ", "agg", "surf","atm"]] != -1).all(axis=1)]
-
-y = pd.read_csv("data/y_test_encoded_sample.csv",
-                sep=",",
-                nrows=1000)
-
-base_url = "https://github.com/pestao233/DS_Accidents/releases/download/v1.0/"
+X_SAMPLE = Path("data/X_test_encoded_sample.csv")
+if not X_SAMPLE.exists():
+    st.warning(f"Échantillon encodé introuvable : {X_SAMPLE}. Il est produit par le notebook de modélisation "
+               "(X_test encodé, mêmes colonnes que le scaler du modèle).")
+    sidebar_panel()
+    st.stop()
+with span("prediction.lecture_echantillon") as s:
+    df = pd.read_csv(X_SAMPLE,
+                     sep=",",
+                     #skiprows=1,    # J'ai ajouté ce saut car une ligne est apparue dans ce df en 1ere ligne!??
+                     nrows=1000,
+                     low_memory=False)
+    #df = df_full[(df_full[["lum","secu","col","obs", "catv","situ", "agg", "surf","atm"]] != -1).all(axis=1)]
+
+    y = pd.read_csv("data/y_test_encoded_sample.csv",
+                    sep=",",
+                    nrows=1000)
+    s.rows = len(df)
+
+# Artefacts du modèle : résolus par le registre (models/, manifeste lien_release_*.txt),
+# chargés une seule fois par processus et partagés entre les sessions
+MODEL_VERSION = "v1.0"
+SCALER_FILE = "Enora_scaler.joblib"
+MODEL_FILE = "Modele_Enora_rf.joblib"
 
 
 st.write("Choisissez ou modifiez quelques variables ci-dessous pour tester le modèle :")
@@ -46,8 +69,15 @@ st.write("Choisissez ou modifiez quelques variables ci-dessous pour tester le mo
 index = st.number_input("Numéro de ligne de référence", min_value=1, max_value=len(df)-1, value=1)
 row = df.iloc[index].copy()
 
+def show_row(row, key):
+    # Projection : seules les colonnes choisies sont envoyées au navigateur
+    # (par défaut les variables modifiables ci-dessous)
+    cols = st.multiselect("Colonnes affichées", list(row.index), default=[c for c in FEATURES if c in row.index],
+                          key=key)
+    st.dataframe(pd.DataFrame([row[cols]]), use_container_width=True)
+
 st.write("Voici la ligne choisie:")
-st.dataframe(pd.DataFrame([row[:40]]), use_container_width=True)
+show_row(row, "colonnes_reference")
 
 st.info(f"👉 Gravité réelle (dans le dataset) : **{y.iloc[index,0]}**")
 
@@ -106,38 +136,134 @@ if "atm" in df.columns: # atm=3(pluie forte), 5(brouillard), 6 (vent fort)
 st.divider()
 
 st.write("**Observation envoyée au modèle (après modification) :**")
-st.dataframe(pd.DataFrame([row[:40]]), use_container_width=True)
-
+show_row(row, "colonnes_observation")
+
+
+
+def load_scorer():
+    """Client du service de prédiction si ``ACCIDENTS_SERVICE_URL`` est défini, sinon
+    scaler + modèle du registre (chargés une fois par processus), derrière le cache de
+    prédictions partagé par toutes les sessions."""
+    if os.environ.get(SERVICE_URL_ENV):
+        return ServiceClient()
+    try:
+        scorer = Scorer.from_registry(get_registry(), SCALER_FILE, MODEL_FILE, version=MODEL_VERSION)
+        return CachedScorer(scorer, get_cache())
+    except (FileNotFoundError, ValueError, ArtifactUnavailable) as e:
+        st.error(f"Modèle indisponible : {e}")
+        sidebar_panel()
+        st.stop()
+
+
+def score(X):
+    scorer = load_scorer()
+    try:
+        return scorer, scorer.score(X)
+    except (OSError, RuntimeError) as e:   # service injoignable ou en erreur
+        st.error(f"Service de prédiction indisponible : {e}")
+        sidebar_panel()
+        st.stop()
+
+
+def explain_prediction(scorer, row, res):
+    """Contributions SHAP de la classe prédite (explainer construit une fois par modèle)."""
+    try:
+        explainer = explainer_for(scorer, get_registry(), MODEL_FILE)
+    except (ImportError, TypeError, ValueError, FileNotFoundError, ArtifactUnavailable) as e:
+        st.info(f"Explications indisponibles pour ce modèle : {e}")
+        return
+    if needs_pickle(scorer):
+        st.caption("Explications calculées sur le modèle complet : il reste en mémoire avec l'explainer, "
+                   "en plus de l'export compact servi pour les prédictions.")
+    k = int(np.flatnonzero(res.classes == res.pred[0])[0]) if len(res.classes) else 0
+    contrib = explainer.explain_row(scorer.transform(scorer.align(row)), k).head(12)
+    fig = px.bar(contrib.iloc[::-1], x="contribution", y="variable", orientation="h",
+                 color=contrib.iloc[::-1]["contribution"] > 0, color_discrete_map={True: "#d62728", False: "#1f77b4"},
+                 hover_data=["valeur"], title=f"Contributions à la classe {res.pred[0]}")
+    fig.update_layout(showlegend=False, height=420, margin=dict(l=10, r=10, t=50, b=10))
+    st.plotly_chart(fig, use_container_width=True)
+    importance = importance_path(scorer.version, MODEL_FILE)
+    if importance.exists():
+        top = pd.read_csv(importance).head(15)
+        fig = px.bar(top.iloc[::-1], x="total", y="variable", orientation="h",
+                     title="Importance globale (moyenne des |SHAP| sur l'échantillon de test)")
+        fig.update_layout(height=420, margin=dict(l=10, r=10, t=50, b=10))
+        st.plotly_chart(fig, use_container_width=True)
 
 
 # Bouton de prédiction
 if st.button("Lancer la prédiction"):
-    X = pd.DataFrame([row])
-    #X = X.drop(["grav_simpl"], axis=1)
-    for file in ["Enora_scaler.joblib","Modele_Enora_rf.joblib"]:
-        r = requests.get(base_url + file)
-        with open(file, "wb") as f:
-            f.write(r.content)
+    scorer, res = score(row)
+    y_pred = res.pred[0]
 
-    scaler = joblib.load("Enora_scaler.joblib")
-    rf = joblib.load("Modele_Enora_rf.joblib")
-
-    # Vérification de la cohérence des colonnes
-    if hasattr(scaler, "feature_names_in_"):
-         expected_cols = list(scaler.feature_names_in_)
-         X = X[expected_cols]  # réordonne selon le scaler
-         row = row[expected_cols]
+    st.success(f"👉 Résultat de la prédiction : **{int(y_pred)}**")
 
-    X_scaled = scaler.transform(pd.DataFrame([row]))
-    
-    y_pred = rf.predict(X_scaled)[0]
+    if res.proba is not None:
+        st.caption(f"Confiance (proba max) : {res.confidence[0]:.3f}")
+        st.caption(f"Probas par classe {list(res.classes)} : {res.proba[0].round(3).tolist()}")
+    st.caption(f"Modèle {scorer.version}")
+    if isinstance(scorer, CachedScorer):
+        info = scorer.cache.info()
+        st.caption(f"Cache de prédictions : {info['hits']} hits / {info['misses']} miss, "
+                   f"{info['entries']} entrées")
+        with st.expander("Contributions des variables (SHAP)"):
+            explain_prediction(scorer, row, res)
 
+st.divider()
 
+# Analyse de sensibilité : grille des valeurs observées, scorée en un seul appel
+st.write("**Analyse de sensibilité**")
+st.caption("Toutes les valeurs observées d'une ou deux variables autour de l'observation ci-dessus, "
+           "scorées en un seul appel au modèle.")
+sweep_vars = st.multiselect("Variables à faire varier", [v for v in SWEEP_VARIABLES if v in df.columns],
+                            default=["lum"], max_selections=2, key="sweep_vars")
+if sweep_vars and st.button("Balayer les valeurs observées"):
+    scorer = load_scorer()
+    try:
+        res = sweep(scorer, row, {v: observed_values(df, v) for v in sweep_vars})
+    except (OSError, RuntimeError, ValueError) as e:
+        st.error(f"Analyse impossible : {e}")
+        sidebar_panel()
+        st.stop()
+    res["classe"] = res["classe"].astype(str)
+    if len(sweep_vars) == 1:
+        v = sweep_vars[0]
+        fig = px.line(res, x=v, y="proba", color="classe", markers=True,
+                      labels={"proba": "Probabilité", "classe": "Gravité"},
+                      title=f"Probabilité par classe selon {v}")
+        fig.update_xaxes(type="category")
+    else:
+        v1, v2 = sweep_vars
+        classes = res["classe"].unique().tolist()
+        cubes = [res[res["classe"] == c].pivot(index=v1, columns=v2, values="proba") for c in classes]
+        fig = px.imshow(np.stack([c.to_numpy() for c in cubes]), facet_col=0, zmin=0, zmax=1,
+                        x=[str(x) for x in cubes[0].columns], y=[str(y) for y in cubes[0].index],
+                        labels={"x": v2, "y": v1, "color": "Probabilité"}, aspect="auto",
+                        color_continuous_scale="Reds", title=f"Probabilité par classe selon {v1} et {v2}")
+        for i, c in enumerate(classes):
+            fig.layout.annotations[i].text = f"Gravité {c}"
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"{len(res) // res['classe'].nunique()} combinaisons scorées en un appel — modèle {scorer.version}")
 
-    st.success(f"👉 Résultat de la prédiction : **{int(y_pred)}**")
+st.divider()
 
-    if hasattr(rf, "predict_proba"):
-        proba = rf.predict_proba(X_scaled)[0]
-        st.caption(f"Confiance (proba max) : {rf.predict_proba(X_scaled).max():.3f}")
-        st.caption(f"Probas par classe {list(rf.classes_)} : {proba.round(3).tolist()}")
+# Scoring de tout l'échantillon en un seul appel vectorisé
+st.write("**Prédiction sur tout l'échantillon**")
+if st.button(f"Scorer les {len(df)} lignes de l'échantillon"):
+    scorer, res = score(df)
+    y_true = y.iloc[:len(df), 0].to_numpy()
+
+    distrib = pd.DataFrame({
+        "Prédit": pd.Series(res.pred).value_counts(),
+        "Réel": pd.Series(y_true).value_counts(),
+    }).fillna(0).astype(int).sort_index()
+    c1, c2 = st.columns(2)
+    c1.metric("Accuracy", f"{(res.pred == y_true).mean():.3f}")
+    if res.proba is not None:
+        c2.metric("Confiance moyenne", f"{res.confidence.mean():.3f}")
+    st.bar_chart(distrib)
+    st.dataframe(pd.crosstab(pd.Series(y_true, name="Réel"), pd.Series(res.pred, name="Prédit")),
+                 use_container_width=True)
 #caption("Le modèle utilise un pipeline pré-entraîné sur les données 2005–2018.")
+
+sidebar_panel()
@@ -0,0 +1,5 @@
+"""Le paquet ``accidents`` vit dans ``app/`` (lancé par ``streamlit run app/app.py``)."""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
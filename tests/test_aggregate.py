@@ -0,0 +1,84 @@
+"""Agrégation en une passe de ``accidents.aggregate`` contre la chaîne groupby + merge."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from accidents.aggregate import BENCH_SPEC, OPERATIONS, _flags_frame, aggregate, bench, chain_reference
+
+
+def _usagers(n_acc=800, seed=0):
+    """Usagers de ``n_acc`` accidents, dans un ordre quelconque, manquants compris."""
+    rng = np.random.default_rng(seed)
+    num_acc = rng.permutation(np.repeat(201800000001 + np.arange(n_acc), rng.integers(1, 5, size=n_acc)))
+    n = len(num_acc)
+
+    def codes(values, dtype="Int8"):
+        s = pd.Series(rng.choice(values, size=n)).astype(dtype)
+        return s.mask(rng.random(n) < 0.03) if dtype[0] == "I" else s   # types du schéma usagers
+
+    return pd.DataFrame({
+        "Num_Acc": num_acc,
+        "num_veh": pd.Series(rng.choice(["A01", "B01", "C01"], size=n)).mask(rng.random(n) < 0.03).astype("category"),
+        "place": codes(np.arange(0, 10)),
+        "catu": codes([1, 2, 3], "int8"),
+        "grav": codes([1, 2, 3, 4], "int8"),
+        "sexe": codes([1, 2], "int8"),
+        "secu": codes([11, 12, 21, 22, 31, 93]),
+        "trajet": codes(np.arange(0, 10)),
+        "an_nais": codes(np.r_[1850, 1930:2015], "Int16"),
+        "annee": np.int16(2018),
+    })
+
+
+@pytest.mark.parametrize("trie", [False, True], ids=["desordre", "trie"])
+def test_chaine_des_notebooks(trie):
+    work = _flags_frame(_usagers())
+    if trie:   # partitions du store : déjà triées par Num_Acc, sans tri interne
+        work = work.sort_values("Num_Acc", kind="stable", ignore_index=True)
+    ref = chain_reference(work)
+    new = aggregate(work, "Num_Acc", BENCH_SPEC)
+    cols = list(ref.columns)
+    pd.testing.assert_frame_equal(new[cols].astype("float64"), ref[cols].astype("float64"))
+    assert bench(work, repeat=1)["identique"]
+
+
+@pytest.mark.parametrize("how", OPERATIONS)
+def test_operations(how):
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({"k": rng.integers(0, 50, size=1000),
+                       "v": pd.Series(rng.integers(0, 6, size=1000)).astype("Int16").mask(rng.random(1000) < 0.1)})
+    got = aggregate(df, "k", {"r": ("v", how)})
+    g = df.groupby("k")["v"]
+    expected = {
+        "sum": g.sum(), "max": g.max(), "min": g.min(), "any": g.apply(lambda s: bool(s.fillna(0).any())),
+        "first": df.groupby("k", sort=True).head(1).set_index("k")["v"].sort_index(),
+        "count": g.size(), "nunique": g.nunique(),
+    }[how]
+    assert got["k"].tolist() == expected.index.tolist()
+    a = pd.Series(got["r"]).astype("float64").tolist()
+    b = expected.astype("float64").tolist()
+    assert np.allclose(a, b, equal_nan=True)
+
+
+def test_echelle_de_gravite_du_pipeline():
+    from accidents.pipeline import aggregate_usagers
+
+    usagers = _usagers()
+    work = _flags_frame(usagers)
+    bench_max = aggregate(work, "Num_Acc", BENCH_SPEC)["grav_order_max"]
+    pipeline_max = aggregate_usagers(usagers, 2018)["grav_order_max"]
+    assert bench_max.tolist() == pipeline_max.tolist()
+
+
+def test_table_vide():
+    empty = pd.DataFrame({"k": np.empty(0, dtype=np.int64), "v": np.empty(0)})
+    assert len(aggregate(empty, "k", {"r": ("v", "sum")})) == 0
+
+
+def test_colonne_absente():
+    df = pd.DataFrame({"k": [1, 1, 2], "v": [1, 2, 3]})
+    assert aggregate(df, "k", {"n": ("*", "count")})["n"].tolist() == [2, 1]
+    for how in OPERATIONS:
+        if how != "count":
+            with pytest.raises(KeyError, match="vv"):
+                aggregate(df, "k", {"r": ("vv", how)})
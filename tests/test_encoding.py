@@ -0,0 +1,45 @@
+"""Réencodages vectorisés de ``accidents.encoding`` contre les fonctions des notebooks."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from accidents.encoding import CASES, EDGE_VALUES, _same, check_and_bench
+
+
+def _usagers(n=5000, seed=0):
+    """Codes usager tirés au hasard, manquants compris, dans les types nullables du schéma."""
+    rng = np.random.default_rng(seed)
+
+    def codes(values, dtype):
+        s = pd.Series(rng.choice(values, size=n)).astype(dtype)
+        return s.mask(rng.random(n) < 0.05)
+
+    return pd.DataFrame({
+        "secu": codes([0, 1, 2, 3, 11, 12, 13, 21, 22, 31, 42, 93, 99], "Int16"),
+        "place": codes(np.arange(-1, 11), "Int8"),
+        "trajet": codes(np.arange(-1, 11), "Int8"),
+        "an_nais": codes(np.r_[1801:1899:7, 1900:2019], "Int16"),
+        "annee": rng.choice(np.arange(2005, 2019), size=n).astype("int16"),
+    })
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_valeurs_limites(name):
+    _, ref, vec = CASES[name]
+    edge = pd.Series(EDGE_VALUES, dtype="float64")
+    assert _same(edge.apply(ref), vec(edge))
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_codes_usager(name):
+    col, ref, vec = CASES[name]
+    usagers = _usagers()
+    if col == "age":
+        usagers["age"] = usagers["annee"] - usagers["an_nais"].astype("float64")
+    s = usagers[col]
+    assert _same(s.astype("float64").apply(ref), vec(s))
+
+
+def test_rapport_identique():
+    report = check_and_bench(_usagers(500), repeat=1)
+    assert report["identique"].all(), report.to_string()
@@ -0,0 +1,12 @@
+"""Couche partagée ``accidents.shared`` : la mémoire du serveur reste plate quand les sessions augmentent."""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from accidents.shared import MAX_MB_PER_SESSION, simulate, slope
+
+
+def test_memoire_plate():
+    # Processus neuf, comme la ligne de commande : le RSS ne dépend que de la simulation
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        rows = pool.submit(simulate, "shared", [1, 10]).result()
+    assert slope(rows) < MAX_MB_PER_SESSION, rows